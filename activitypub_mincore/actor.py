@@ -1,35 +1,226 @@
+import asyncio
+import functools
+import hashlib
+import threading
+from collections.abc import Awaitable, Callable, Iterable
+from pathlib import Path
 from typing import Any
+from urllib.parse import urlparse
 
 import httpx
 import uvicorn
 from fastapi import APIRouter, Request
 from fastapi.exceptions import HTTPException
-from fastapi.responses import JSONResponse
-from jsonschema import Draft202012Validator
+from fastapi.responses import Response
+from jsonschema import ValidationError
 
-from activitypub_mincore.support.validation import MINCORE_REGISTRY, schema_retriever
+from activitypub_mincore.support.cache import DocumentCache
+from activitypub_mincore.support.client import get_client
+from activitypub_mincore.support.metrics import Histogram
+from activitypub_mincore.support.outbox import AS_CONTEXT
+from activitypub_mincore.support.serialization import ACTIVITY_CONTENT_TYPE, dumps
+from activitypub_mincore.support.signatures import (
+    PublicKey,
+    PublicKeyCache,
+    SignatureError,
+    Signer,
+    generate_private_key,
+    load_or_create_private_key,
+    public_key_pem,
+)
+from activitypub_mincore.support.validation import VALIDATORS
 
 router = APIRouter()
 
+# Local actors, indexed by the paths of their documents and of their inboxes
+_actors: dict[str, dict[str, Any]] = {}
+_inboxes: dict[str, dict[str, Any]] = {}
+
+# Serialized actor documents and their ETags, by path
+_documents: dict[str, tuple[bytes, str]] = {}
+
+# Local actors by the paths of their outboxes, served by `outbox_handler`
+_outboxes: dict[str, dict[str, Any]] = {}
+outbox_handler: Callable[[Request, dict[str, Any]], Awaitable[Response]] | None = None
+
+# Local actors by the paths of their followers collections, whose sizes are
+# given by `followers_count`. The members aren't listed.
+_followers: dict[str, dict[str, Any]] = {}
+followers_count: Callable[[dict[str, Any]], int] | None = None
+
+# Seconds other servers may cache our actor documents
+ACTOR_MAX_AGE = 300
+
+# The instance actor (the first one added), which sends the instance's Follows
 _actor: dict = {}
 
+# Whether local actors sign their requests (see configure_signing), with
+# keys kept in _key_dir (generated for each run, without one). Keys are
+# loaded or generated when first needed, for a signature or a document.
+_signing = False
+_key_dir: Path | None = None
+_private_keys: dict[str, Any] = {}
+_private_keys_lock = threading.Lock()
+_signers: dict[str, Signer] = {}
+
+
+def _etag_matches(etag: str, if_none_match: str) -> bool:
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
 
 @router.get("/{path:path}")
 async def get__actor(request: Request):
-    if str(request.url) == _actor["id"]:
-        return JSONResponse(get_local_actor())
-    raise HTTPException(404, "Not found")
+    path = request.url.path
+    document = _documents.get(path)
+    if document is None:
+        local_actor = _actors.get(path)
+        if local_actor is None:
+            local_actor = _outboxes.get(path)
+            if local_actor is not None and outbox_handler is not None:
+                return await outbox_handler(request, local_actor)
+            local_actor = _followers.get(path)
+            if local_actor is not None:
+                return _followers_collection(local_actor)
+            raise HTTPException(404, "Not found")
+        # Its key may have to be generated first
+        document = await asyncio.to_thread(_serialize_actor, local_actor)
+        if _actors.get(path) is local_actor:
+            _documents[path] = document
+    body, etag = document
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={ACTOR_MAX_AGE}"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=ACTIVITY_CONTENT_TYPE, headers=headers)
 
 
-def initialize_actor(server: uvicorn.Server):
-    global _actor
-    url_prefix = f"http://{server.config.host}:{server.config.port}"
-    _actor = {
-        "id": f"{url_prefix}/actor",
+def _followers_collection(local_actor: dict[str, Any]) -> Response:
+    collection = {
+        "@context": AS_CONTEXT,
+        "id": local_actor["followers"],
+        "type": "OrderedCollection",
+        "totalItems": followers_count(local_actor) if followers_count else 0,
+    }
+    return Response(
+        dumps(collection),
+        media_type=ACTIVITY_CONTENT_TYPE,
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+def create_actor(url_prefix: str, name: str | None = None) -> dict[str, Any]:
+    """The document for the instance actor or, with a name, a hosted actor."""
+    if name is None:
+        actor_uri, collections_prefix = f"{url_prefix}/actor", url_prefix
+    else:
+        actor_uri = collections_prefix = f"{url_prefix}/actors/{name}"
+    return {
+        "id": actor_uri,
         "type": "Service",
-        "inbox": f"{url_prefix}/inbox",
-        "outbox": f"{url_prefix}/outbox",
+        "inbox": f"{collections_prefix}/inbox",
+        "outbox": f"{collections_prefix}/outbox",
+        "followers": f"{collections_prefix}/followers",
     }
+
+
+def configure_signing(enabled: bool = True, key_dir: str | Path | None = None):
+    """Has local actors, including those already added, sign their requests."""
+    global _signing, _key_dir
+    _signing, _key_dir = enabled, Path(key_dir) if key_dir else None
+    _private_keys.clear()
+    _signers.clear()
+    for local_actor in local_actors():
+        add_local_actor(local_actor)
+
+
+def _private_key(actor_id: str) -> Any:
+    """The actor's private key, loaded or generated on first use."""
+    with _private_keys_lock:
+        private_key = _private_keys.get(actor_id)
+        if private_key is None:
+            if _key_dir is None:
+                private_key = generate_private_key()
+            else:
+                name = hashlib.blake2b(actor_id.encode(), digest_size=16).hexdigest()
+                private_key = load_or_create_private_key(_key_dir / f"{name}.pem")
+            _private_keys[actor_id] = private_key
+        return private_key
+
+
+def _serialize_actor(local_actor: dict[str, Any]) -> tuple[bytes, str]:
+    """An actor's document, with its public key when signing, and its ETag."""
+    if _signing:
+        actor_id = local_actor["id"]
+        public_key = {
+            "id": f"{actor_id}#main-key",
+            "owner": actor_id,
+            "publicKeyPem": public_key_pem(_private_key(actor_id)),
+        }
+        local_actor = {**local_actor, "publicKey": public_key}
+    body = dumps(local_actor)
+    return body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def add_local_actor(local_actor: dict[str, Any]) -> dict[str, Any]:
+    """Adds a local actor, or replaces it after its document has changed."""
+    global _actor
+    actor_id = local_actor["id"]
+    if _signing:
+        _signers[actor_id] = Signer(
+            f"{actor_id}#main-key", load_key=functools.partial(_private_key, actor_id)
+        )
+    path = urlparse(actor_id).path
+    # Serialized when first requested
+    _documents.pop(path, None)
+    _actors[path] = local_actor
+    _inboxes[urlparse(local_actor["inbox"]).path] = local_actor
+    _outboxes[urlparse(local_actor["outbox"]).path] = local_actor
+    if "followers" in local_actor:
+        _followers[urlparse(local_actor["followers"]).path] = local_actor
+    if not _actor or _actor["id"] == actor_id:
+        _actor = local_actor
+    return local_actor
+
+
+def clear_local_actors() -> None:
+    global _actor
+    _actors.clear()
+    _inboxes.clear()
+    _documents.clear()
+    _outboxes.clear()
+    _followers.clear()
+    _signers.clear()
+    _actor = {}
+
+
+def local_actors() -> list[dict[str, Any]]:
+    return list(_actors.values())
+
+
+async def signature_headers(
+    local_actor: dict[str, Any], method: str, url: str, body: bytes | None = None
+) -> dict[str, str]:
+    """Headers signing a request from a local actor, if it signs requests."""
+    signer = _signers.get(local_actor["id"])
+    return {} if signer is None else await signer.headers(method, url, body)
+
+
+def get_signer(actor_id: str) -> Signer | None:
+    return _signers.get(actor_id)
+
+
+def find_inbox_owner(path: str) -> dict[str, Any] | None:
+    """The local actor with the inbox at this path."""
+    return _inboxes.get(path)
+
+
+def initialize_actor(server: uvicorn.Server, names: Iterable[str] = ()):
+    url_prefix = f"http://{server.config.host}:{server.config.port}"
+    clear_local_actors()
+    add_local_actor(create_actor(url_prefix))
+    for name in names:
+        add_local_actor(create_actor(url_prefix, name))
     server.config.app.include_router(router)
 
 
@@ -37,23 +228,96 @@ def get_local_actor() -> dict[str, Any]:
     return _actor
 
 
-ACTOR_VALIDATOR = Draft202012Validator(
-    schema_retriever("schema:actor").contents,
-    registry=MINCORE_REGISTRY,
-    format_checker=Draft202012Validator.FORMAT_CHECKER,
+ACTOR_VALIDATOR = VALIDATORS.validator("schema:actor")
+
+ACTOR_FETCH_SECONDS = Histogram(
+    "mincore_actor_fetch_seconds", "Time to fetch a remote actor document"
 )
 
 
-async def get_remote_actor(actor_uri: str):
-    # NOTE No authn/authz
-    async with httpx.AsyncClient() as client:
-        response = await client.get(actor_uri)
+async def _fetch_remote_actor(
+    actor_uri: str, headers: dict[str, str]
+) -> httpx.Response:
+    # NOTE Unsigned, so servers requiring signed fetches will refuse it
+    with ACTOR_FETCH_SECONDS.time():
+        return await get_client().get(actor_uri, headers=headers, follow_redirects=True)
+
+
+def _parse_remote_actor(response: httpx.Response) -> dict[str, Any]:
+    actor = response.json()
+    ACTOR_VALIDATOR.validate(actor)
+    public_keys.add_actor(actor, str(response.request.url))
+    return actor
+
+
+remote_actor_cache = DocumentCache(_fetch_remote_actor, _parse_remote_actor)
+
+# Public keys of remote actors, from their documents as they're fetched
+public_keys = PublicKeyCache()
+
+
+async def _fetch_public_key(key_id: str) -> None:
+    key_uri, _, fragment = key_id.partition("#")
+    if fragment:
+        # Usually a key in the document of the actor at the key id's URL
+        remote_actor_cache.invalidate(key_uri)
+        document = await get_remote_actor(key_uri)
+        owner = document.get("id")
+        if owner == key_uri or public_keys.get(key_id) is not None:
+            return
+    else:
+        # Usually a document for the key alone, naming its owner
+        response = await _fetch_remote_actor(key_uri, {})
         response.raise_for_status()
-        # TODO Validate actor with JSON Schema
-        actor = response.json()
-        ACTOR_VALIDATOR.validate(actor)
-        return actor
+        document = response.json()
+        if not isinstance(document, dict):
+            raise ValueError(f"{key_uri} is not a JSON object")
+        owner = document.get("id" if "publicKey" in document else "owner")
+    if isinstance(owner, str):
+        # The key is only kept if its owner's own document lists it
+        remote_actor_cache.invalidate(owner)
+        await get_remote_actor(owner)
+
+
+async def get_public_key(key_id: str, refresh: bool = False) -> PublicKey:
+    """A remote actor's public key, fetching it when it isn't cached.
+
+    The key is kept from its owner's document, fetched from the owner's id,
+    so its owner is the actor's canonical id. Keys are fetched again at
+    most once per `public_keys.fetch_interval`, whether they're refreshed
+    or couldn't be found.
+    """
+    public_key = public_keys.get(key_id)
+    if public_key is not None and (not refresh or public_keys.is_recent(public_key)):
+        return public_key
+    if public_key is None and public_keys.is_unknown(key_id):
+        raise SignatureError(f"Unknown key {key_id}")
+    public_keys.discard(key_id)
+    try:
+        await _fetch_public_key(key_id)
+    except (httpx.HTTPError, ValueError, ValidationError) as ex:
+        public_keys.add_unknown(key_id)
+        raise SignatureError(f"Can't fetch key {key_id}: {ex!r}") from ex
+    public_key = public_keys.get(key_id)
+    if public_key is None:
+        public_keys.add_unknown(key_id)
+        raise SignatureError(f"No key {key_id}")
+    return public_key
+
+
+async def get_remote_actor(actor_uri: str):
+    return await remote_actor_cache.get(actor_uri)
 
 
 async def get_remote_actor_inbox(actor_uri: str):
     return (await get_remote_actor(actor_uri))["inbox"]
+
+
+def get_shared_inbox(actor: dict[str, Any]) -> str | None:
+    """Returns the actor's sharedInbox endpoint, if it advertises one."""
+    endpoints = actor.get("endpoints")
+    if isinstance(endpoints, dict):
+        shared_inbox = endpoints.get("sharedInbox")
+        if isinstance(shared_inbox, str):
+            return shared_inbox
+    return None
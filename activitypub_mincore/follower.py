@@ -1,75 +1,295 @@
 import asyncio
+import contextlib
 import logging
+import sys
+import time
 import uuid
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
+from dataclasses import dataclass, field
+from typing import Any, TextIO
+from urllib.parse import urlparse
 
 import fastapi
 import httpx
+from jsonschema import ValidationError
 
-from activitypub_mincore.actor import get_local_actor, get_remote_actor_inbox
+from activitypub_mincore.actor import (
+    find_inbox_owner,
+    get_local_actor,
+    get_public_key,
+    get_remote_actor_inbox,
+    signature_headers,
+)
+from activitypub_mincore.support.admission import Admission, AdmissionMiddleware
+from activitypub_mincore.support.client import get_client
+from activitypub_mincore.support.ingest import (
+    InboxPipeline,
+    SeenActivities,
+    accept_once,
+    inbox_request,
+    read_activity,
+)
+from activitypub_mincore.support.metrics import SampledLogger
+from activitypub_mincore.support.metrics import router as metrics_router
+from activitypub_mincore.support.ratelimit import RateLimiter
+from activitypub_mincore.support.retry import RetryPolicy
+from activitypub_mincore.support.serialization import ACTIVITY_HEADERS, dumps
+from activitypub_mincore.support.signatures import (
+    SignatureMiddleware,
+    SignatureVerifier,
+    check_signer,
+)
+from activitypub_mincore.support.sink import ActivitySink
 from activitypub_mincore.support.validation import (
     MINCORE_ACTIVITY_TYPES,
-    create_activity_validator,
+    VALIDATORS,
     validate_activity,
 )
 
 logger = logging.getLogger("follower")
+received_log = SampledLogger(logger)
+follow_failure_log = SampledLogger(logger)
 
 app = fastapi.FastAPI()
+app.include_router(metrics_router)
+
+# Signatures are checked when present, and required when the cli says so
+signature_verifier = SignatureVerifier(get_public_key)
+app.add_middleware(
+    SignatureMiddleware, verifier=signature_verifier, inbox_owner=find_inbox_owner
+)
+
+# Reconfigured with the cli's limits. Added last, so it's applied first
+admission = Admission()
+app.add_middleware(AdmissionMiddleware, admission=admission)
 
-EXT_ACTIVITY_VALIDATOR = create_activity_validator(
-    types=MINCORE_ACTIVITY_TYPES + ["Create"]
+EXT_ACTIVITY_VALIDATOR = VALIDATORS.activity_validator(
+    MINCORE_ACTIVITY_TYPES + ["Create"]
 )
 
+# Received activities are only logged and stored, so any type is accepted
+INBOX_ACTIVITY_VALIDATOR = VALIDATORS.activity_validator(any_type=True)
+
+
+# Keeps received activities, when set (see cli)
+sink: ActivitySink | None = None
+
+
+async def handle_inbox_activity(activity: dict[str, Any]) -> None:
+    received_log.info(
+        "Received %s activity from %s", activity.get("type"), activity.get("actor")
+    )
+    logger.debug("Received activity: %s", activity)
+    if sink is not None:
+        await sink.write(activity)
+
+
+inbox_pipeline = InboxPipeline(handle_inbox_activity)
+seen_activities = SeenActivities()
+inbox_pipeline.install(app)
+
+
+async def _start_sink():
+    if sink is not None:
+        await sink.start()
+
+
+async def _stop_sink():
+    # After the inbox pipeline, so nothing is written once it's stopped
+    if sink is not None:
+        await sink.stop()
+
+
+app.add_event_handler("startup", _start_sink)
+app.add_event_handler("shutdown", _stop_sink)
+
 
 @app.post("/{path:path}")
 async def post__inbox(request: fastapi.Request):
-    instance_actor = get_local_actor()
-    if str(request.url) != instance_actor["inbox"]:
+    local_actor = find_inbox_owner(request.url.path)
+    if local_actor is None:
         raise fastapi.HTTPException(403, "Forbidden")
-    try:
-        activity = await request.json()
-        logger.info(f"Received activity: {activity}")
-    except httpx.HTTPError as httpEx:
-        raise httpEx
-    except Exception as ex:  # noqa
-        logger.exception(ex)
-        raise fastapi.HTTPException(500, "Internal Server Error")
-
-
-async def follow(uri_to_follow: str, *, ntries: int = 1):
-    while ntries:
-        logger.info(f"Requesting to Follow {uri_to_follow}")
+    with inbox_request():
         try:
-            remote_inbox = await get_remote_actor_inbox(uri_to_follow)
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    remote_inbox,
-                    # "Pre-flight" validation
-                    json=validate_activity(
-                        {
-                            # Must have an id for the response
-                            "id": f"{get_local_actor()['id']}/{uuid.uuid4()}",
-                            "type": "Follow",
-                            "actor": get_local_actor()["id"],
-                            "object": uri_to_follow,
-                        },
-                        EXT_ACTIVITY_VALIDATOR,
-                    ),
-                )
-                response.raise_for_status()
-        except httpx.ConnectError:
-            logging.warning("Connection failed, retrying...")
-            ntries -= 1
-            if ntries > 0:
-                await asyncio.sleep(2)
-                continue
-        except Exception as ex:
+            activity = await read_activity(request)
+            check_signer(request, activity)
+            validate_activity(activity, INBOX_ACTIVITY_VALIDATOR)
+            admission.admit_sender(activity)
+            # Redeliveries are acknowledged without doing anything
+            if accept_once(seen_activities, activity, local_actor["id"]):
+                try:
+                    inbox_pipeline.submit(activity)
+                except fastapi.HTTPException:
+                    seen_activities.discard(activity.get("id"), local_actor["id"])
+                    raise
+            return fastapi.Response(status_code=202)
+        except ValidationError as ex:
+            raise fastapi.HTTPException(400, f"Bad request: {ex.message}") from ex
+        except fastapi.HTTPException:
+            raise
+        except Exception as ex:  # noqa
             logger.exception(ex)
-        break
+            raise fastapi.HTTPException(500, "Internal Server Error") from ex
+
+
+async def send_follow_request(uri_to_follow: str) -> None:
+    remote_inbox = await get_remote_actor_inbox(uri_to_follow)
+    # "Pre-flight" validation
+    body = dumps(
+        validate_activity(
+            {
+                # Must have an id for the response
+                "id": f"{get_local_actor()['id']}/{uuid.uuid4()}",
+                "type": "Follow",
+                "actor": get_local_actor()["id"],
+                "object": uri_to_follow,
+            },
+            EXT_ACTIVITY_VALIDATOR,
+        )
+    )
+    signature = await signature_headers(get_local_actor(), "POST", remote_inbox, body)
+    response = await get_client().post(
+        remote_inbox, content=body, headers={**ACTIVITY_HEADERS, **signature}
+    )
+    response.raise_for_status()
+
+
+def is_transient(ex: Exception) -> bool:
+    """Whether a failed Follow is worth retrying."""
+    if isinstance(ex, httpx.HTTPStatusError):
+        return ex.response.status_code >= 500 or ex.response.status_code == 429
+    return isinstance(ex, httpx.TransportError)
+
+
+@dataclass
+class FollowProgress:
+    submitted: int = 0
+    followed: int = 0
+    failed: int = 0
+    retries: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def pending(self) -> int:
+        return self.submitted - self.followed - self.failed
+
+    @property
+    def throughput(self) -> float:
+        """Completed follows per second"""
+        elapsed = time.monotonic() - self.started
+        return (self.followed + self.failed) / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"followed={self.followed} failed={self.failed} pending={self.pending}"
+            f" retries={self.retries} throughput={self.throughput:.1f}/s"
+        )
+
+
+class FollowScheduler:
+    """Sends Follow requests with bounded concurrency and per-host rate limits.
+
+    Transient failures are retried with exponential backoff and jitter.
+    URIs may come from an async stream, which is read only as fast as
+    follows are sent.
+    """
+
+    def __init__(
+        self,
+        *,
+        concurrency: int = 16,
+        per_host_rate: float = 2.0,
+        per_host_burst: float = 4.0,
+        retry: RetryPolicy | None = None,
+        progress_interval: float = 10.0,
+    ):
+        self.concurrency = concurrency
+        self.host_limits = RateLimiter(per_host_rate, per_host_burst)
+        self.retry = retry or RetryPolicy(base=2.0, cap=300.0, max_attempts=20)
+        self.progress_interval = progress_interval
+        self.progress = FollowProgress()
+
+    async def run(self, uris: AsyncIterable[str] | Iterable[str]) -> FollowProgress:
+        self.progress = progress = FollowProgress()
+        queue: asyncio.Queue[tuple[str, int]] = asyncio.Queue(self.concurrency * 2)
+        retries: set[asyncio.Task] = set()
+
+        async def retry_later(uri: str, attempt: int):
+            await asyncio.sleep(self.retry.delay(attempt))
+            await queue.put((uri, attempt + 1))
+
+        async def worker():
+            while True:
+                uri, attempt = await queue.get()
+                try:
+                    await self.host_limits.acquire(urlparse(uri).netloc)
+                    logger.debug("Requesting to Follow %s", uri)
+                    await send_follow_request(uri)
+                    progress.followed += 1
+                except Exception as ex:  # noqa: BLE001
+                    # Any failure counts against the follow, never the worker
+                    if is_transient(ex) and not self.retry.exhausted(attempt):
+                        progress.retries += 1
+                        task = asyncio.create_task(retry_later(uri, attempt))
+                        retries.add(task)
+                        task.add_done_callback(retries.discard)
+                    else:
+                        follow_failure_log.error("Follow of %s failed: %r", uri, ex)
+                        progress.failed += 1
+                finally:
+                    queue.task_done()
+
+        async def report():
+            while True:
+                await asyncio.sleep(self.progress_interval)
+                logger.info("Follow progress: %s", progress)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        tasks.append(asyncio.create_task(report()))
+        try:
+            if isinstance(uris, AsyncIterable):
+                async for uri in uris:
+                    progress.submitted += 1
+                    await queue.put((uri, 1))
+            else:
+                for uri in uris:
+                    progress.submitted += 1
+                    await queue.put((uri, 1))
+            while progress.pending:
+                await queue.join()
+                if retries:
+                    await asyncio.wait(set(retries))
+        finally:
+            for task in tasks + list(retries):
+                task.cancel()
+        logger.info("Follows complete: %s", progress)
+        return progress
+
+
+async def read_follow_list(path: str, chunk_size: int = 65536) -> AsyncIterator[str]:
+    """Streams actor URIs from a file ("-" for stdin), one per line.
+
+    Blank lines and lines starting with "#" are skipped.
+    """
+    opened: contextlib.AbstractContextManager[TextIO]
+    if path == "-":
+        opened = contextlib.nullcontext(sys.stdin)
+    else:
+        # Opened off the event loop, like the reads
+        opened = await asyncio.to_thread(open, path)
+    with opened as fp:
+        while lines := await asyncio.to_thread(fp.readlines, chunk_size):
+            for line in lines:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield line
 
 
-async def send_follow(uri_to_follow: str, delay: int = 2):
-    logger.info(f"Waiting to send follow for {uri_to_follow}")
+async def follow_all(
+    uris: AsyncIterable[str] | Iterable[str],
+    scheduler: FollowScheduler | None = None,
+    delay: float = 2,
+):
+    # Give the local server a chance to start
     await asyncio.sleep(delay)
-    logger.info(f"Sent Follow request for {uri_to_follow}")
-    await follow(uri_to_follow, ntries=10000)
+    await (scheduler or FollowScheduler()).run(uris)
@@ -1,35 +1,123 @@
-import asyncio
 import logging
 from datetime import datetime
 from typing import Any
 
 import fastapi
-import httpx
-from bidict import bidict
+from jsonschema import ValidationError
 
-from activitypub_mincore.actor import get_local_actor, get_remote_actor_inbox
+from activitypub_mincore import actor
+from activitypub_mincore.actor import (
+    find_inbox_owner,
+    get_local_actor,
+    get_public_key,
+    get_remote_actor,
+    get_shared_inbox,
+    local_actors,
+    signature_headers,
+)
+from activitypub_mincore.support.admission import Admission, AdmissionMiddleware
+from activitypub_mincore.support.client import get_client
+from activitypub_mincore.support.delivery import DeliveryConfig, DeliveryStats
+from activitypub_mincore.support.ingest import (
+    InboxPipeline,
+    SeenActivities,
+    accept_once,
+    inbox_request,
+    read_activity,
+)
+from activitypub_mincore.support.metrics import Gauge, SampledLogger
+from activitypub_mincore.support.metrics import router as metrics_router
+from activitypub_mincore.support.outbound import DeliveryQueue
+from activitypub_mincore.support.outbox import Outbox, get__outbox
+from activitypub_mincore.support.schedule import PublishScheduler
+from activitypub_mincore.support.serialization import ACTIVITY_HEADERS, dumps
+from activitypub_mincore.support.signatures import (
+    SignatureMiddleware,
+    SignatureVerifier,
+    check_signer,
+)
+from activitypub_mincore.support.store import FollowerStore, MemoryFollowerStore
 from activitypub_mincore.support.validation import (
     MINCORE_ACTIVITY_TYPES,
-    create_activity_validator,
+    VALIDATORS,
     validate_activity,
 )
 
 logger = logging.getLogger("publisher")
+# Sampled separately, so a burst of one outcome doesn't hide the other
+accept_log = SampledLogger(logger)
+reject_log = SampledLogger(logger)
+removal_log = SampledLogger(logger)
 
 app = fastapi.FastAPI()
+app.include_router(metrics_router)
+
+# Signatures are checked when present, and required when the cli says so
+signature_verifier = SignatureVerifier(get_public_key)
+app.add_middleware(
+    SignatureMiddleware, verifier=signature_verifier, inbox_owner=find_inbox_owner
+)
+
+# Reconfigured with the cli's limits. Added last, so it's applied first
+admission = Admission()
+app.add_middleware(AdmissionMiddleware, admission=admission)
+
+# Replaced with a persistent store to keep followers across restarts (see cli)
+follower_store: FollowerStore = MemoryFollowerStore()
+
+delivery_config = DeliveryConfig()
+
+# Replaced with a file-backed queue for durable delivery (see cli)
+delivery_queue = DeliveryQueue()
+
+# Recently published activities, served as the actors' outboxes. Replaced
+# with a file-backed outbox to share it between workers (see cli)
+outbox = Outbox()
 
-_followers = bidict()
+# Figures from the most recent publication cycle
+last_delivery_stats: DeliveryStats | None = None
 
-EXT_ACTIVITY_VALIDATOR = create_activity_validator(
-    types=MINCORE_ACTIVITY_TYPES + ["Create"]
+EXT_ACTIVITY_VALIDATOR = VALIDATORS.activity_validator(
+    MINCORE_ACTIVITY_TYPES + ["Create"]
 )
 
+INBOX_ACTIVITY_VALIDATOR = VALIDATORS.activity_validator(["Follow", "Undo"])
+
+
+def followers_of(local_actor: dict[str, Any]) -> FollowerStore:
+    """A local actor's followers. The instance actor's are `follower_store`."""
+    if local_actor["id"] == get_local_actor().get("id"):
+        return follower_store
+    return follower_store.for_owner(local_actor["id"])
+
+
+FOLLOWERS = Gauge("mincore_followers", "Followers of the local actors")
+DELIVERY_QUEUE_PENDING = Gauge(
+    "mincore_delivery_queue_pending", "Deliveries waiting in the outbound queue"
+)
+
+
+def _register_gauges():
+    # Read the module globals when collected, since the cli may replace them
+    FOLLOWERS.set_function(lambda: sum(len(followers_of(a)) for a in local_actors()))
+    DELIVERY_QUEUE_PENDING.set_function(lambda: delivery_queue.pending_count())
+
+
+app.add_event_handler("startup", _register_gauges)
+
+
+async def _serve_outbox(request: fastapi.Request, local_actor: dict[str, Any]):
+    return await get__outbox(outbox, request, local_actor)
+
+
+actor.outbox_handler = _serve_outbox
+actor.followers_count = lambda local_actor: len(followers_of(local_actor))
+
 
 async def handle_follow(local_actor: dict[str, Any], activity: dict[str, Any]) -> None:
     async def send_follow_response(type_: str):
-        response = await client.post(
-            follower_inbox,
-            json=validate_activity(
+        body = dumps(
+            validate_activity(
                 {
                     # transient, so no id
                     "type": type_,
@@ -37,99 +125,161 @@ async def handle_follow(local_actor: dict[str, Any], activity: dict[str, Any]) -
                     "object": activity.get("id"),
                 },
                 EXT_ACTIVITY_VALIDATOR,
-            ),
+            )
+        )
+        signature = await signature_headers(local_actor, "POST", follower_inbox, body)
+        response = await get_client().post(
+            follower_inbox, content=body, headers={**ACTIVITY_HEADERS, **signature}
         )
         response.raise_for_status()
 
     follower_uri = activity.get("actor")
     if isinstance(follower_uri, str):
-        async with httpx.AsyncClient() as client:
-            follower_inbox = await get_remote_actor_inbox(follower_uri)
-            if follower_inbox in _followers:
-                await send_follow_response("Reject")
-                logger.info(f"Rejected: already following {follower_uri}")
-            else:
-                await send_follow_response("Accept")
-                logger.info(f"Accepted Follow from {follower_uri}")
-            _followers[follower_inbox] = activity.get("id")
+        followers = followers_of(local_actor)
+        follower = await get_remote_actor(follower_uri)
+        follower_inbox = follower["inbox"]
+        already_following = follower_inbox in followers
+        if already_following:
+            await send_follow_response("Reject")
+            reject_log.info("Rejected: already following %s", follower_uri)
+        else:
+            await send_follow_response("Accept")
+            accept_log.info("Accepted Follow from %s", follower_uri)
+        followers.add(follower_inbox, activity.get("id"), get_shared_inbox(follower))
+        if not already_following:
+            # New followers get a note without waiting for the next tick
+            request_publish()
     else:
-        logger.warn(f"Follower URI must be a string: {follower_uri}")
+        logger.warning("Follower URI must be a string: %s", follower_uri)
+
+
+def release_target(target: str) -> None:
+    """Drops the queued deliveries to a target no follower is reached through.
 
+    Runs right after the follower's removal, with nothing awaited in between,
+    so no publication cycle can queue another delivery to the target, and a
+    stale delivery can't dead-letter the inbox after it follows again.
+    """
+    if not any(followers_of(a).covered_inboxes(target) for a in local_actors()):
+        delivery_queue.cancel(target)
 
-def handle_undo_follow(activity: dict[str, Any]) -> None:
+
+def handle_undo_follow(local_actor: dict[str, Any], activity: dict[str, Any]) -> None:
     follow_activity_uri = activity.get("object")
     if isinstance(follow_activity_uri, str):
-        follower_inbox = _followers.inverse.get(follow_activity_uri)
-        if follower_inbox:
-            del _followers[follower_inbox]
-            logger.info(f"Follower inbox removed: {follower_inbox}")
+        removed = followers_of(local_actor).pop_by_follow(follow_activity_uri)
+        if removed:
+            follower_inbox, target = removed
+            release_target(target)
+            logger.info("Follower inbox removed: %s", follower_inbox)
         else:
-            logger.warn(f"Uknown follow activity: {follow_activity_uri}")
+            logger.warning("Uknown follow activity: %s", follow_activity_uri)
     else:
-        logger.warn(f"Follow activity must be a string (URI): {activity}")
+        logger.warning("Follow activity must be a string (URI): %s", activity)
+
+
+async def handle_inbox_activity(
+    activity: dict[str, Any], local_actor: dict[str, Any]
+) -> None:
+    match activity.get("type"):
+        case "Follow":
+            await handle_follow(local_actor, activity)
+        case "Undo":
+            handle_undo_follow(local_actor, activity)
+
+
+inbox_pipeline = InboxPipeline(handle_inbox_activity)
+seen_activities = SeenActivities()
+inbox_pipeline.install(app)
 
 
 @app.post("/{path:path}")
 async def post__inbox(request: fastapi.Request):
-    instance_actor = get_local_actor()
-    if str(request.url) != instance_actor["inbox"]:
+    local_actor = find_inbox_owner(request.url.path)
+    if local_actor is None:
         raise fastapi.HTTPException(403, "Forbidden")
-    try:
-        activity = await request.json()
-        match activity.get("type"):
-            case "Follow":
-                await handle_follow(instance_actor, activity)
-            case "Undo":
-                handle_undo_follow(activity)
-            case _:
-                raise fastapi.HTTPException(400, "Bad request")
-    except httpx.HTTPError as httpEx:
-        raise httpEx
-    except Exception as ex:  # noqa
-        logger.exception(ex)
-        raise fastapi.HTTPException(500, "Internal Server Error")
+    with inbox_request():
+        try:
+            activity = await read_activity(request)
+            check_signer(request, activity)
+            validate_activity(activity, INBOX_ACTIVITY_VALIDATOR)
+            admission.admit_sender(activity)
+            # Redeliveries are acknowledged without doing anything
+            if accept_once(seen_activities, activity, local_actor["id"]):
+                try:
+                    # Side effects (remote actor fetch, Accept/Reject) happen
+                    # off the request
+                    inbox_pipeline.submit(activity, local_actor)
+                except fastapi.HTTPException:
+                    seen_activities.discard(activity.get("id"), local_actor["id"])
+                    raise
+            return fastapi.Response(status_code=202)
+        except ValidationError as ex:
+            raise fastapi.HTTPException(400, f"Bad request: {ex.message}") from ex
+        except fastapi.HTTPException:
+            raise
+        except Exception as ex:  # noqa
+            logger.exception(ex)
+            raise fastapi.HTTPException(500, "Internal Server Error") from ex
 
 
 async def publish_once():
-    if _followers:
-        inboxes = list(_followers)  # copy, to allow mutation
-        logger.info(f"publishing to {inboxes}")
+    global last_delivery_stats
+    publishers, recipients = 0, 0
+    for local_actor in local_actors():
+        followers = followers_of(local_actor)
+        if not followers:
+            continue
         activity = validate_activity(
             {
                 # transient objects, no ids
                 "type": "Create",
-                "actor": get_local_actor()["id"],
+                "actor": local_actor["id"],
                 "object": {
                     "type": "Note",
                     "content": f"The time is {datetime.now().isoformat()}",
-                    "to": inboxes,
+                    "to": local_actor["followers"],
                 },
             },
             EXT_ACTIVITY_VALIDATOR,
         )
-        for inbox_uri in inboxes:
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(inbox_uri, json=activity)
-                    response.raise_for_status()
-            except Exception as ex:
-                # Remove follower if there is an error
-                if not isinstance(ex, httpx.ConnectError):
-                    logger.exception(ex)
-                else:
-                    logger.error(ex)
-                logger.warning(f"Removing {inbox_uri} from followers")
-                _followers.pop(inbox_uri)
+        body = dumps(activity)
+        outbox.append(local_actor["id"], body)
+        # Followers with a shared inbox get one delivery per shared inbox
+        delivery_queue.enqueue(body, followers.delivery_targets())
+        publishers += 1
+        recipients += len(followers)
+    if publishers:
+        logger.info("publishing to %d followers of %d actors", recipients, publishers)
+    if delivery_queue.pending_count():
+        result = await delivery_queue.drain(
+            get_client(), delivery_config, signer_for=actor.get_signer
+        )
+        if result.dead:
+            # Remove followers once deliveries to them are dead-lettered
+            for local_actor in local_actors():
+                followers = followers_of(local_actor)
+                for target_uri in result.dead:
+                    for inbox_uri in followers.covered_inboxes(target_uri):
+                        removal_log.warning("Removing %s from followers", inbox_uri)
+                        followers.remove(inbox_uri)
+            for target_uri in result.dead:
+                release_target(target_uri)
+        last_delivery_stats = result.stats
+        # The stats are only formatted if the line is logged
+        logger.info("delivery cycle: %s", result.stats)
+
+
+publish_scheduler = PublishScheduler(publish_once, interval=5.0)
+
+
+def request_publish() -> None:
+    """Starts a publication cycle without waiting for the next tick."""
+    publish_scheduler.trigger()
 
 
 async def publish():
     try:
-        while True:
-            await publish_once()
-            await asyncio.sleep(5)
-    except OSError as ex:
-        logging.warning(ex)
-    except Exception as ex:
-        logging.exception(ex)
+        await publish_scheduler.run()
     finally:
         logger.warning("publish task exiting")
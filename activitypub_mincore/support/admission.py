@@ -0,0 +1,99 @@
+"""Admission control for inbox POSTs.
+
+Requests are limited per client address before their body is read, and
+per remote actor once the activity is decoded. Requests beyond a global
+limit on in-flight inbox requests are shed with 503, so an overloaded
+instance doesn't amplify its load with actor fetches and responses.
+"""
+
+from dataclasses import dataclass
+from typing import Any
+
+import fastapi
+from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from activitypub_mincore.support.metrics import Counter, Gauge
+from activitypub_mincore.support.ratelimit import RateLimiter
+
+REJECTED = Counter(
+    "mincore_inbox_rejected_total",
+    "Inbox POSTs refused by admission control",
+    ("reason",),
+)
+IN_FLIGHT = Gauge("mincore_inbox_in_flight", "Inbox POSTs being handled")
+
+
+@dataclass
+class AdmissionConfig:
+    # Inbox POSTs per second, and burst, from any one client address
+    host_rate: float = 100.0
+    host_burst: float = 200.0
+    # Inbox POSTs per second, and burst, from any one remote actor
+    actor_rate: float = 10.0
+    actor_burst: float = 20.0
+    # Inbox POSTs handled at once, beyond which they're refused
+    max_in_flight: int = 512
+    # Clients and actors tracked by each limiter (least recent are dropped)
+    max_senders: int = 10_000
+    # Seconds a refused sender is asked to wait
+    retry_after: int = 5
+
+
+class Admission:
+    def __init__(self, config: AdmissionConfig | None = None):
+        self.in_flight = 0
+        self.configure(config or AdmissionConfig())
+
+    def configure(self, config: AdmissionConfig) -> None:
+        self.config = config
+        self.host_limits = RateLimiter(
+            config.host_rate, config.host_burst, config.max_senders
+        )
+        self.actor_limits = RateLimiter(
+            config.actor_rate, config.actor_burst, config.max_senders
+        )
+
+    @property
+    def retry_headers(self) -> dict[str, str]:
+        return {"Retry-After": str(self.config.retry_after)}
+
+    def admit_sender(self, activity: dict[str, Any]) -> None:
+        """Applies the per-actor limit, raising 429 when it's exceeded."""
+        sender = activity.get("actor")
+        if isinstance(sender, str) and not self.actor_limits.try_acquire(sender):
+            REJECTED.inc(reason="actor")
+            raise fastapi.HTTPException(
+                429, "Too Many Requests", headers=self.retry_headers
+            )
+
+
+class AdmissionMiddleware:
+    """Applies the client and in-flight limits to POSTs."""
+
+    def __init__(self, app: ASGIApp, admission: Admission):
+        self.app = app
+        self.admission = admission
+        IN_FLIGHT.set_function(lambda: admission.in_flight)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        admission = self.admission
+        if admission.in_flight >= admission.config.max_in_flight:
+            REJECTED.inc(reason="overload")
+            response = Response(status_code=503, headers=admission.retry_headers)
+            await response(scope, receive, send)
+            return
+        client = scope.get("client")
+        if not admission.host_limits.try_acquire(client[0] if client else ""):
+            REJECTED.inc(reason="host")
+            response = Response(status_code=429, headers=admission.retry_headers)
+            await response(scope, receive, send)
+            return
+        admission.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.in_flight -= 1
@@ -0,0 +1,408 @@
+"""Benchmarks for the publisher's hot paths, run in process.
+
+The publisher app is driven through an ASGI transport, and its outbound
+requests go to simulated follower servers, so results depend only on this
+code and the machine rather than on the network.
+"""
+
+import asyncio
+import os
+import platform
+import resource
+import sys
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from activitypub_mincore import actor, publisher
+from activitypub_mincore.support import client
+from activitypub_mincore.support.admission import AdmissionConfig
+from activitypub_mincore.support.client import HostLimitedTransport
+from activitypub_mincore.support.ingest import SeenActivities
+from activitypub_mincore.support.outbound import DeliveryQueue
+from activitypub_mincore.support.outbox import Outbox
+from activitypub_mincore.support.serialization import ACTIVITY_HEADERS, dumps
+from activitypub_mincore.support.store import MemoryFollowerStore
+from activitypub_mincore.support.validation import (
+    MINCORE_ACTIVITY_TYPES,
+    VALIDATION_ENGINES,
+    create_activity_validator,
+)
+
+PUBLISHER_URL = "http://publisher.bench"
+
+
+@dataclass
+class BenchConfig:
+    # Simulated followers, spread across `hosts` servers
+    followers: int = 1000
+    hosts: int = 50
+    # Publication cycles delivering to every follower
+    cycles: int = 5
+    # Activities validated by each validation engine
+    validations: int = 5000
+    # Concurrent inbound requests
+    concurrency: int = 64
+    # Fresh interpreters importing the package, for each startup scenario
+    startups: int = 5
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    # Requests, deliveries or validations, depending on the scenario
+    operations: int
+    elapsed: float
+    cpu_time: float
+    # Peak resident set size of the process so far, in MiB
+    peak_rss: float
+    latency_p50: float
+    latency_p99: float
+    latencies: list[float] = field(default_factory=list, repr=False)
+
+    @property
+    def throughput(self) -> float:
+        return self.operations / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        result = asdict(self)
+        del result["latencies"]
+        result["throughput"] = round(self.throughput, 3)
+        return result
+
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def _peak_rss() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+async def measure(
+    name: str, operations: int, run: Callable[[list[float]], Awaitable[None]]
+) -> ScenarioResult:
+    """Times a scenario, which appends its per-operation latencies."""
+    latencies: list[float] = []
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    await run(latencies)
+    elapsed = time.perf_counter() - start
+    return ScenarioResult(
+        name=name,
+        operations=operations,
+        elapsed=round(elapsed, 6),
+        cpu_time=round(time.process_time() - cpu_start, 6),
+        peak_rss=round(_peak_rss(), 1),
+        latency_p50=round(_percentile(latencies, 50), 6),
+        latency_p99=round(_percentile(latencies, 99), 6),
+        latencies=latencies,
+    )
+
+
+class SimulatedFollowers:
+    """An ASGI app standing in for every follower server.
+
+    Serves an actor document for any /users/<name> path on any host, and
+    accepts every POST.
+    """
+
+    def __init__(self):
+        self.received = 0
+
+    @staticmethod
+    def actor_uri(n: int, hosts: int) -> str:
+        return f"http://follower-{n % hosts}.bench/users/{n}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        more_body = True
+        while more_body:
+            message = await receive()
+            more_body = message.get("more_body", False)
+        host = dict(scope["headers"])[b"host"].decode()
+        uri = f"http://{host}{scope['path']}"
+        if scope["method"] == "GET":
+            status, body = 200, dumps(
+                {
+                    "id": uri,
+                    "type": "Person",
+                    "inbox": f"{uri}/inbox",
+                    "outbox": f"{uri}/outbox",
+                }
+            )
+        else:
+            self.received += 1
+            status, body = 202, b""
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", b"application/activity+json")],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+@asynccontextmanager
+async def bench_environment(config: BenchConfig) -> AsyncIterator[SimulatedFollowers]:
+    """Points the publisher at simulated followers, restoring it afterwards."""
+    followers = SimulatedFollowers()
+    saved = (
+        actor.local_actors(),
+        client._client,
+        publisher.follower_store,
+        publisher.delivery_queue,
+        publisher.outbox,
+        publisher.seen_activities,
+    )
+    actor.clear_local_actors()
+    actor.add_local_actor(actor.create_actor(PUBLISHER_URL))
+    client._client = httpx.AsyncClient(
+        transport=HostLimitedTransport(
+            httpx.ASGITransport(followers), client.client_config.per_host
+        )
+    )
+    publisher.follower_store = MemoryFollowerStore()
+    publisher.delivery_queue = DeliveryQueue()
+    publisher.outbox = Outbox()
+    # Activity ids repeat from run to run, and mustn't be taken as redeliveries
+    publisher.seen_activities = SeenActivities()
+    # Measure the limiters' cost without being throttled by them
+    admission_config = publisher.admission.config
+    publisher.admission.configure(
+        AdmissionConfig(host_rate=1e9, host_burst=1e9, actor_rate=1e9, actor_burst=1e9)
+    )
+    actor.remote_actor_cache.clear()
+    await publisher.inbox_pipeline.start()
+    try:
+        yield followers
+    finally:
+        await publisher.inbox_pipeline.stop()
+        publisher.admission.configure(admission_config)
+        await client._client.aclose()
+        (
+            local_actors,
+            client._client,
+            publisher.follower_store,
+            publisher.delivery_queue,
+            publisher.outbox,
+            publisher.seen_activities,
+        ) = saved
+        actor.clear_local_actors()
+        for local_actor in local_actors:
+            actor.add_local_actor(local_actor)
+        actor.remote_actor_cache.clear()
+
+
+async def _post_all(
+    inbound: httpx.AsyncClient,
+    activities: list[dict[str, Any]],
+    concurrency: int,
+    latencies: list[float],
+) -> None:
+    queue = list(reversed(activities))
+
+    async def worker():
+        while queue:
+            body = dumps(queue.pop())
+            while True:
+                start = time.perf_counter()
+                response = await inbound.post(
+                    "/inbox", content=body, headers=ACTIVITY_HEADERS
+                )
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 429:
+                    break
+                # The inbox pipeline is full; back off briefly, as a server would
+                await asyncio.sleep(0.01)
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def bench_inbox(config: BenchConfig) -> list[ScenarioResult]:
+    """Follow and Undo storms, from acceptance to the Accept being sent."""
+    results = []
+    async with bench_environment(config) as followers, httpx.AsyncClient(
+        transport=httpx.ASGITransport(publisher.app),  # type: ignore[arg-type]
+        base_url=PUBLISHER_URL,
+    ) as inbound:
+        uris = [
+            SimulatedFollowers.actor_uri(n, config.hosts)
+            for n in range(config.followers)
+        ]
+        follows = [
+            {
+                "id": f"{uri}/follows/1",
+                "type": "Follow",
+                "actor": uri,
+                "object": actor.get_local_actor()["id"],
+            }
+            for uri in uris
+        ]
+
+        async def follow_storm(latencies: list[float]):
+            await _post_all(inbound, follows, config.concurrency, latencies)
+            await publisher.inbox_pipeline.join()
+
+        results.append(await measure("inbox_follow", len(follows), follow_storm))
+        assert len(publisher.follower_store) == config.followers
+        assert followers.received == config.followers
+
+        undos = [
+            {"type": "Undo", "actor": follow["actor"], "object": follow["id"]}
+            for follow in follows
+        ]
+
+        async def undo_storm(latencies: list[float]):
+            await _post_all(inbound, undos, config.concurrency, latencies)
+            await publisher.inbox_pipeline.join()
+
+        results.append(await measure("inbox_undo", len(undos), undo_storm))
+        assert not publisher.follower_store
+    return results
+
+
+async def bench_fanout(config: BenchConfig) -> ScenarioResult:
+    """Publication cycles delivering a Create to every follower."""
+    async with bench_environment(config) as followers:
+        for n in range(config.followers):
+            uri = SimulatedFollowers.actor_uri(n, config.hosts)
+            publisher.follower_store.add(f"{uri}/inbox", f"{uri}/follows/1")
+
+        async def cycles(latencies: list[float]):
+            for _ in range(config.cycles):
+                start = time.perf_counter()
+                await publisher.publish_once()
+                latencies.append(time.perf_counter() - start)
+
+        result = await measure(
+            "publish_fanout", config.followers * config.cycles, cycles
+        )
+        assert followers.received == config.followers * config.cycles
+    return result
+
+
+async def bench_validation(config: BenchConfig) -> list[ScenarioResult]:
+    activities = [
+        {
+            "type": "Create",
+            "actor": f"{PUBLISHER_URL}/actor",
+            "object": {"type": "Note", "content": f"Note {n}"},
+        }
+        for n in range(config.validations)
+    ]
+    results = []
+    for engine in VALIDATION_ENGINES:
+        validator = create_activity_validator(
+            types=MINCORE_ACTIVITY_TYPES + ["Create"], engine=engine, memoize=False
+        )
+
+        async def validate(latencies: list[float], validator=validator):
+            for activity in activities:
+                start = time.perf_counter()
+                validator.validate(activity)
+                latencies.append(time.perf_counter() - start)
+
+        results.append(await measure(f"validation_{engine}", len(activities), validate))
+    return results
+
+
+# Times importing the cli (everything a command loads) in a new process,
+# then building the validators declared on import, which is deferred to
+# their first use. Prints the wall clock and CPU seconds of each step.
+_STARTUP_SCRIPT = """
+import time
+clock, cpu = time.perf_counter(), time.process_time()
+import activitypub_mincore.support.cli
+from activitypub_mincore.support.validation import VALIDATORS
+imported = time.perf_counter() - clock, time.process_time() - cpu
+clock, cpu = time.perf_counter(), time.process_time()
+VALIDATORS.prepare()
+built = time.perf_counter() - clock, time.process_time() - cpu
+print(*imported, *built)
+"""
+
+
+async def _startup_times(engine: str) -> list[float]:
+    package_root = str(Path(__file__).parent.parent.parent)
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(
+            filter(None, [package_root, os.environ.get("PYTHONPATH")])
+        ),
+        "MINCORE_VALIDATION_ENGINE": engine,
+    }
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-c",
+        _STARTUP_SCRIPT,
+        env=env,
+        stdout=asyncio.subprocess.PIPE,
+    )
+    stdout, _ = await process.communicate()
+    if process.returncode:
+        raise RuntimeError(f"Startup benchmark exited with {process.returncode}")
+    return [float(value) for value in stdout.split()]
+
+
+def _startup_result(name: str, times: list[tuple[float, float]]) -> ScenarioResult:
+    latencies = [clock for clock, _ in times]
+    return ScenarioResult(
+        name=name,
+        operations=len(times),
+        elapsed=round(sum(latencies), 6),
+        cpu_time=round(sum(cpu for _, cpu in times), 6),
+        peak_rss=round(_peak_rss(), 1),
+        latency_p50=round(_percentile(latencies, 50), 6),
+        latency_p99=round(_percentile(latencies, 99), 6),
+        latencies=latencies,
+    )
+
+
+async def bench_startup(config: BenchConfig) -> list[ScenarioResult]:
+    """Import time in fresh interpreters, and what building validators costs.
+
+    The startup_validators scenarios measure the work no longer done on
+    import, for each validation engine.
+    """
+    imports: list[tuple[float, float]] = []
+    builds: dict[str, list[tuple[float, float]]] = {}
+    for engine in VALIDATION_ENGINES:
+        builds[engine] = []
+        for _ in range(config.startups):
+            import_clock, import_cpu, clock, cpu = await _startup_times(engine)
+            imports.append((import_clock, import_cpu))
+            builds[engine].append((clock, cpu))
+    results = [_startup_result("startup_import", imports)]
+    for engine, times in builds.items():
+        results.append(_startup_result(f"startup_validators_{engine}", times))
+    return results
+
+
+async def run_benchmarks(config: BenchConfig) -> dict[str, Any]:
+    """Runs every scenario and returns a report for `json` serialization."""
+    scenarios = await bench_inbox(config)
+    scenarios.append(await bench_fanout(config))
+    scenarios.extend(await bench_validation(config))
+    scenarios.extend(await bench_startup(config))
+    return {
+        "timestamp": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": asdict(config),
+        "scenarios": {s.name: s.as_dict() for s in scenarios},
+    }
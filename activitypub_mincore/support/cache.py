@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Generic, TypeVar
+
+import httpx
+
+from activitypub_mincore.support.metrics import SampledLogger
+
+logger = logging.getLogger("cache")
+refresh_failure_log = SampledLogger(logger)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING: Any = object()
+
+
+class LRUCache(Generic[K, V]):
+    """Bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[K, V] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    def get(self, key: K, default: Any = None) -> Any:
+        value = self._entries.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: K, default: Any = None) -> Any:
+        return self._entries.pop(key, default)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+
+def parse_cache_control(header: str | None) -> dict[str, int | None]:
+    """Parses Cache-Control directives. Valueless directives map to None."""
+    directives: dict[str, int | None] = {}
+    for directive in (header or "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            try:
+                directives[name.lower()] = int(value.strip('"')) if value else None
+            except ValueError:
+                directives[name.lower()] = None
+    return directives
+
+
+@dataclass
+class CacheEntry:
+    document: dict[str, Any]
+    etag: str | None
+    # Served without revalidation until then
+    fresh_until: float
+    # Served while revalidating in the background until then
+    stale_until: float
+
+
+class DocumentCache:
+    """Async cache for remote JSON documents.
+
+    Honors Cache-Control (max-age, no-cache, no-store,
+    stale-while-revalidate) and revalidates with If-None-Match when an ETag
+    is known. Concurrent lookups for the same URI share one fetch.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str, dict[str, str]], Awaitable[httpx.Response]],
+        parse: Callable[[httpx.Response], dict[str, Any]],
+        *,
+        maxsize: int = 10000,
+        ttl: float = 300.0,
+        max_ttl: float = 86400.0,
+        stale_ttl: float = 3600.0,
+    ):
+        self._fetch = fetch
+        self._parse = parse
+        self.ttl = ttl
+        self.max_ttl = max_ttl
+        self.stale_ttl = stale_ttl
+        self.entries: LRUCache[str, CacheEntry] = LRUCache(maxsize)
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._refreshes: set[asyncio.Task] = set()
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self._inflight.clear()
+
+    def invalidate(self, uri: str) -> None:
+        self.entries.pop(uri)
+
+    async def get(self, uri: str) -> dict[str, Any]:
+        entry: CacheEntry | None = self.entries.get(uri)
+        now = time.monotonic()
+        if entry:
+            if now < entry.fresh_until:
+                return entry.document
+            if now < entry.stale_until:
+                if uri not in self._inflight:
+                    task = asyncio.create_task(self._refresh(uri, entry))
+                    self._refreshes.add(task)
+                    task.add_done_callback(self._refreshes.discard)
+                return entry.document
+        return await self._load(uri, entry)
+
+    async def _refresh(self, uri: str, entry: CacheEntry) -> None:
+        try:
+            await self._load(uri, entry)
+        except Exception as ex:  # noqa: BLE001
+            # Nothing awaits a background refresh, so all its failures end here
+            refresh_failure_log.warning("Background refresh of %s failed: %r", uri, ex)
+
+    async def _load(self, uri: str, entry: CacheEntry | None) -> dict[str, Any]:
+        task = self._inflight.get(uri)
+        if task is None:
+            # Its own task, so a cancelled caller leaves it to the others
+            task = asyncio.create_task(self._fetch_entry(uri, entry))
+            self._inflight[uri] = task
+            task.add_done_callback(partial(self._loaded, uri))
+        return await asyncio.shield(task)
+
+    def _loaded(self, uri: str, task: asyncio.Task) -> None:
+        if self._inflight.get(uri) is task:
+            del self._inflight[uri]
+        if not task.cancelled():
+            # Avoid "exception never retrieved" when every caller was cancelled
+            task.exception()
+
+    async def _fetch_entry(self, uri: str, entry: CacheEntry | None) -> dict[str, Any]:
+        headers = {}
+        if entry and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        response = await self._fetch(uri, headers)
+        if response.status_code == 304 and entry:
+            document, etag = entry.document, entry.etag
+        else:
+            response.raise_for_status()
+            document, etag = self._parse(response), response.headers.get("ETag")
+        directives = parse_cache_control(response.headers.get("Cache-Control"))
+        if "no-store" in directives:
+            self.entries.pop(uri)
+            return document
+        max_age = directives.get("max-age")
+        stale_while_revalidate = directives.get("stale-while-revalidate")
+        ttl: float
+        stale_ttl: float
+        if "no-cache" in directives:
+            # Kept only for its ETag; always revalidated before use
+            ttl, stale_ttl = 0.0, 0.0
+        else:
+            ttl = self.ttl if max_age is None else min(self.max_ttl, max_age)
+            stale_ttl = (
+                self.stale_ttl
+                if stale_while_revalidate is None
+                else stale_while_revalidate
+            )
+        now = time.monotonic()
+        self.entries.set(
+            uri, CacheEntry(document, etag, now + ttl, now + ttl + stale_ttl)
+        )
+        return document
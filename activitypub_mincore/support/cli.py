@@ -1,11 +1,36 @@
 import asyncio
+import functools
+import logging
+import socket
+import sys
+import tempfile
+from pathlib import Path
 
 import click
 import uvicorn
 
 from activitypub_mincore import follower, publisher
-from activitypub_mincore.actor import initialize_actor
+from activitypub_mincore.actor import configure_signing, initialize_actor
+from activitypub_mincore.support import ingest, signatures
+from activitypub_mincore.support.admission import AdmissionConfig
+from activitypub_mincore.support.bench import BenchConfig, run_benchmarks
+from activitypub_mincore.support.client import HttpClientConfig
+from activitypub_mincore.support.outbound import DeliveryQueue
+from activitypub_mincore.support.outbox import Outbox
+from activitypub_mincore.support.serialization import dumps
 from activitypub_mincore.support.server import Server
+from activitypub_mincore.support.signatures import SignatureConfig
+from activitypub_mincore.support.sink import SegmentSink
+from activitypub_mincore.support.store import SqliteFollowerStore
+from activitypub_mincore.support.validation import (
+    MINCORE_ACTIVITY_TYPES,
+    VALIDATION_ENGINES,
+    build_schema_bundle,
+    validate_many,
+)
+from activitypub_mincore.support.workers import LeaderLock, run_elected, run_workers
+
+logger = logging.getLogger("cli")
 
 
 @click.group
@@ -13,27 +38,502 @@ def cli():
     """ActivityPub Minimal Core"""
 
 
+def http_client_options(f):
+    """Adds outbound HTTP client options, passed as `http_config`."""
+
+    def wrapper(*args, max_connections: int, per_host: int, http2: bool, **kwargs):
+        http_config = HttpClientConfig(
+            max_connections=max_connections, per_host=per_host, http2=http2
+        )
+        return f(*args, http_config=http_config, **kwargs)
+
+    wrapper = functools.update_wrapper(wrapper, f)
+    for option in reversed(
+        [
+            click.option(
+                "--max-connections",
+                type=int,
+                default=HttpClientConfig.max_connections,
+                help="outbound connection pool size",
+            ),
+            click.option(
+                "--per-host",
+                type=int,
+                default=HttpClientConfig.per_host,
+                help="outbound concurrent requests per host",
+            ),
+            click.option("--http2", is_flag=True, help="use HTTP/2 (requires h2)"),
+        ]
+    ):
+        wrapper = option(wrapper)
+    return wrapper
+
+
+def admission_options(f):
+    """Adds inbound admission control options, passed as `admission_config`."""
+
+    def wrapper(
+        *args, client_rate: float, actor_rate: float, max_inbox_requests: int, **kwargs
+    ):
+        admission_config = AdmissionConfig(
+            host_rate=client_rate,
+            host_burst=2 * client_rate,
+            actor_rate=actor_rate,
+            actor_burst=2 * actor_rate,
+            max_in_flight=max_inbox_requests,
+        )
+        return f(*args, admission_config=admission_config, **kwargs)
+
+    wrapper = functools.update_wrapper(wrapper, f)
+    for option in reversed(
+        [
+            click.option(
+                "--client-rate",
+                type=float,
+                default=AdmissionConfig.host_rate,
+                help="inbox POSTs per second from any one client address",
+            ),
+            click.option(
+                "--actor-rate",
+                type=float,
+                default=AdmissionConfig.actor_rate,
+                help="inbox POSTs per second from any one remote actor",
+            ),
+            click.option(
+                "--max-inbox-requests",
+                type=int,
+                default=AdmissionConfig.max_in_flight,
+                help="inbox POSTs handled at once (more get 503)",
+            ),
+        ]
+    ):
+        wrapper = option(wrapper)
+    return wrapper
+
+
+def signature_options(f):
+    """Adds HTTP Signature options, passed as `signature_config`."""
+
+    def wrapper(*args, keys: str | None, require_signatures: bool, **kwargs):
+        if require_signatures and not signatures.available():
+            raise click.UsageError(
+                "--require-signatures requires the cryptography package"
+            )
+        signature_config = SignatureConfig(key_dir=keys, required=require_signatures)
+        return f(*args, signature_config=signature_config, **kwargs)
+
+    wrapper = functools.update_wrapper(wrapper, f)
+    for option in reversed(
+        [
+            click.option(
+                "--keys",
+                metavar="DIR",
+                help="directory of the actors' signing keys (default: new keys)",
+            ),
+            click.option(
+                "--require-signatures",
+                is_flag=True,
+                help="refuse inbox POSTs without a valid HTTP Signature",
+            ),
+        ]
+    ):
+        wrapper = option(wrapper)
+    return wrapper
+
+
+def configure_signatures(
+    verifier: signatures.SignatureVerifier,
+    config: SignatureConfig,
+    state_dir: str | None,
+):
+    """Signs the actors' requests, when possible, and checks inbox POSTs."""
+    if signatures.available():
+        # Workers must all sign with the keys in their actor documents
+        key_dir = config.key_dir
+        if key_dir is None and state_dir:
+            key_dir = str(Path(state_dir, "keys"))
+        configure_signing(key_dir=key_dir)
+    else:
+        logger.warning(
+            "HTTP Signatures require the 'cryptography' package,"
+            " requests won't be signed"
+        )
+    verifier.required = config.required
+
+
+def run_instance(app_name: str, port: int, workers: int, serve: functools.partial):
+    """Runs serve() in this process or, with several workers, in each worker.
+
+    Workers share a state directory for the leader lock and any default
+    databases, so exactly one of them runs the instance's background work.
+    """
+    if workers <= 1:
+        serve()
+        return
+    with tempfile.TemporaryDirectory(prefix="mincore-") as state_dir:
+        sock = uvicorn.Config(app=app_name, port=port).bind_socket()
+        run_workers(workers, sock, functools.partial(serve, state_dir=state_dir))
+
+
+def serve_publisher(
+    port: int,
+    queue_path: str | None,
+    store_path: str | None,
+    outbox_path: str | None,
+    max_activity_size: int,
+    http_config: HttpClientConfig,
+    interval: float,
+    actor_names: list[str],
+    admission_config: AdmissionConfig,
+    signature_config: SignatureConfig,
+    *,
+    state_dir: str | None = None,
+    sockets: list[socket.socket] | None = None,
+):
+    ingest.max_activity_size = max_activity_size
+    publisher.admission.configure(admission_config)
+    publisher.publish_scheduler.interval = interval
+    configure_signatures(publisher.signature_verifier, signature_config, state_dir)
+    if state_dir:
+        # Followers must be shared by the workers; deliveries survive failover
+        queue_path = queue_path or str(Path(state_dir, "queue.db"))
+        store_path = store_path or str(Path(state_dir, "followers.db"))
+        outbox_path = outbox_path or str(Path(state_dir, "outbox.db"))
+    if queue_path:
+        publisher.delivery_queue = DeliveryQueue(queue_path)
+    if store_path:
+        publisher.follower_store = SqliteFollowerStore(store_path)
+    if outbox_path:
+        publisher.outbox = Outbox(outbox_path)
+    publish = publisher.publish()
+    if state_dir:
+        publish = run_elected(LeaderLock(Path(state_dir, "publisher.lock")), publish)
+    config = uvicorn.Config(app=publisher.app, port=port, log_config=None)
+    server = Server(config, [publish], http_config)
+    initialize_actor(server, actor_names)
+    asyncio.run(server.run(sockets))
+
+
 @cli.command("publisher")
 @click.option("--port", help="server port", default=8000)
-def publisher_instance(port: int):
-    """Publish-only, single-actor instance"""
-    config = uvicorn.Config(app=publisher.app, port=port, log_config=None)
-    server = Server(config, [publisher.publish()])
+@click.option(
+    "--queue",
+    "queue_path",
+    metavar="PATH",
+    help="delivery queue database file (default: in-memory)",
+)
+@click.option(
+    "--store",
+    "store_path",
+    metavar="PATH",
+    help="follower database file (default: in-memory)",
+)
+@click.option(
+    "--outbox",
+    "outbox_path",
+    metavar="PATH",
+    help="outbox database file (default: in-memory)",
+)
+@click.option(
+    "--max-activity-size",
+    type=int,
+    default=ingest.max_activity_size,
+    help="largest inbox POST accepted, in bytes",
+)
+@click.option(
+    "--workers", type=int, default=1, help="server processes sharing the port"
+)
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=5.0,
+    help="seconds between publication cycles",
+)
+@click.option(
+    "--actor",
+    "actor_names",
+    metavar="NAME",
+    multiple=True,
+    help="also host the actor /actors/NAME (repeatable)",
+)
+@click.option(
+    "--actor-file",
+    metavar="PATH",
+    type=click.File(),
+    help="file with names of actors to host, one per line",
+)
+@http_client_options
+@admission_options
+@signature_options
+def publisher_instance(
+    port: int,
+    queue_path: str | None,
+    store_path: str | None,
+    outbox_path: str | None,
+    max_activity_size: int,
+    workers: int,
+    interval: float,
+    actor_names: tuple[str, ...],
+    actor_file,
+    http_config: HttpClientConfig,
+    admission_config: AdmissionConfig,
+    signature_config: SignatureConfig,
+):
+    """Publish-only instance, hosting one or more actors"""
+    names = list(actor_names)
+    if actor_file:
+        names.extend(line.strip() for line in actor_file if line.strip())
+    serve = functools.partial(
+        serve_publisher,
+        port,
+        queue_path,
+        store_path,
+        outbox_path,
+        max_activity_size,
+        http_config,
+        interval,
+        names,
+        admission_config,
+        signature_config,
+    )
+    run_instance("activitypub_mincore.publisher:app", port, workers, serve)
+
+
+async def _follow_uris(tofollow: list[str], follow_file: str | None):
+    for uri in tofollow:
+        yield uri
+    if follow_file:
+        async for uri in follower.read_follow_list(follow_file):
+            yield uri
+
+
+def serve_follower(
+    port: int,
+    tofollow: list[str],
+    follow_file: str | None,
+    scheduler: follower.FollowScheduler,
+    max_activity_size: int,
+    sink_dir: str | None,
+    http_config: HttpClientConfig,
+    admission_config: AdmissionConfig,
+    signature_config: SignatureConfig,
+    *,
+    state_dir: str | None = None,
+    sockets: list[socket.socket] | None = None,
+):
+    ingest.max_activity_size = max_activity_size
+    follower.admission.configure(admission_config)
+    configure_signatures(follower.signature_verifier, signature_config, state_dir)
+    if sink_dir:
+        follower.sink = SegmentSink(sink_dir)
+    follow = follower.follow_all(_follow_uris(tofollow, follow_file), scheduler)
+    if state_dir:
+        follow = run_elected(LeaderLock(Path(state_dir, "follower.lock")), follow)
+    config = uvicorn.Config(app=follower.app, port=port, log_config=None)
+    server = Server(config, [follow], http_config)
     initialize_actor(server)
-    asyncio.run(server.run())
+    asyncio.run(server.run(sockets))
 
 
 @cli.command("follower")
 @click.argument("tofollow", nargs=-1, metavar="ACTOR_URIS...")
 @click.option("--port", metavar="PORT", type=int, help="server port", default=8001)
-def follower_instance(tofollow: list[str], port: int):
+@click.option(
+    "--follow-file",
+    metavar="PATH",
+    help="file with actor URIs to follow, one per line ('-' for stdin)",
+)
+@click.option(
+    "--follow-concurrency",
+    type=int,
+    default=16,
+    help="concurrent Follow requests",
+)
+@click.option(
+    "--follow-rate",
+    type=float,
+    default=2.0,
+    help="Follow requests per second to any single host",
+)
+@click.option(
+    "--max-activity-size",
+    type=int,
+    default=ingest.max_activity_size,
+    help="largest inbox POST accepted, in bytes",
+)
+@click.option(
+    "--sink",
+    "sink_dir",
+    metavar="DIR",
+    help="keep received activities in JSON Lines files in DIR",
+)
+@click.option(
+    "--workers", type=int, default=1, help="server processes sharing the port"
+)
+@http_client_options
+@admission_options
+@signature_options
+def follower_instance(
+    tofollow: list[str],
+    port: int,
+    follow_file: str | None,
+    follow_concurrency: int,
+    follow_rate: float,
+    max_activity_size: int,
+    sink_dir: str | None,
+    workers: int,
+    http_config: HttpClientConfig,
+    admission_config: AdmissionConfig,
+    signature_config: SignatureConfig,
+):
     """Follow-only, single actor instance"""
-    if not tofollow:
+    if not tofollow and not follow_file:
         tofollow = ["http://127.0.0.1:8000/actor"]
-    config = uvicorn.Config(app=follower.app, port=port, log_config=None)
-    server = Server(config, [follower.send_follow(uri) for uri in tofollow])
-    initialize_actor(server)
-    asyncio.run(server.run())
+    if follow_file == "-" and workers > 1:
+        raise click.UsageError("--follow-file - can't be used with --workers")
+    scheduler = follower.FollowScheduler(
+        concurrency=follow_concurrency, per_host_rate=follow_rate
+    )
+    serve = functools.partial(
+        serve_follower,
+        port,
+        list(tofollow),
+        follow_file,
+        scheduler,
+        max_activity_size,
+        sink_dir,
+        http_config,
+        admission_config,
+        signature_config,
+    )
+    run_instance("activitypub_mincore.follower:app", port, workers, serve)
+
+
+@cli.command("bench")
+@click.option(
+    "--followers",
+    type=int,
+    default=BenchConfig.followers,
+    help="simulated followers",
+)
+@click.option(
+    "--hosts",
+    type=int,
+    default=BenchConfig.hosts,
+    help="simulated follower servers",
+)
+@click.option(
+    "--cycles",
+    type=int,
+    default=BenchConfig.cycles,
+    help="publication cycles",
+)
+@click.option(
+    "--validations",
+    type=int,
+    default=BenchConfig.validations,
+    help="activities validated per validation engine",
+)
+@click.option(
+    "--concurrency",
+    type=int,
+    default=BenchConfig.concurrency,
+    help="concurrent inbound requests",
+)
+@click.option(
+    "--startups",
+    type=int,
+    default=BenchConfig.startups,
+    help="fresh interpreters timed per startup scenario",
+)
+@click.option(
+    "--output",
+    metavar="PATH",
+    default="bench.json",
+    help="results file (JSON)",
+)
+def bench_instance(output: str, **options):
+    """Benchmark the publisher against simulated followers"""
+    # Per-request logging would dominate the measurements
+    logging.getLogger().setLevel(logging.WARNING)
+    report = asyncio.run(run_benchmarks(BenchConfig(**options)))
+    Path(output).write_bytes(dumps(report))
+    for name, result in report["scenarios"].items():
+        click.echo(
+            f"{name:30} {result['throughput']:>12.1f}/s"
+            f"  p50={result['latency_p50'] * 1000:.3f}ms"
+            f"  p99={result['latency_p99'] * 1000:.3f}ms"
+            f"  cpu={result['cpu_time']:.3f}s"
+            f"  rss={result['peak_rss']:.1f}MiB"
+        )
+    click.echo(f"results written to {output}")
+
+
+@cli.command("validate")
+@click.argument("files", metavar="[FILE]...", nargs=-1, type=click.File("rb"))
+@click.option(
+    "--schema",
+    type=click.Choice(["activity", "actor"]),
+    default="activity",
+    help="schema the records must match",
+)
+@click.option(
+    "--type",
+    "types",
+    metavar="TYPE",
+    multiple=True,
+    help="accepted activity type (repeatable, default: the instances' types)",
+)
+@click.option("--engine", type=click.Choice(VALIDATION_ENGINES), help="validator")
+@click.option(
+    "--processes",
+    type=click.IntRange(min=1),
+    help="validating processes (default: one per CPU)",
+)
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=1 << 20,
+    help="bytes of input per unit of work",
+)
+def validate(
+    files,
+    schema: str,
+    types: tuple[str, ...],
+    engine: str | None,
+    processes: int | None,
+    chunk_size: int,
+):
+    """Validate JSON Lines files (or stdin), writing errors as JSON Lines
+
+    Exits with status 1 when any record is invalid.
+    """
+    types = types or (*MINCORE_ACTIVITY_TYPES, "Create", "Undo")
+    invalid = 0
+    stdout = sys.stdout.buffer
+    for file in files or [sys.stdin.buffer]:
+        errors = validate_many(
+            file,
+            root_schema=f"schema:{schema}",
+            types=list(types),
+            engine=engine,
+            processes=processes,
+            chunk_size=chunk_size,
+        )
+        for error in errors:
+            invalid += 1
+            record = {"file": file.name, **vars(error)}
+            stdout.write(dumps(record) + b"\n")
+    click.echo(f"{invalid} invalid records", err=True)
+    if invalid:
+        raise SystemExit(1)
+
+
+@cli.command("schema-bundle")
+@click.argument("output", metavar="PATH")
+def schema_bundle(output: str):
+    """Save the schemas as one file, to load with MINCORE_SCHEMA_BUNDLE=PATH"""
+    Path(output).write_bytes(dumps(build_schema_bundle()))
 
 
 #
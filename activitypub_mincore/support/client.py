@@ -0,0 +1,138 @@
+import asyncio
+import importlib.util
+import logging
+from collections.abc import AsyncIterator, Callable
+from dataclasses import dataclass
+
+import httpx
+
+logger = logging.getLogger("client")
+
+
+@dataclass
+class HttpClientConfig:
+    max_connections: int = 200
+    max_keepalive_connections: int = 50
+    # Seconds an idle keep-alive connection stays in the pool
+    keepalive_expiry: float = 30.0
+    # Concurrent requests to any single host
+    per_host: int = 16
+    # Requires the optional "h2" package
+    http2: bool = False
+    timeout: float = 10.0
+    connect_timeout: float = 5.0
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class HostLimitedTransport(httpx.AsyncBaseTransport):
+    """Limits concurrent requests per host.
+
+    A slot is held until the response is closed. Slots for idle hosts are
+    discarded, so memory is bounded by the number of active hosts.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, per_host: int):
+        self._transport = transport
+        self._per_host = per_host
+        self._slots: dict[str, tuple[asyncio.Semaphore, list[int]]] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.netloc.decode()
+        if host not in self._slots:
+            self._slots[host] = (asyncio.Semaphore(self._per_host), [0])
+        semaphore, users = self._slots[host]
+        users[0] += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                semaphore.release()
+                users[0] -= 1
+                if users[0] == 0:
+                    del self._slots[host]
+
+        try:
+            await semaphore.acquire()
+        except BaseException:
+            users[0] -= 1
+            if users[0] == 0:
+                del self._slots[host]
+            raise
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        assert isinstance(response.stream, httpx.AsyncByteStream)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, release),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def create_client(config: HttpClientConfig) -> httpx.AsyncClient:
+    http2 = config.http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 requires the 'h2' package, using HTTP/1.1")
+        http2 = False
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+        http2=http2,
+    )
+    return httpx.AsyncClient(
+        transport=HostLimitedTransport(transport, config.per_host),
+        timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+    )
+
+
+client_config = HttpClientConfig()
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """The shared client. It is created on first use if it isn't open yet."""
+    global _client
+    if _client is None:
+        _client = create_client(client_config)
+    return _client
+
+
+def open_client(config: HttpClientConfig | None = None) -> httpx.AsyncClient:
+    global client_config
+    if config:
+        client_config = config
+    return get_client()
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
@@ -0,0 +1,197 @@
+"""Compiles the AP Core JSON Schemas into specialized Python checks.
+
+Only the keywords used by the bundled schemas are supported. Compilation
+fails with `UnsupportedSchema` for anything else, so a schema is never
+silently checked more loosely than jsonschema would check it.
+
+Valid instances are accepted by the compiled checks alone. Anything they
+reject is re-validated by the wrapped jsonschema validator, so error
+reporting is identical to the generic engine.
+"""
+
+from collections.abc import Callable, Iterator
+from typing import Any, Protocol
+
+import referencing
+import referencing.jsonschema
+from jsonschema import FormatChecker
+from jsonschema.exceptions import ValidationError
+from jsonschema.protocols import Validator
+
+Check = Callable[[Any], bool]
+
+
+class Resolver(Protocol):
+    """What `referencing.Registry.resolver()` returns, as used here. The
+    package doesn't export the class itself."""
+
+    def lookup(self, ref: str) -> Any: ...
+
+    def in_subresource(self, subresource: Any) -> "Resolver": ...
+
+
+# Keywords without validation behavior
+_ANNOTATIONS = {
+    "$schema",
+    "$id",
+    "$comment",
+    "definitions",
+    "$defs",
+    "description",
+    "title",
+    "examples",
+    "default",
+}
+
+_TYPES: dict[str, Check] = {
+    "object": lambda i: isinstance(i, dict),
+    "array": lambda i: isinstance(i, list),
+    "string": lambda i: isinstance(i, str),
+    "boolean": lambda i: isinstance(i, bool),
+    "null": lambda i: i is None,
+    "number": lambda i: isinstance(i, (int, float)) and not isinstance(i, bool),
+    "integer": lambda i: (
+        (isinstance(i, int) and not isinstance(i, bool))
+        or (isinstance(i, float) and i.is_integer())
+    ),
+}
+
+
+class UnsupportedSchema(Exception):
+    pass
+
+
+def json_equal(a: Any, b: Any) -> bool:
+    """Equality as defined by JSON Schema (booleans are not numbers)."""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return isinstance(a, bool) and isinstance(b, bool) and a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(json_equal(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(
+            json_equal(x, y) for x, y in zip(a, b, strict=True)
+        )
+    if isinstance(a, (dict, list)) or isinstance(b, (dict, list)):
+        return False
+    return a == b
+
+
+class _Compiler:
+    def __init__(self, format_checker: FormatChecker | None):
+        self.format_checker = format_checker
+        # Compiled $ref targets, by resolved schema (allows recursive schemas)
+        self.refs: dict[int, list[Check]] = {}
+
+    def compile(self, schema: Any, resolver: Resolver) -> Check:
+        if schema is True:
+            return lambda i: True
+        if schema is False:
+            return lambda i: False
+        if not isinstance(schema, dict):
+            raise UnsupportedSchema(f"Not a schema: {schema!r}")
+        if "$id" in schema:
+            resolver = resolver.in_subresource(
+                referencing.jsonschema.DRAFT202012.create_resource(schema)
+            )
+        checks: list[Check] = []
+        for keyword, value in schema.items():
+            if keyword in _ANNOTATIONS:
+                continue
+            compile_keyword = getattr(self, f"_{keyword.lstrip('$')}", None)
+            if compile_keyword is None:
+                raise UnsupportedSchema(f"Unsupported keyword: {keyword}")
+            checks.append(compile_keyword(value, resolver))
+        return _all(checks)
+
+    def _ref(self, ref: str, resolver: Resolver) -> Check:
+        resolved = resolver.lookup(ref)
+        key = id(resolved.contents)
+        cell = self.refs.get(key)
+        if cell is None:
+            cell = self.refs[key] = []
+            cell.append(self.compile(resolved.contents, resolved.resolver))
+        if cell:
+            return cell[0]
+        # Recursive reference, still being compiled
+        compiled = cell
+        return lambda i: compiled[0](i)
+
+    def _type(self, value: str | list[str], resolver) -> Check:
+        if isinstance(value, str):
+            return _TYPES[value]
+        checks = [_TYPES[t] for t in value]
+        return lambda i: any(c(i) for c in checks)
+
+    def _const(self, value: Any, resolver) -> Check:
+        return lambda i: json_equal(i, value)
+
+    def _enum(self, value: list[Any], resolver) -> Check:
+        return lambda i: any(json_equal(i, v) for v in value)
+
+    def _required(self, value: list[str], resolver) -> Check:
+        names = tuple(value)
+        return lambda i: not isinstance(i, dict) or all(n in i for n in names)
+
+    def _properties(self, value: dict[str, Any], resolver) -> Check:
+        checks = [(name, self.compile(s, resolver)) for name, s in value.items()]
+
+        def check(i):
+            if isinstance(i, dict):
+                for name, c in checks:
+                    if name in i and not c(i[name]):
+                        return False
+            return True
+
+        return check
+
+    def _allOf(self, value: list[Any], resolver) -> Check:
+        return _all([self.compile(s, resolver) for s in value])
+
+    def _anyOf(self, value: list[Any], resolver) -> Check:
+        checks = [self.compile(s, resolver) for s in value]
+        return lambda i: any(c(i) for c in checks)
+
+    def _oneOf(self, value: list[Any], resolver) -> Check:
+        checks = [self.compile(s, resolver) for s in value]
+        return lambda i: sum(1 for c in checks if c(i)) == 1
+
+    def _format(self, value: str, resolver) -> Check:
+        format_checker = self.format_checker
+        if format_checker is None or value not in format_checker.checkers:
+            # Formats are annotations unless a checker is configured
+            return lambda i: True
+        conforms = format_checker.conforms
+        return lambda i: conforms(i, value)
+
+
+def _all(checks: list[Check]) -> Check:
+    if not checks:
+        return lambda i: True
+    if len(checks) == 1:
+        return checks[0]
+    return lambda i: all(c(i) for c in checks)
+
+
+class CompiledValidator:
+    """A drop-in replacement for a jsonschema validator with compiled checks."""
+
+    def __init__(self, validator: Validator, registry: referencing.Registry):
+        self.validator = validator
+        self.schema = validator.schema
+        self._check = _Compiler(validator.format_checker).compile(
+            validator.schema, registry.resolver()
+        )
+
+    # Rejections are always confirmed by the wrapped validator, which also
+    # provides the errors.
+
+    def is_valid(self, instance: Any) -> bool:
+        return self._check(instance) or self.validator.is_valid(instance)
+
+    def iter_errors(self, instance: Any) -> Iterator[ValidationError]:
+        if not self._check(instance):
+            yield from self.validator.iter_errors(instance)
+
+    def validate(self, instance: Any) -> None:
+        if not self._check(instance):
+            self.validator.validate(instance)
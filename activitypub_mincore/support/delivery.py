@@ -0,0 +1,172 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+from collections.abc import Awaitable, Callable, Hashable, Iterable
+from dataclasses import dataclass, field
+from typing import Any
+from urllib.parse import urlparse
+
+import httpx
+
+from activitypub_mincore.support.metrics import Counter, Histogram
+from activitypub_mincore.support.serialization import ACTIVITY_HEADERS
+
+DELIVERIES = Counter(
+    "mincore_deliveries_total", "Delivery attempts by outcome", ("outcome",)
+)
+DELIVERY_SECONDS = Histogram(
+    "mincore_delivery_seconds", "Time to POST an activity to an inbox", ("outcome",)
+)
+
+
+@dataclass
+class DeliveryConfig:
+    # Total number of in-flight POSTs across all hosts
+    concurrency: int = 64
+    # In-flight POSTs to any single host
+    per_host: int = 4
+    # Seconds allowed for a complete fan-out cycle (None is unbounded)
+    deadline: float | None = 30.0
+
+
+@dataclass
+class DeliveryStats:
+    attempted: int = 0
+    delivered: int = 0
+    failed: int = 0
+    expired: int = 0
+    elapsed: float = 0.0
+    latencies: list[float] = field(default_factory=list, repr=False)
+
+    @property
+    def throughput(self) -> float:
+        """Successful deliveries per second"""
+        return self.delivered / self.elapsed if self.elapsed > 0 else 0.0
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    def add(self, other: "DeliveryStats") -> None:
+        self.attempted += other.attempted
+        self.delivered += other.delivered
+        self.failed += other.failed
+        self.expired += other.expired
+        self.elapsed += other.elapsed
+        self.latencies.extend(other.latencies)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "attempted": self.attempted,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "expired": self.expired,
+            "elapsed": round(self.elapsed, 6),
+            "throughput": round(self.throughput, 3),
+            "latency_p50": round(self.percentile(0.50), 6),
+            "latency_p99": round(self.percentile(0.99), 6),
+            "latency_max": round(max(self.latencies, default=0.0), 6),
+        }
+
+    def __str__(self) -> str:
+        return " ".join(f"{k}={v}" for k, v in self.as_dict().items())
+
+
+@dataclass
+class DeliveryResult:
+    stats: DeliveryStats = field(default_factory=DeliveryStats)
+    # Failed jobs, by key
+    failures: dict[Hashable, Exception] = field(default_factory=dict)
+    # Jobs (by key) not attempted or completed before the deadline
+    expired: set[Hashable] = field(default_factory=set)
+
+
+@dataclass(frozen=True)
+class DeliveryJob:
+    key: Hashable
+    inbox: str
+    # The encoded activity, usually shared by many jobs
+    body: bytes
+
+
+# Headers signing a POST of a body to an inbox
+RequestSigner = Callable[[str, bytes], Awaitable[dict[str, str]]]
+
+
+def _host(uri: str) -> str:
+    return urlparse(uri).netloc
+
+
+async def deliver_jobs(
+    client: httpx.AsyncClient,
+    jobs: Iterable[DeliveryJob],
+    config: DeliveryConfig | None = None,
+    sign: RequestSigner | None = None,
+) -> DeliveryResult:
+    """POSTs each job's body to its inbox, concurrently, signed with `sign`.
+
+    Jobs are grouped by host. Each host is drained by at most
+    `config.per_host` workers and all workers share `config.concurrency`
+    slots, so a slow host only delays its own recipients.
+    """
+    config = config or DeliveryConfig()
+    result = DeliveryResult()
+    stats = result.stats
+
+    by_host: dict[str, deque[DeliveryJob]] = defaultdict(deque)
+    pending: set[Hashable] = set()
+    for job in jobs:
+        if job.key not in pending:
+            pending.add(job.key)
+            by_host[_host(job.inbox)].append(job)
+    stats.attempted = len(pending)
+
+    slots = asyncio.Semaphore(config.concurrency)
+
+    async def post(job: DeliveryJob):
+        start = time.perf_counter()
+        try:
+            headers = ACTIVITY_HEADERS
+            if sign is not None:
+                headers = {**headers, **await sign(job.inbox, job.body)}
+            response = await client.post(job.inbox, content=job.body, headers=headers)
+            response.raise_for_status()
+        except Exception as ex:  # noqa: BLE001
+            # Any failure is the delivery's, reported for a retry, and mustn't
+            # fail the rest of the fan-out
+            result.failures[job.key] = ex
+            stats.failed += 1
+            outcome = "failed"
+        else:
+            stats.delivered += 1
+            outcome = "delivered"
+        # Not reached when cancelled by the deadline, so the job stays pending
+        latency = time.perf_counter() - start
+        stats.latencies.append(latency)
+        DELIVERY_SECONDS.observe(latency, outcome=outcome)
+        DELIVERIES.inc(outcome=outcome)
+        pending.discard(job.key)
+
+    async def host_worker(queue: deque[DeliveryJob]):
+        while queue:
+            job = queue.popleft()
+            async with slots:
+                await post(job)
+
+    workers = [
+        host_worker(queue)
+        for queue in by_host.values()
+        for _ in range(min(config.per_host, len(queue)))
+    ]
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(config.deadline):
+            await asyncio.gather(*workers)
+    except TimeoutError:
+        result.expired = set(pending)
+        stats.expired = len(pending)
+        DELIVERIES.inc(len(pending), outcome="expired")
+    stats.elapsed = time.perf_counter() - started
+    return result
@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import logging
+import time
+import zlib
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+import fastapi
+
+from activitypub_mincore.support.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    SampledLogger,
+)
+from activitypub_mincore.support.serialization import loads
+
+logger = logging.getLogger("ingest")
+handler_failure_log = SampledLogger(logger)
+
+# Called with the activity and any context it was submitted with
+Handler = Callable[..., Awaitable[None]]
+
+ACTIVITY_MEDIA_TYPES = {
+    "application/activity+json",
+    "application/ld+json",
+    "application/json",
+}
+
+# Largest inbox POST body accepted, in bytes
+max_activity_size = 256 * 1024
+
+INBOX_REQUESTS = Counter(
+    "mincore_inbox_requests_total", "Inbox POSTs by response status", ("status",)
+)
+INBOX_REQUEST_SECONDS = Histogram(
+    "mincore_inbox_request_seconds", "Time to read, validate and queue inbox POSTs"
+)
+INBOX_HANDLE_SECONDS = Histogram(
+    "mincore_inbox_handle_seconds", "Time to handle a queued inbox activity"
+)
+INBOX_DUPLICATES = Counter(
+    "mincore_inbox_duplicates_total", "Redelivered activities that were dropped"
+)
+INBOX_QUEUE_DEPTH = Gauge(
+    "mincore_inbox_queue_depth", "Inbox activities waiting to be handled"
+)
+
+
+@contextmanager
+def inbox_request() -> Iterator[None]:
+    """Times an inbox POST and counts it by response status."""
+    start = time.perf_counter()
+    status = 202
+    try:
+        yield
+    except fastapi.HTTPException as ex:
+        status = ex.status_code
+        raise
+    except BaseException:
+        status = 500
+        raise
+    finally:
+        INBOX_REQUEST_SECONDS.observe(time.perf_counter() - start)
+        INBOX_REQUESTS.inc(status=str(status))
+
+
+async def read_activity(
+    request: fastapi.Request, max_size: int | None = None
+) -> dict[str, Any]:
+    """Reads and decodes an activity posted to an inbox.
+
+    The content type is checked before anything is read, and the body is
+    read incrementally so oversized requests are rejected without buffering
+    them.
+    """
+    max_size = max_size or max_activity_size
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if media_type.lower() not in ACTIVITY_MEDIA_TYPES:
+        raise fastapi.HTTPException(415, "Unsupported Media Type")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_size:
+        raise fastapi.HTTPException(413, "Content Too Large")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_size:
+            raise fastapi.HTTPException(413, "Content Too Large")
+    try:
+        activity = loads(body)
+    except ValueError:
+        raise fastapi.HTTPException(400, "Bad request: malformed JSON") from None
+    if not isinstance(activity, dict):
+        raise fastapi.HTTPException(400, "Bad request: not a JSON object")
+    return activity
+
+
+class SeenActivities:
+    """Ids of recently received activities, for dropping redeliveries.
+
+    Ids are remembered for `window` seconds, up to `maxsize` of them (the
+    oldest are forgotten first). Only a `digest_size`-byte hash of each id
+    is kept, so memory is roughly maxsize * (digest_size + 70) bytes, and
+    the chance of mistaking a new id for a seen one is about
+    maxsize / 2 ** (8 * digest_size).
+    """
+
+    def __init__(
+        self, maxsize: int = 100_000, window: float = 3600, digest_size: int = 8
+    ):
+        self.maxsize = maxsize
+        self.window = window
+        self.digest_size = digest_size
+        # Insertion order is also time order
+        self._seen: OrderedDict[bytes, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _key(self, activity_id: str, recipient: str) -> bytes:
+        return hashlib.blake2b(
+            f"{recipient} {activity_id}".encode(), digest_size=self.digest_size
+        ).digest()
+
+    def add(
+        self, activity_id: str, recipient: str = "", now: float | None = None
+    ) -> bool:
+        """Records an id, returning False if it was seen within the window."""
+        now = time.monotonic() if now is None else now
+        seen = self._seen
+        while seen and next(iter(seen.values())) <= now - self.window:
+            seen.popitem(last=False)
+        key = self._key(activity_id, recipient)
+        if key in seen:
+            return False
+        seen[key] = now
+        if len(seen) > self.maxsize:
+            seen.popitem(last=False)
+        return True
+
+    def discard(self, activity_id: str | None, recipient: str = "") -> None:
+        """Forgets an id, so a redelivery is accepted (after a failure)."""
+        if activity_id is not None:
+            self._seen.pop(self._key(activity_id, recipient), None)
+
+    def clear(self) -> None:
+        self._seen.clear()
+
+
+def accept_once(
+    seen: SeenActivities, activity: dict[str, Any], recipient: str = ""
+) -> bool:
+    """Records an inbound activity. False if it's a redelivery to drop."""
+    activity_id = activity.get("id")
+    # Transient activities have no id, and can't be recognized
+    if not isinstance(activity_id, str) or seen.add(activity_id, recipient):
+        return True
+    INBOX_DUPLICATES.inc()
+    return False
+
+
+class InboxPipeline:
+    """Processes accepted inbox activities off the request path.
+
+    Activities are sharded across workers by sender, so each sender's
+    activities are handled in the order they arrived. When a worker's queue
+    is full, `submit` fails with 429 Too Many Requests.
+    """
+
+    def __init__(
+        self,
+        handler: Handler,
+        *,
+        workers: int = 8,
+        maxsize: int = 1024,
+        retry_after: int = 5,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self.retry_after = retry_after
+        self._queues: list[asyncio.Queue] = []
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    async def start(self) -> None:
+        if not self.running:
+            per_worker = max(1, self.maxsize // self.workers)
+            self._queues = [asyncio.Queue(per_worker) for _ in range(self.workers)]
+            self._tasks = [asyncio.create_task(self._work(q)) for q in self._queues]
+            INBOX_QUEUE_DEPTH.set_function(lambda: self.depth)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = []
+
+    async def join(self) -> None:
+        """Waits until every submitted activity has been handled."""
+        for queue in self._queues:
+            await queue.join()
+
+    def submit(self, activity: dict[str, Any], *context: Any) -> None:
+        if not self.running:
+            raise RuntimeError("Inbox pipeline is not running")
+        sender = activity.get("actor")
+        shard = zlib.crc32(str(sender).encode()) % len(self._queues)
+        try:
+            self._queues[shard].put_nowait((activity, context))
+        except asyncio.QueueFull:
+            raise fastapi.HTTPException(
+                429,
+                "Too Many Requests",
+                headers={"Retry-After": str(self.retry_after)},
+            ) from None
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            activity, context = await queue.get()
+            start = time.perf_counter()
+            try:
+                await self.handler(activity, *context)
+            except asyncio.CancelledError as ex:
+                # Only the pipeline's own shutdown stops the worker; a
+                # cancellation escaping the handler fails its activity
+                worker = asyncio.current_task()
+                if worker is None or worker.cancelling():
+                    raise
+                handler_failure_log.error("Inbox handler was cancelled: %r", ex)
+            except Exception as ex:  # noqa: BLE001
+                # One activity's failure mustn't stop the worker's shard
+                handler_failure_log.error("Inbox handler failed: %r", ex, exc_info=ex)
+            finally:
+                INBOX_HANDLE_SECONDS.observe(time.perf_counter() - start)
+                queue.task_done()
+
+    def install(self, app: fastapi.FastAPI) -> None:
+        """Runs the pipeline for the lifetime of the app."""
+        app.add_event_handler("startup", self.start)
+        app.add_event_handler("shutdown", self.stop)
@@ -0,0 +1,253 @@
+"""Process metrics, exposed in the Prometheus text format at /metrics.
+
+Metrics are module-level objects created where they're used. A labelled
+metric has no samples until a label combination is first recorded.
+"""
+
+import bisect
+import logging
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from fast local work up to a slow remote server
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, **extra: str) -> str:
+    pairs = list(zip(names, values, strict=True)) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    type_: str = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        registry: "Registry | None" = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        if labels.keys() != set(self.labelnames):
+            raise ValueError(f"{self.name} has labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> Iterator[str]:
+        lines = list(self.samples())
+        if lines:
+            yield f"# HELP {self.name} {self.documentation}"
+            yield f"# TYPE {self.name} {self.type_}"
+            yield from lines
+
+
+class Counter(Metric):
+    type_ = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self.values.items():
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    type_ = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: dict[LabelValues, float] = {}
+        self.functions: dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        """Reads the value from a function when the metrics are collected."""
+        self.functions[self._key(labels)] = function
+
+    def value(self, **labels: str) -> float:
+        key = self._key(labels)
+        function = self.functions.get(key)
+        return function() if function else self.values.get(key, 0)
+
+    def samples(self) -> Iterator[str]:
+        for key in {**self.values, **self.functions}:
+            value = self.functions[key]() if key in self.functions else self.values[key]
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class _Series:
+    __slots__ = ("count", "counts", "sum")
+
+    def __init__(self, nbuckets: int):
+        self.counts = [0] * nbuckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    type_ = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self.series: dict[LabelValues, _Series] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = _Series(len(self.buckets) + 1)
+        # Counts are per bucket here and made cumulative when rendered
+        series.counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        series = self.series.get(self._key(labels))
+        return series.count if series else 0
+
+    def samples(self) -> Iterator[str]:
+        for key, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(
+                self.buckets + (float("inf"),), series.counts, strict=True
+            ):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, le=_format_value(bound))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(series.sum)}"
+            yield f"{self.name}_count{labels} {series.count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = [line for metric in self.metrics.values() for line in metric.render()]
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+REGISTRY = Registry()
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get__metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+class SampledLogger:
+    """Logs at most one message per interval, counting the ones it drops.
+
+    Arguments are %-style and only formatted when a message is emitted, so
+    a hot path pays for a level check and a clock read.
+    """
+
+    def __init__(self, logger: logging.Logger, interval: float = 1.0):
+        self.logger = logger
+        self.interval = interval
+        self.suppressed = 0
+        self._last = float("-inf")
+
+    def log(self, level: int, msg: str, *args, exc_info: Any = None) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        if now - self._last < self.interval:
+            self.suppressed += 1
+            return
+        self._last = now
+        if self.suppressed:
+            msg += " (%d similar messages suppressed)"
+            args += (self.suppressed,)
+            self.suppressed = 0
+        self.logger.log(level, msg, *args, exc_info=exc_info)
+
+    def info(self, msg: str, *args) -> None:
+        self.log(logging.INFO, msg, *args)
+
+    def warning(self, msg: str, *args) -> None:
+        self.log(logging.WARNING, msg, *args)
+
+    def error(self, msg: str, *args, exc_info: Any = None) -> None:
+        self.log(logging.ERROR, msg, *args, exc_info=exc_info)
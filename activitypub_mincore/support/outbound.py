@@ -0,0 +1,329 @@
+import logging
+import sqlite3
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from activitypub_mincore.support.delivery import (
+    DeliveryConfig,
+    DeliveryJob,
+    DeliveryStats,
+    deliver_jobs,
+)
+from activitypub_mincore.support.metrics import SampledLogger
+from activitypub_mincore.support.retry import RetryPolicy
+from activitypub_mincore.support.serialization import dumps, loads
+from activitypub_mincore.support.signatures import FanoutSigner, Signer
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS payloads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    body BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload_id INTEGER NOT NULL REFERENCES payloads(id),
+    inbox TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS deliveries_due ON deliveries(state, next_attempt);
+CREATE INDEX IF NOT EXISTS deliveries_payload ON deliveries(payload_id);
+CREATE TABLE IF NOT EXISTS circuits (
+    inbox TEXT PRIMARY KEY,
+    failures INTEGER NOT NULL,
+    open_until REAL NOT NULL
+);
+"""
+
+logger = logging.getLogger("delivery")
+failure_log = SampledLogger(logger)
+
+PENDING = "pending"
+DEAD = "dead"
+
+
+@dataclass
+class BreakerPolicy:
+    # Consecutive failures for an inbox before its circuit opens
+    threshold: int = 5
+    # Seconds an open circuit holds back deliveries to the inbox
+    cooldown: float = 300.0
+
+
+@dataclass(frozen=True)
+class Delivery:
+    id: int
+    payload_id: int
+    inbox: str
+    attempts: int
+
+
+@dataclass
+class DrainResult:
+    stats: DeliveryStats = field(default_factory=DeliveryStats)
+    # Inboxes with deliveries that exhausted their retries
+    dead: set[str] = field(default_factory=set)
+
+
+class DeliveryQueue:
+    """Durable outbound delivery queue, backed by SQLite.
+
+    Rows stay in the database until they are delivered or dead-lettered,
+    so in-flight deliveries survive a restart. Use ":memory:" for a
+    non-durable queue. Only the most recent `dead_letter_limit` dead
+    letters are kept.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = ":memory:",
+        *,
+        retry: RetryPolicy | None = None,
+        breaker: BreakerPolicy | None = None,
+        dead_letter_limit: int = 1000,
+    ):
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or BreakerPolicy()
+        self.dead_letter_limit = dead_letter_limit
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def enqueue(
+        self,
+        activity: dict[str, Any] | bytes,
+        inboxes: Iterable[str],
+        now: float | None = None,
+    ) -> int:
+        """Queues an activity (or its encoding) for each inbox, except those
+        with an open circuit.
+
+        Returns the payload id.
+        """
+        now = time.time() if now is None else now
+        body = activity if isinstance(activity, bytes) else dumps(activity)
+        with self._db:
+            payload_id = self._db.execute(
+                "INSERT INTO payloads (body) VALUES (?)", (body,)
+            ).lastrowid
+            assert payload_id is not None
+            self._db.executemany(
+                "INSERT INTO deliveries (payload_id, inbox, next_attempt)"
+                " SELECT ?, ?, ? WHERE NOT EXISTS"
+                " (SELECT 1 FROM circuits WHERE inbox = ? AND open_until > ?)",
+                ((payload_id, inbox, now, inbox, now) for inbox in inboxes),
+            )
+            self._release_payload(payload_id)
+        return payload_id
+
+    def due(self, limit: int, now: float | None = None) -> list[Delivery]:
+        """Pending deliveries ready for an attempt, skipping open circuits."""
+        now = time.time() if now is None else now
+        rows = self._db.execute(
+            "SELECT d.id, d.payload_id, d.inbox, d.attempts FROM deliveries d"
+            " LEFT JOIN circuits c ON c.inbox = d.inbox"
+            " WHERE d.state = ? AND d.next_attempt <= ?"
+            " AND (c.open_until IS NULL OR c.open_until <= ?)"
+            " ORDER BY d.next_attempt LIMIT ?",
+            (PENDING, now, now, limit),
+        )
+        return [Delivery(*row) for row in rows]
+
+    def payload(self, payload_id: int) -> bytes:
+        """The encoded activity, as it will be sent."""
+        (body,) = self._db.execute(
+            "SELECT body FROM payloads WHERE id = ?", (payload_id,)
+        ).fetchone()
+        return body.encode() if isinstance(body, str) else body
+
+    def complete(self, delivery: Delivery) -> None:
+        with self._db:
+            self._db.execute("DELETE FROM deliveries WHERE id = ?", (delivery.id,))
+            self._db.execute("DELETE FROM circuits WHERE inbox = ?", (delivery.inbox,))
+            self._release_payload(delivery.payload_id)
+
+    def fail(
+        self, delivery: Delivery, error: Exception, now: float | None = None
+    ) -> bool:
+        """Schedules a retry. Returns True if the delivery was dead-lettered.
+
+        A delivery cancelled while it was in flight is left cancelled.
+        """
+        now = time.time() if now is None else now
+        attempts = delivery.attempts + 1
+        dead = self.retry.exhausted(attempts)
+        with self._db:
+            updated = self._db.execute(
+                "UPDATE deliveries SET attempts = ?, next_attempt = ?, state = ?,"
+                " last_error = ? WHERE id = ?",
+                (
+                    attempts,
+                    now + self.retry.delay(attempts),
+                    DEAD if dead else PENDING,
+                    repr(error),
+                    delivery.id,
+                ),
+            ).rowcount
+            (failures,) = self._db.execute(
+                "INSERT INTO circuits (inbox, failures, open_until) VALUES (?, 1, 0)"
+                " ON CONFLICT (inbox) DO UPDATE SET failures = failures + 1"
+                " RETURNING failures",
+                (delivery.inbox,),
+            ).fetchone()
+            if failures >= self.breaker.threshold:
+                self._db.execute(
+                    "UPDATE circuits SET open_until = ? WHERE inbox = ?",
+                    (now + self.breaker.cooldown, delivery.inbox),
+                )
+        return dead and updated > 0
+
+    def cancel(self, inbox: str) -> int:
+        """Drops the pending deliveries to an inbox. Returns their number."""
+        with self._db:
+            payload_ids = [
+                row[0]
+                for row in self._db.execute(
+                    "DELETE FROM deliveries WHERE inbox = ? AND state = ?"
+                    " RETURNING payload_id",
+                    (inbox, PENDING),
+                )
+            ]
+            for payload_id in set(payload_ids):
+                self._release_payload(payload_id)
+        return len(payload_ids)
+
+    def is_open(self, inbox: str, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        row = self._db.execute(
+            "SELECT open_until FROM circuits WHERE inbox = ?", (inbox,)
+        ).fetchone()
+        return bool(row and row[0] > now)
+
+    def dead_letters(self) -> Iterator[tuple[str, dict[str, Any], str]]:
+        """Yields (inbox, activity, last error) for dead-lettered deliveries."""
+        cursor = self._db.execute(
+            "SELECT d.inbox, p.body, d.last_error FROM deliveries d"
+            " JOIN payloads p ON p.id = d.payload_id WHERE d.state = ?",
+            (DEAD,),
+        )
+        for inbox, body, last_error in cursor:
+            yield inbox, loads(body), last_error
+
+    def purge_dead(self) -> int:
+        with self._db:
+            payload_ids = [
+                row[0]
+                for row in self._db.execute(
+                    "SELECT DISTINCT payload_id FROM deliveries WHERE state = ?",
+                    (DEAD,),
+                )
+            ]
+            count = self._db.execute(
+                "DELETE FROM deliveries WHERE state = ?", (DEAD,)
+            ).rowcount
+            for payload_id in payload_ids:
+                self._release_payload(payload_id)
+        return count
+
+    def trim_dead(self, keep: int) -> int:
+        """Purges all but the `keep` most recent dead letters."""
+        with self._db:
+            payload_ids = [
+                row[0]
+                for row in self._db.execute(
+                    "DELETE FROM deliveries WHERE state = ? AND id NOT IN"
+                    " (SELECT id FROM deliveries WHERE state = ?"
+                    " ORDER BY id DESC LIMIT ?) RETURNING payload_id",
+                    (DEAD, DEAD, keep),
+                )
+            ]
+            for payload_id in set(payload_ids):
+                self._release_payload(payload_id)
+        return len(payload_ids)
+
+    def pending_count(self) -> int:
+        return self._db.execute(
+            "SELECT COUNT(*) FROM deliveries WHERE state = ?", (PENDING,)
+        ).fetchone()[0]
+
+    def _release_payload(self, payload_id: int) -> None:
+        self._db.execute(
+            "DELETE FROM payloads WHERE id = ? AND NOT EXISTS"
+            " (SELECT 1 FROM deliveries WHERE payload_id = ?)",
+            (payload_id, payload_id),
+        )
+
+    async def drain(
+        self,
+        client: httpx.AsyncClient,
+        config: DeliveryConfig | None = None,
+        *,
+        batch_size: int = 1000,
+        signer_for: Callable[[str], Signer | None] | None = None,
+    ) -> DrainResult:
+        """Attempts due deliveries, a batch at a time, until none are due
+        or the config deadline passes.
+
+        Deliveries are signed for their activity's actor by `signer_for`.
+        Dead letters beyond `dead_letter_limit` are purged afterwards.
+        """
+        config = config or DeliveryConfig()
+        sign = None if signer_for is None else FanoutSigner(signer_for)
+        result = DrainResult()
+        deadline = (
+            None if config.deadline is None else time.monotonic() + config.deadline
+        )
+        # Retries are always scheduled after `started`, so each due
+        # delivery is attempted at most once per drain
+        started = time.time()
+        dead_lettered = 0
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            batch = self.due(batch_size, now=started)
+            if not batch:
+                break
+            payloads = {
+                payload_id: self.payload(payload_id)
+                for payload_id in {d.payload_id for d in batch}
+            }
+            deliveries = {d.id: d for d in batch}
+            batch_result = await deliver_jobs(
+                client,
+                (DeliveryJob(d.id, d.inbox, payloads[d.payload_id]) for d in batch),
+                DeliveryConfig(config.concurrency, config.per_host, remaining),
+                sign,
+            )
+            for delivery_id, delivery in deliveries.items():
+                if delivery_id in batch_result.expired:
+                    continue
+                ex = batch_result.failures.get(delivery_id)
+                if ex is None:
+                    self.complete(delivery)
+                else:
+                    failure_log.warning("Delivery to %s failed: %r", delivery.inbox, ex)
+                    if self.fail(delivery, ex):
+                        dead_lettered += 1
+                        result.dead.add(delivery.inbox)
+            result.stats.add(batch_result.stats)
+            if batch_result.expired:
+                break
+        if dead_lettered:
+            # One line per drain, however many deliveries gave up
+            logger.error(
+                "%d deliveries to %d inboxes dead-lettered",
+                dead_lettered,
+                len(result.dead),
+            )
+            self.trim_dead(self.dead_letter_limit)
+        return result
@@ -0,0 +1,202 @@
+import hashlib
+import sqlite3
+from collections.abc import AsyncIterator, Iterator
+from pathlib import Path
+from typing import Any
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+from activitypub_mincore.support.serialization import ACTIVITY_CONTENT_TYPE, dumps
+
+_SCHEMA = """
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner TEXT NOT NULL,
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_owner ON outbox(owner, seq);
+"""
+
+AS_CONTEXT = "https://www.w3.org/ns/activitystreams"
+
+
+class Outbox:
+    """The most recent activities published by each local actor.
+
+    Activities are stored encoded, in order, keeping the latest `capacity`
+    for each actor. Pages are selected by sequence number (keyset
+    pagination), so serving one doesn't depend on the size of the history.
+    """
+
+    def __init__(
+        self, path: str | Path = ":memory:", capacity: int = 1000, page_size: int = 20
+    ):
+        self.capacity = capacity
+        self.page_size = page_size
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def append(self, owner: str, activity: bytes) -> int:
+        """Adds an encoded activity, dropping the owner's oldest beyond capacity."""
+        with self._db:
+            seq = self._db.execute(
+                "INSERT INTO outbox (owner, body) VALUES (?, ?)", (owner, activity)
+            ).lastrowid
+            assert seq is not None
+            # Sequence numbers are shared by all owners, so the owner's
+            # oldest kept item is found by position
+            self._db.execute(
+                "DELETE FROM outbox WHERE owner = ? AND seq <= ("
+                "SELECT seq FROM outbox WHERE owner = ?"
+                " ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                (owner, owner, self.capacity),
+            )
+        return seq
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def count(self, owner: str) -> int:
+        return self._db.execute(
+            "SELECT COUNT(*) FROM outbox WHERE owner = ?", (owner,)
+        ).fetchone()[0]
+
+    def bounds(self, owner: str) -> tuple[int | None, int | None]:
+        """The owner's oldest and newest sequence numbers."""
+        return self._db.execute(
+            "SELECT MIN(seq), MAX(seq) FROM outbox WHERE owner = ?", (owner,)
+        ).fetchone()
+
+    def page_seqs(
+        self,
+        owner: str,
+        *,
+        max_seq: int | None = None,
+        min_seq: int | None = None,
+        limit: int,
+    ) -> list[int]:
+        """Sequence numbers of a page, newest first.
+
+        A page is the newest items older than `max_seq` or, with `min_seq`,
+        the oldest items newer than it.
+        """
+        if min_seq is not None:
+            rows = self._db.execute(
+                "SELECT seq FROM outbox WHERE owner = ? AND seq > ?"
+                " ORDER BY seq LIMIT ?",
+                (owner, min_seq, limit),
+            ).fetchall()
+            return [seq for (seq,) in reversed(rows)]
+        cursor = self._db.execute(
+            "SELECT seq FROM outbox WHERE owner = ? AND seq < ?"
+            " ORDER BY seq DESC LIMIT ?",
+            (owner, max_seq if max_seq is not None else 2**63 - 1, limit),
+        )
+        return [seq for (seq,) in cursor]
+
+    def bodies(self, owner: str, newest: int, oldest: int) -> Iterator[bytes]:
+        """Encoded activities from `newest` back to `oldest`, streamed."""
+        for (body,) in self._db.cursor().execute(
+            "SELECT body FROM outbox WHERE owner = ? AND seq BETWEEN ? AND ?"
+            " ORDER BY seq DESC",
+            (owner, oldest, newest),
+        ):
+            yield body
+
+    def clear(self) -> None:
+        with self._db:
+            self._db.execute("DELETE FROM outbox")
+
+
+def _etag(*parts: Any) -> str:
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags or "*" in tags
+
+
+def _int_param(request: Request, name: str) -> int | None:
+    value = request.query_params.get(name)
+    return int(value) if value is not None and value.isdigit() else None
+
+
+def _bool_param(request: Request, name: str) -> bool:
+    value = request.query_params.get(name)
+    return value is not None and value.lower() in ("true", "1")
+
+
+async def get__outbox(
+    outbox: Outbox, request: Request, local_actor: dict[str, Any]
+) -> Response:
+    """Serves an actor's outbox: the collection, or one of its pages.
+
+    The collection links to pages at ?page=true (the newest), and pages
+    link to each other with ?max_id=SEQ (older) and ?min_id=SEQ (newer).
+    Without either, or with ?page=false, the collection is served.
+    """
+    outbox_uri = local_actor["outbox"]
+    owner = local_actor["id"]
+    max_seq = _int_param(request, "max_id")
+    min_seq = _int_param(request, "min_id")
+    headers = {"Cache-Control": "no-cache"}
+
+    if max_seq is None and min_seq is None and not _bool_param(request, "page"):
+        oldest, newest = outbox.bounds(owner)
+        headers["ETag"] = etag = _etag(owner, oldest, newest)
+        if _not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
+        collection = {
+            "@context": AS_CONTEXT,
+            "id": outbox_uri,
+            "type": "OrderedCollection",
+            "totalItems": outbox.count(owner),
+            "first": f"{outbox_uri}?page=true",
+        }
+        return Response(
+            dumps(collection), media_type=ACTIVITY_CONTENT_TYPE, headers=headers
+        )
+
+    if min_seq is None:
+        # One extra, to know whether there is a next (older) page
+        seqs = outbox.page_seqs(owner, max_seq=max_seq, limit=outbox.page_size + 1)
+        has_next = len(seqs) > outbox.page_size
+        seqs = seqs[: outbox.page_size]
+    else:
+        seqs = outbox.page_seqs(owner, min_seq=min_seq, limit=outbox.page_size)
+        oldest = outbox.bounds(owner)[0]
+        has_next = bool(seqs) and oldest is not None and oldest < seqs[-1]
+    headers["ETag"] = etag = _etag(owner, seqs, has_next)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    page: dict[str, Any] = {
+        "@context": AS_CONTEXT,
+        "id": str(request.url),
+        "type": "OrderedCollectionPage",
+        "partOf": outbox_uri,
+    }
+    if seqs:
+        page["prev"] = f"{outbox_uri}?min_id={seqs[0]}"
+        if has_next:
+            page["next"] = f"{outbox_uri}?max_id={seqs[-1]}"
+
+    async def stream() -> AsyncIterator[bytes]:
+        # The page's members are written as stored, without decoding them
+        yield dumps(page)[:-1] + b',"orderedItems":['
+        if seqs:
+            for n, body in enumerate(outbox.bodies(owner, seqs[0], seqs[-1])):
+                yield b"," + body if n else body
+        yield b"]}"
+
+    return StreamingResponse(
+        stream(), media_type=ACTIVITY_CONTENT_TYPE, headers=headers
+    )
@@ -0,0 +1,63 @@
+import asyncio
+import time
+from collections.abc import Hashable
+
+from activitypub_mincore.support.cache import LRUCache
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float | None = None):
+        # tokens per second
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, now: float | None = None) -> bool:
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now: float | None = None) -> float:
+        """Seconds until a token is available."""
+        self._refill(time.monotonic() if now is None else now)
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate > 0 else 0.0
+
+    async def acquire(self) -> None:
+        while not self.try_acquire():
+            await asyncio.sleep(self.wait_time())
+
+
+class RateLimiter:
+    """Token buckets by key (host, actor, ...).
+
+    Buckets are kept in an LRU, so memory is bounded however many keys are
+    seen. An evicted key starts again with a full bucket.
+    """
+
+    def __init__(self, rate: float, burst: float, maxsize: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.buckets: LRUCache[Hashable, TokenBucket] = LRUCache(maxsize)
+
+    def bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self.buckets.set(key, bucket)
+        return bucket
+
+    def try_acquire(self, key: Hashable) -> bool:
+        return self.bucket(key).try_acquire()
+
+    def wait_time(self, key: Hashable) -> float:
+        return self.bucket(key).wait_time()
+
+    async def acquire(self, key: Hashable) -> None:
+        await self.bucket(key).acquire()
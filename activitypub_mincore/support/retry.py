@@ -0,0 +1,24 @@
+import random
+from dataclasses import dataclass
+
+
+@dataclass
+class RetryPolicy:
+    # Delay before the first retry, in seconds
+    base: float = 1.0
+    # Upper bound for any single delay, in seconds
+    cap: float = 3600.0
+    # Attempts (including the first) before giving up
+    max_attempts: int = 12
+
+    def delay(self, attempt: int) -> float:
+        """Exponential backoff with jitter for the given (1-based) attempt.
+
+        Half of the delay is fixed and half is random, so retries from many
+        clients spread out without ever retrying immediately.
+        """
+        ceiling = min(self.cap, self.base * 2 ** max(0, attempt - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def exhausted(self, attempts: int) -> bool:
+        return attempts >= self.max_attempts
@@ -0,0 +1,95 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections.abc import Awaitable, Callable
+
+from activitypub_mincore.support.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger("schedule")
+
+CYCLE_SECONDS = Histogram(
+    "mincore_publish_cycle_seconds", "Duration of publication cycles"
+)
+CYCLE_LAG = Gauge(
+    "mincore_publish_lag_seconds", "How late the last scheduled cycle started"
+)
+TICKS_SKIPPED = Counter(
+    "mincore_publish_ticks_skipped_total", "Ticks skipped while a cycle overran"
+)
+
+
+class PublishScheduler:
+    """Runs publication cycles at a fixed rate, one at a time.
+
+    Ticks are `interval` seconds apart. When a cycle overruns, the ticks it
+    missed are skipped rather than run back to back, so a slow fan-out
+    lowers the publication rate instead of building a backlog. `trigger`
+    starts a cycle without waiting for the next tick; triggers during a
+    cycle are coalesced into one more cycle. With no interval, cycles only
+    run when triggered.
+    """
+
+    def __init__(
+        self, cycle: Callable[[], Awaitable[None]], interval: float | None = 5.0
+    ):
+        self.cycle = cycle
+        self.interval = interval
+        self.cycles = 0
+        self.skipped = 0
+        # Seconds between a tick and its cycle starting
+        self.lag = 0.0
+        self.last_duration = 0.0
+        self._triggered = asyncio.Event()
+
+    def trigger(self) -> None:
+        self._triggered.set()
+
+    async def _wait(self, next_tick: float | None) -> None:
+        """Waits for the next tick or a trigger."""
+        timeout = None if next_tick is None else next_tick - time.monotonic()
+        if timeout is None or timeout > 0:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._triggered.wait(), timeout)
+        self._triggered.clear()
+
+    async def run(self) -> None:
+        # Bound to the running loop, keeping any trigger made before running
+        triggered, self._triggered = self._triggered.is_set(), asyncio.Event()
+        if triggered:
+            self._triggered.set()
+        next_tick = time.monotonic() if self.interval else None
+        while True:
+            await self._wait(next_tick)
+            started = time.monotonic()
+            if self.interval and next_tick is None:
+                next_tick = started
+            # Whether this cycle serves the tick (rather than only a trigger)
+            on_tick = False
+            if next_tick is not None and next_tick <= started:
+                on_tick = True
+                self.lag = started - next_tick
+                CYCLE_LAG.set(self.lag)
+            try:
+                await self.cycle()
+            except Exception as ex:
+                logger.error("Publication cycle failed: %r", ex, exc_info=ex)
+            finished = time.monotonic()
+            self.cycles += 1
+            self.last_duration = finished - started
+            CYCLE_SECONDS.observe(self.last_duration)
+            if not self.interval:
+                next_tick = None
+                continue
+            assert next_tick is not None
+            if on_tick:
+                next_tick += self.interval
+            if next_tick <= finished:
+                missed = int((finished - next_tick) // self.interval) + 1
+                next_tick += missed * self.interval
+                self.skipped += missed
+                TICKS_SKIPPED.inc(missed)
+                logger.warning(
+                    f"Publication cycle took {self.last_duration:.3f}s,"
+                    f" skipped {missed} ticks"
+                )
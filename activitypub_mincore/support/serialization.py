@@ -0,0 +1,40 @@
+"""JSON encoding and decoding, using orjson when it's installed."""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
+ACTIVITY_CONTENT_TYPE = "application/activity+json"
+
+ACTIVITY_HEADERS = {"Content-Type": ACTIVITY_CONTENT_TYPE}
+
+
+if orjson is not None:
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def canonical_dumps(obj: Any) -> bytes:
+        """Encoding with sorted keys, so equal documents encode identically."""
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+
+    def loads(data: bytes | bytearray | memoryview | str) -> Any:
+        return orjson.loads(data)
+
+else:
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+    def canonical_dumps(obj: Any) -> bytes:
+        """Encoding with sorted keys, so equal documents encode identically."""
+        return json.dumps(
+            obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+        ).encode()
+
+    def loads(data: bytes | bytearray | memoryview | str) -> Any:
+        return json.loads(bytes(data) if isinstance(data, memoryview) else data)
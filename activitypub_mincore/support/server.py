@@ -1,24 +1,39 @@
 import asyncio
 import logging
+import socket
 import sys
-from typing import Awaitable
+from collections.abc import Coroutine
+from typing import Any
 
 import uvicorn
 
+from activitypub_mincore.support.client import (
+    HttpClientConfig,
+    close_client,
+    open_client,
+)
+
 logging.basicConfig(
     stream=sys.stdout,
     level=logging.INFO,
     format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
 )
+# httpx logs every request at INFO, and deliveries are counted in the
+# metrics instead (failures are logged, sampled, by the delivery code)
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 
 class Server(uvicorn.Server):
     def __init__(
-        self, config: uvicorn.Config, background_tasks: list[Awaitable] | None = None
+        self,
+        config: uvicorn.Config,
+        background_tasks: list[Coroutine[Any, Any, Any]] | None = None,
+        http_config: HttpClientConfig | None = None,
     ):
         logging.getLogger("uvicorn.error").name = "uvicorn"
         super().__init__(config)
         self.background_tasks = background_tasks or []
+        self.http_config = http_config
         self.tasks: list[asyncio.Task] = []
 
     def handle_exit(self, sig: int, frame) -> None:
@@ -28,9 +43,14 @@ class Server(uvicorn.Server):
                     task.cancel()
         return super().handle_exit(sig, frame)
 
-    async def run(self):
-        self.server_task = asyncio.create_task(self.serve())
-        self.tasks = [self.server_task] + [
-            asyncio.create_task(t) for t in self.background_tasks
-        ]
-        await asyncio.wait(self.tasks)
+    async def run(self, sockets: list[socket.socket] | None = None):  # type: ignore[override]
+        # Outbound requests share one pooled client for the server's lifetime
+        open_client(self.http_config)
+        try:
+            self.server_task = asyncio.create_task(self.serve(sockets))
+            self.tasks = [self.server_task] + [
+                asyncio.create_task(t) for t in self.background_tasks
+            ]
+            await asyncio.wait(self.tasks)
+        finally:
+            await close_client()
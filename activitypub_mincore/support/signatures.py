@@ -0,0 +1,465 @@
+"""HTTP Signatures, as used between ActivityPub servers.
+
+Requests are signed with rsa-sha256 (draft-cavage-http-signatures) over
+the request target, Host, Date and, for requests with a body, a SHA-256
+Digest of the body. Signing and verification run in threads, off the
+event loop. Requires the optional `cryptography` package.
+"""
+
+import asyncio
+import base64
+import email.utils
+import hashlib
+import os
+import tempfile
+import time
+from collections.abc import Awaitable, Callable, Mapping
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlparse
+
+import fastapi
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from activitypub_mincore.support.cache import LRUCache
+from activitypub_mincore.support.metrics import Counter
+from activitypub_mincore.support.serialization import loads
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+except ImportError:  # pragma: no cover
+    rsa = None  # type: ignore[assignment]
+
+VERIFICATIONS = Counter(
+    "mincore_signature_verifications_total",
+    "Inbox POST signature checks by result",
+    ("result",),
+)
+
+# Headers covered by our signatures ("digest" only with a body)
+SIGNED_HEADERS = ("(request-target)", "host", "date", "digest")
+
+
+class SignatureError(Exception):
+    pass
+
+
+@dataclass
+class SignatureConfig:
+    # Directory of the local actors' private keys (generated for each run
+    # without one)
+    key_dir: str | None = None
+    # Whether unsigned inbox POSTs are refused
+    required: bool = False
+
+
+def available() -> bool:
+    return rsa is not None
+
+
+def body_digest(body: bytes) -> str:
+    return "SHA-256=" + base64.b64encode(hashlib.sha256(body).digest()).decode()
+
+
+def http_date(now: float | None = None) -> str:
+    return email.utils.formatdate(now, usegmt=True)
+
+
+def signing_string(
+    method: str, target: str, headers: Mapping[str, str], signed: list[str]
+) -> bytes:
+    """The text a signature covers: each signed header, in order."""
+    lines = []
+    for name in signed:
+        if name == "(request-target)":
+            lines.append(f"(request-target): {method.lower()} {target}")
+        elif name in headers:
+            lines.append(f"{name}: {headers[name]}")
+        else:
+            raise SignatureError(f"Signed header missing: {name}")
+    return "\n".join(lines).encode()
+
+
+def parse_signature(header: str) -> dict[str, str]:
+    """The parameters of a Signature header."""
+    params = {}
+    for param in header.split(","):
+        name, _, value = param.strip().partition("=")
+        if name:
+            params[name] = value.strip('"')
+    for name in ("keyId", "signature"):
+        if not params.get(name):
+            raise SignatureError(f"Signature has no {name}")
+    return params
+
+
+def generate_private_key() -> Any:
+    if rsa is None:
+        raise SignatureError("HTTP Signatures require the cryptography package")
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def load_or_create_private_key(path: str | Path) -> Any:
+    """Loads a PEM private key, creating it first if there's none.
+
+    Processes sharing a key directory all end up using the same key.
+    """
+    path = Path(path)
+    if not path.exists():
+        key = generate_private_key()
+        pem = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent)
+        try:
+            os.fchmod(fd, 0o600)
+            os.write(fd, pem)
+            os.close(fd)
+            # Fails if another process created the key meanwhile
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(temp_path)
+    return serialization.load_pem_private_key(path.read_bytes(), password=None)
+
+
+def public_key_pem(private_key: Any) -> str:
+    return (
+        private_key.public_key()
+        .public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        .decode()
+    )
+
+
+class Signer:
+    """Signs requests on behalf of one actor.
+
+    The private key may instead be loaded by `load_key`, called (in a
+    thread) when the first request is signed.
+    """
+
+    def __init__(
+        self,
+        key_id: str,
+        private_key: Any = None,
+        *,
+        load_key: Callable[[], Any] | None = None,
+    ):
+        if private_key is None and load_key is None:
+            raise ValueError("A private key or a way to load it is required")
+        self.key_id = key_id
+        self._private_key = private_key
+        self._load_key = load_key
+
+    @property
+    def private_key(self) -> Any:
+        if self._private_key is None:
+            assert self._load_key is not None
+            self._private_key = self._load_key()
+        return self._private_key
+
+    def _sign(self, data: bytes) -> str:
+        signature = self.private_key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+        return base64.b64encode(signature).decode()
+
+    async def headers(
+        self,
+        method: str,
+        url: str,
+        body: bytes | None = None,
+        *,
+        digest: str | None = None,
+        date: str | None = None,
+    ) -> dict[str, str]:
+        """The Host, Date, Digest and Signature headers for a request."""
+        url_parts = urlparse(url)
+        target = url_parts.path or "/"
+        if url_parts.query:
+            target += f"?{url_parts.query}"
+        headers = {"host": url_parts.netloc, "date": date or http_date()}
+        signed = list(SIGNED_HEADERS)
+        if body is None:
+            signed.remove("digest")
+        else:
+            headers["digest"] = digest or body_digest(body)
+        data = signing_string(method, target, headers, signed)
+        signature = await asyncio.to_thread(self._sign, data)
+        headers["signature"] = (
+            f'keyId="{self.key_id}",algorithm="rsa-sha256",'
+            f'headers="{" ".join(signed)}",signature="{signature}"'
+        )
+        return {name.title(): value for name, value in headers.items()}
+
+
+class FanoutSigner:
+    """Signs the deliveries of one fan-out.
+
+    The Date, and each body's Digest and signer, are worked out once for
+    the fan-out. Only the signature itself, which covers the inbox, is
+    computed for each delivery.
+    """
+
+    def __init__(self, signer_for: Callable[[str], Signer | None]):
+        self.signer_for = signer_for
+        self.date = http_date()
+        # body -> (Digest, signer of the body's actor)
+        self._bodies: dict[bytes, tuple[str, Signer | None]] = {}
+
+    def _prepare(self, body: bytes) -> tuple[str, Signer | None]:
+        prepared = self._bodies.get(body)
+        if prepared is None:
+            try:
+                actor = loads(body).get("actor")
+            except (ValueError, AttributeError):
+                actor = None
+            signer = self.signer_for(actor) if isinstance(actor, str) else None
+            prepared = self._bodies[body] = (body_digest(body), signer)
+        return prepared
+
+    async def __call__(self, inbox: str, body: bytes) -> dict[str, str]:
+        digest, signer = self._prepare(body)
+        if signer is None:
+            return {}
+        return await signer.headers("POST", inbox, body, digest=digest, date=self.date)
+
+
+@dataclass
+class PublicKey:
+    owner: str
+    key: Any
+    # When it was taken from its actor's document (time.monotonic)
+    fetched: float
+
+
+class PublicKeyCache:
+    """Remote actors' public keys by key id, taken from their documents.
+
+    Key ids that couldn't be found are remembered for `fetch_interval`
+    seconds, and so are cached keys too recently fetched to refresh, so
+    neither can make us fetch documents over and over.
+    """
+
+    def __init__(
+        self, maxsize: int = 10_000, ttl: float = 3600.0, fetch_interval: float = 60.0
+    ):
+        self.ttl = ttl
+        self.fetch_interval = fetch_interval
+        self.keys: LRUCache[str, PublicKey] = LRUCache(maxsize)
+        # key id -> when it was last looked for and not found
+        self._unknown: LRUCache[str, float] = LRUCache(maxsize)
+
+    def add_actor(self, actor: dict[str, Any], uri: str) -> None:
+        """Keeps the public key of an actor document fetched from `uri`.
+
+        Only the document's own key is kept: the document's id must be
+        `uri`, the key's owner must be the actor, and the key's id must be
+        on the actor's origin, so a document can't provide keys for other
+        actors. The key's id needn't be a fragment of the actor's.
+        """
+        public_key = actor.get("publicKey")
+        if rsa is None or not isinstance(public_key, dict):
+            return
+        actor_id = actor.get("id")
+        key_id, pem = public_key.get("id"), public_key.get("publicKeyPem")
+        if not isinstance(key_id, str) or not isinstance(pem, str):
+            return
+        if (
+            actor_id != uri
+            or urlparse(key_id)[:2] != urlparse(uri)[:2]
+            or public_key.get("owner", uri) != uri
+        ):
+            return
+        try:
+            key = serialization.load_pem_public_key(pem.encode())
+        except ValueError:
+            return
+        self.keys.set(key_id, PublicKey(uri, key, time.monotonic()))
+        self._unknown.pop(key_id)
+
+    def get(self, key_id: str) -> PublicKey | None:
+        public_key = self.keys.get(key_id)
+        if public_key is not None and public_key.fetched + self.ttl <= time.monotonic():
+            self.keys.pop(key_id)
+            return None
+        return public_key
+
+    def discard(self, key_id: str) -> None:
+        self.keys.pop(key_id)
+
+    def is_recent(self, public_key: PublicKey) -> bool:
+        """Whether the key was fetched too recently to fetch it again."""
+        return time.monotonic() - public_key.fetched < self.fetch_interval
+
+    def add_unknown(self, key_id: str) -> None:
+        self._unknown.set(key_id, time.monotonic())
+
+    def is_unknown(self, key_id: str) -> bool:
+        """Whether the key was recently looked for and not found."""
+        failed = self._unknown.get(key_id)
+        return failed is not None and time.monotonic() - failed < self.fetch_interval
+
+    def clear(self) -> None:
+        self.keys.clear()
+        self._unknown.clear()
+
+
+# Looks up a public key by key id, fetching its actor (again, when refreshing)
+KeyLookup = Callable[[str, bool], Awaitable[PublicKey]]
+
+
+class SignatureVerifier:
+    def __init__(
+        self,
+        get_key: KeyLookup,
+        *,
+        required: bool = False,
+        max_skew: float = 3600.0,
+        min_refresh: float = 60.0,
+    ):
+        self.get_key = get_key
+        self.required = required
+        # Seconds a request's Date may be from our clock
+        self.max_skew = max_skew
+        # Seconds before a key that fails to verify may be fetched again, so
+        # bad signatures can't make us fetch actors over and over
+        self.min_refresh = min_refresh
+
+    def _check_date(self, headers: Mapping[str, str]) -> None:
+        try:
+            date = email.utils.parsedate_to_datetime(headers["date"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            raise SignatureError("Missing or invalid Date") from None
+        if abs(time.time() - date) > self.max_skew:
+            raise SignatureError("Date is too far from the current time")
+
+    async def verify(self, method: str, target: str, headers: Mapping[str, str]) -> str:
+        """Checks a request's signature and returns the key's owner.
+
+        Bodies must be checked against the signed Digest separately.
+        """
+        params = parse_signature(headers.get("signature", ""))
+        if params.get("algorithm", "rsa-sha256") not in ("rsa-sha256", "hs2019"):
+            raise SignatureError(f"Unsupported algorithm: {params['algorithm']}")
+        signed = params.get("headers", "date").lower().split()
+        for required in ("(request-target)", "host", "date"):
+            if required not in signed:
+                raise SignatureError(f"{required} must be signed")
+        if method.upper() == "POST" and "digest" not in signed:
+            raise SignatureError("digest must be signed")
+        self._check_date(headers)
+        data = signing_string(method, target, headers, signed)
+        try:
+            signature = base64.b64decode(params["signature"], validate=True)
+        except ValueError:
+            raise SignatureError("Malformed signature") from None
+        public_key = await self.get_key(params["keyId"], False)
+        if not await asyncio.to_thread(_verify, public_key, signature, data):
+            # The key may have been rotated since it was cached
+            if time.monotonic() - public_key.fetched < self.min_refresh:
+                raise SignatureError("Invalid signature")
+            public_key = await self.get_key(params["keyId"], True)
+            if not await asyncio.to_thread(_verify, public_key, signature, data):
+                raise SignatureError("Invalid signature")
+        return public_key.owner
+
+
+def _verify(public_key: PublicKey, signature: bytes, data: bytes) -> bool:
+    try:
+        public_key.key.verify(signature, data, padding.PKCS1v15(), hashes.SHA256())
+        return True
+    except InvalidSignature:
+        return False
+
+
+class SignatureMiddleware:
+    """Verifies the signatures of inbox POSTs.
+
+    The signed headers are checked before the body is read, and the body
+    against the signed Digest as it's read. The key's owner is kept as
+    `request.state.signer`, to be matched with the activity's actor (see
+    `check_signer`). Unsigned POSTs are refused only when signatures are
+    required.
+
+    Verifying may fetch the sender's key, so only POSTs to paths for which
+    `inbox_owner` returns a local actor are verified. Others are passed on
+    to be refused by the app.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        verifier: SignatureVerifier,
+        inbox_owner: Callable[[str], dict[str, Any] | None],
+    ):
+        self.app = app
+        self.verifier = verifier
+        self.inbox_owner = inbox_owner
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or self.inbox_owner(scope["path"]) is None
+        ):
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if "signature" not in headers or not available():
+            if self.verifier.required:
+                VERIFICATIONS.inc(result="unsigned")
+                await Response("Signature required", 401)(scope, receive, send)
+                return
+            await self.app(scope, receive, send)
+            return
+        target = scope["path"]
+        if scope.get("query_string"):
+            target += f"?{scope['query_string'].decode()}"
+        try:
+            signer = await self.verifier.verify(scope["method"], target, headers)
+            algorithm, _, expected = headers.get("digest", "").partition("=")
+            if algorithm.upper() != "SHA-256":
+                raise SignatureError("Unsupported Digest")
+        except SignatureError as ex:
+            VERIFICATIONS.inc(result="invalid")
+            await Response(f"Invalid signature: {ex}", 401)(scope, receive, send)
+            return
+        except Exception as ex:  # noqa: BLE001
+            # Typically, the key couldn't be fetched. Whatever the key lookup
+            # raises refuses the request, rather than failing it with a 500
+            VERIFICATIONS.inc(result="error")
+            await Response(f"Unverifiable signature: {ex!r}", 401)(scope, receive, send)
+            return
+        VERIFICATIONS.inc(result="valid")
+        scope.setdefault("state", {})["signer"] = signer
+        digest = hashlib.sha256()
+
+        async def receive_checked() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                digest.update(message.get("body", b""))
+                if not message.get("more_body", False):
+                    actual = base64.b64encode(digest.digest()).decode()
+                    if actual != expected:
+                        raise fastapi.HTTPException(401, "Digest mismatch")
+            return message
+
+        await self.app(scope, receive_checked, send)
+
+
+def check_signer(request: fastapi.Request, activity: dict[str, Any]) -> None:
+    """Refuses activities sent by an actor other than the signer."""
+    signer = getattr(request.state, "signer", None)
+    if signer is not None and activity.get("actor") != signer:
+        raise fastapi.HTTPException(401, "Activity actor doesn't match signer")
@@ -0,0 +1,188 @@
+"""Storage for the activities a follower receives.
+
+`SegmentSink` appends them as JSON Lines to segment files, written in
+batches by a background task, so the inbox handlers only encode and
+buffer them. Each batch is written and fsynced at once (group commit)
+when it reaches `flush_bytes` or has waited `flush_interval` seconds.
+"""
+
+import asyncio
+import contextlib
+import logging
+import mmap
+import os
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from activitypub_mincore.support.metrics import Counter, Gauge, Histogram
+from activitypub_mincore.support.serialization import dumps, loads
+
+logger = logging.getLogger("sink")
+
+SINK_RECORDS = Counter("mincore_sink_records_total", "Activities written to the sink")
+SINK_FLUSH_SECONDS = Histogram(
+    "mincore_sink_flush_seconds", "Time to write and fsync a batch of activities"
+)
+SINK_BUFFERED = Gauge("mincore_sink_buffered_bytes", "Activities waiting to be written")
+
+SEGMENT_SUFFIX = ".jsonl"
+
+
+class ActivitySink(ABC):
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    @abstractmethod
+    async def write(self, activity: dict[str, Any]) -> None:
+        """Stores an activity, waiting only when the sink is backed up."""
+
+
+class SegmentSink(ActivitySink):
+    """Appends activities to JSON Lines segment files in a directory.
+
+    A new segment is started once the current one reaches `segment_size`
+    bytes. Segments are named by creation time and process id, so workers
+    sharing the directory never write to the same file, and sorting the
+    names orders them. Writers wait when `max_buffer` bytes are waiting to
+    be written.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        *,
+        segment_size: int = 64 << 20,
+        flush_bytes: int = 1 << 20,
+        flush_interval: float = 1.0,
+        max_buffer: int = 16 << 20,
+    ):
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: list[bytes] = []
+        self._buffered = 0
+        self._segment: BinaryIO | None = None
+        self._segment_bytes = 0
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        if not self.running:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._stopping = False
+            self._ready = asyncio.Event()
+            self._space = asyncio.Event()
+            self._space.set()
+            self._task = asyncio.create_task(self._run())
+            SINK_BUFFERED.set_function(lambda: self._buffered)
+
+    async def stop(self) -> None:
+        """Writes what's buffered and closes the current segment."""
+        if self._task is not None:
+            # Not cancelled, so a batch being written isn't written twice
+            self._stopping = True
+            self._ready.set()
+            await self._task
+            self._task = None
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    async def write(self, activity: dict[str, Any]) -> None:
+        if not self.running:
+            raise RuntimeError("Activity sink is not running")
+        while self._buffered >= self.max_buffer:
+            await self._space.wait()
+        line = dumps(activity) + b"\n"
+        self._buffer.append(line)
+        self._buffered += len(line)
+        if self._buffered >= self.max_buffer:
+            self._space.clear()
+            self._ready.set()
+        elif self._buffered >= self.flush_bytes:
+            self._ready.set()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._ready.wait(), self.flush_interval)
+            self._ready.clear()
+            await self._flush()
+        await self._flush()
+
+    async def _flush(self) -> None:
+        if not self._buffer:
+            return
+        batch, self._buffer, self._buffered = self._buffer, [], 0
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+            SINK_RECORDS.inc(len(batch))
+        except OSError as ex:
+            logger.error("Writing %d activities failed: %r", len(batch), ex)
+        finally:
+            SINK_FLUSH_SECONDS.observe(time.perf_counter() - start)
+            self._space.set()
+
+    def _sync(self) -> None:
+        assert self._segment is not None
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+
+    def _write_batch(self, batch: list[bytes]) -> None:
+        for line in batch:
+            if self._segment is not None and (
+                self._segment_bytes + len(line) > self.segment_size
+                and self._segment_bytes
+            ):
+                self._sync()
+                self._segment.close()
+                self._segment = None
+            if self._segment is None:
+                name = f"{time.time_ns():020d}-{os.getpid()}{SEGMENT_SUFFIX}"
+                # Held open across batches, and closed when the segment is
+                # full or the sink stops
+                self._segment = open(self.directory / name, "ab")  # noqa: SIM115
+                self._segment_bytes = 0
+            self._segment.write(line)
+            self._segment_bytes += len(line)
+        self._sync()
+
+
+def segment_paths(directory: str | Path) -> list[Path]:
+    """A sink directory's segments, oldest first."""
+    return sorted(Path(directory).glob(f"*{SEGMENT_SUFFIX}"))
+
+
+def read_segment(path: str | Path) -> Iterator[bytes]:
+    """The encoded activities in a segment, read through a memory map.
+
+    A last line without a newline, left by an interrupted write, is skipped.
+    """
+    with open(path, "rb") as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            while (end := data.find(b"\n", start)) != -1:
+                yield data[start:end]
+                start = end + 1
+
+
+def replay(directory: str | Path) -> Iterator[dict[str, Any]]:
+    """Every activity stored in a sink directory, oldest segment first."""
+    for path in segment_paths(directory):
+        for line in read_segment(path):
+            yield loads(line)
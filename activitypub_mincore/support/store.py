@@ -0,0 +1,257 @@
+import sqlite3
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from pathlib import Path
+
+from bidict import bidict
+
+
+class FollowerStore(ABC):
+    """The followers of a publishing actor.
+
+    Each follower is identified by its inbox and remembers the id of the
+    Follow activity that created it and, optionally, a shared inbox used to
+    deliver to it. An instance hosting several actors keeps each actor's
+    followers in a store from `for_owner`, sharing the same storage.
+    """
+
+    @abstractmethod
+    def for_owner(self, owner: str) -> "FollowerStore":
+        """The store for another actor's followers."""
+
+    @abstractmethod
+    def add(self, inbox: str, follow_id: str | None, shared_inbox: str | None = None):
+        """Adds or replaces the follower with this inbox."""
+
+    @abstractmethod
+    def remove(self, inbox: str) -> str | None:
+        """Removes a follower and returns its delivery target, if it had one."""
+
+    @abstractmethod
+    def pop_by_follow(self, follow_id: str) -> tuple[str, str] | None:
+        """Removes the follower created by a Follow and returns its inbox and
+        delivery target."""
+
+    def remove_by_follow(self, follow_id: str) -> str | None:
+        """Removes the follower created by a Follow and returns its inbox."""
+        removed = self.pop_by_follow(follow_id)
+        return removed[0] if removed else None
+
+    @abstractmethod
+    def __contains__(self, inbox: str) -> bool: ...
+
+    @abstractmethod
+    def __len__(self) -> int: ...
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    @abstractmethod
+    def inboxes(self) -> Iterator[str]: ...
+
+    @abstractmethod
+    def delivery_targets(self) -> Iterator[str]:
+        """Distinct inboxes to deliver to: shared inboxes where advertised."""
+
+    @abstractmethod
+    def covered_inboxes(self, target: str) -> list[str]:
+        """Follower inboxes reached through a delivery target."""
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryFollowerStore(FollowerStore):
+    def __init__(self, _owners: "dict[str, MemoryFollowerStore] | None" = None):
+        # inbox -> shared inbox, None for followers that don't advertise one
+        self._followers: dict[str, str | None] = {}
+        # inbox <-> follow activity id, for Follows that had an id
+        self._follows: bidict[str, str] = bidict()
+        # owner -> store, shared with the other owners' stores
+        self._owners = {} if _owners is None else _owners
+
+    def for_owner(self, owner: str) -> "MemoryFollowerStore":
+        store = self._owners.get(owner)
+        if store is None:
+            store = self._owners[owner] = MemoryFollowerStore(self._owners)
+        return store
+
+    def add(self, inbox: str, follow_id: str | None, shared_inbox: str | None = None):
+        self._followers[inbox] = shared_inbox or None
+        if follow_id is None:
+            self._follows.pop(inbox, None)
+        else:
+            # Another follower may still claim this Follow id
+            self._follows.forceput(inbox, follow_id)
+
+    def remove(self, inbox: str) -> str | None:
+        if inbox not in self._followers:
+            return None
+        self._follows.pop(inbox, None)
+        return self._followers.pop(inbox) or inbox
+
+    def pop_by_follow(self, follow_id: str) -> tuple[str, str] | None:
+        inbox = self._follows.inverse.get(follow_id)
+        if inbox is None:
+            return None
+        target = self.remove(inbox)
+        assert target is not None
+        return inbox, target
+
+    def __contains__(self, inbox: str) -> bool:
+        return inbox in self._followers
+
+    def __len__(self) -> int:
+        return len(self._followers)
+
+    def inboxes(self) -> Iterator[str]:
+        # copy, to allow mutation during iteration
+        return iter(list(self._followers))
+
+    def delivery_targets(self) -> Iterator[str]:
+        return iter(list(dict.fromkeys(s or i for i, s in self._followers.items())))
+
+    def covered_inboxes(self, target: str) -> list[str]:
+        return [i for i, s in self._followers.items() if (s or i) == target]
+
+    def clear(self) -> None:
+        self._followers.clear()
+        self._follows.clear()
+
+
+_SCHEMA = """
+-- Worker processes share the file, and readers shouldn't block the writer
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS followers (
+    owner TEXT NOT NULL DEFAULT '',
+    inbox TEXT NOT NULL,
+    follow_id TEXT,
+    shared_inbox TEXT,
+    PRIMARY KEY (owner, inbox),
+    UNIQUE (owner, follow_id)
+);
+CREATE INDEX IF NOT EXISTS followers_target
+    ON followers(owner, COALESCE(shared_inbox, inbox));
+"""
+
+
+class SqliteFollowerStore(FollowerStore):
+    """Persistent follower store.
+
+    Lookups by inbox and by Follow id are indexed, and recipients are
+    streamed from the database rather than loaded into memory. Stores for
+    other owners share the database connection.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = ":memory:",
+        owner: str = "",
+        *,
+        _db: sqlite3.Connection | None = None,
+        _owners: "dict[str, SqliteFollowerStore] | None" = None,
+    ):
+        if _db is None:
+            _db = sqlite3.connect(path, check_same_thread=False)
+            _db.executescript(_SCHEMA)
+        self._db = _db
+        self.owner = owner
+        self._owners = {owner: self} if _owners is None else _owners
+
+    def for_owner(self, owner: str) -> "SqliteFollowerStore":
+        store = self._owners.get(owner)
+        if store is None:
+            store = SqliteFollowerStore(owner=owner, _db=self._db, _owners=self._owners)
+            self._owners[owner] = store
+        return store
+
+    def add(self, inbox: str, follow_id: str | None, shared_inbox: str | None = None):
+        with self._db:
+            # Another follower may still claim this Follow id
+            self._db.execute(
+                "UPDATE followers SET follow_id = NULL"
+                " WHERE owner = ? AND follow_id = ? AND inbox != ?",
+                (self.owner, follow_id, inbox),
+            )
+            self._db.execute(
+                "INSERT INTO followers (owner, inbox, follow_id, shared_inbox)"
+                " VALUES (?, ?, ?, ?) ON CONFLICT (owner, inbox) DO UPDATE SET"
+                " follow_id = excluded.follow_id,"
+                " shared_inbox = excluded.shared_inbox",
+                (self.owner, inbox, follow_id, shared_inbox),
+            )
+
+    def remove(self, inbox: str) -> str | None:
+        with self._db:
+            row = self._db.execute(
+                "DELETE FROM followers WHERE owner = ? AND inbox = ?"
+                " RETURNING COALESCE(shared_inbox, inbox)",
+                (self.owner, inbox),
+            ).fetchone()
+        return row[0] if row else None
+
+    def pop_by_follow(self, follow_id: str) -> tuple[str, str] | None:
+        with self._db:
+            row = self._db.execute(
+                "DELETE FROM followers WHERE owner = ? AND follow_id = ?"
+                " RETURNING inbox, COALESCE(shared_inbox, inbox)",
+                (self.owner, follow_id),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def __contains__(self, inbox: str) -> bool:
+        return (
+            self._db.execute(
+                "SELECT 1 FROM followers WHERE owner = ? AND inbox = ?",
+                (self.owner, inbox),
+            ).fetchone()
+            is not None
+        )
+
+    def __len__(self) -> int:
+        return self._db.execute(
+            "SELECT COUNT(*) FROM followers WHERE owner = ?", (self.owner,)
+        ).fetchone()[0]
+
+    def __bool__(self) -> bool:
+        return (
+            self._db.execute(
+                "SELECT 1 FROM followers WHERE owner = ? LIMIT 1", (self.owner,)
+            ).fetchone()
+            is not None
+        )
+
+    def inboxes(self) -> Iterator[str]:
+        # A separate cursor, so rows stream while other statements run
+        for (inbox,) in self._db.cursor().execute(
+            "SELECT inbox FROM followers WHERE owner = ?", (self.owner,)
+        ):
+            yield inbox
+
+    def delivery_targets(self) -> Iterator[str]:
+        for (target,) in self._db.cursor().execute(
+            "SELECT DISTINCT COALESCE(shared_inbox, inbox) FROM followers"
+            " WHERE owner = ?",
+            (self.owner,),
+        ):
+            yield target
+
+    def covered_inboxes(self, target: str) -> list[str]:
+        return [
+            inbox
+            for (inbox,) in self._db.execute(
+                "SELECT inbox FROM followers"
+                " WHERE owner = ? AND COALESCE(shared_inbox, inbox) = ?",
+                (self.owner, target),
+            )
+        ]
+
+    def clear(self) -> None:
+        with self._db:
+            self._db.execute("DELETE FROM followers WHERE owner = ?", (self.owner,))
+
+    def close(self) -> None:
+        self._db.close()
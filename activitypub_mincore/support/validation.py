@@ -1,13 +1,30 @@
+import collections
+import functools
+import hashlib
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any
+from typing import Any, BinaryIO
 from urllib.parse import urlparse
 
 import referencing
 import referencing.retrieval
-from jsonschema import Draft202012Validator
+from jsonschema import Draft202012Validator, ValidationError
+from jsonschema.exceptions import best_match
 from jsonschema.protocols import Validator
 from referencing.jsonschema import DRAFT202012
 
+from activitypub_mincore.support.cache import LRUCache
+from activitypub_mincore.support.compiler import CompiledValidator, Resolver
+from activitypub_mincore.support.metrics import Histogram
+from activitypub_mincore.support.serialization import canonical_dumps, loads
+
 SCHEMA_DIR = Path(__file__).parent.parent / "schemas"
 
 
@@ -19,36 +36,418 @@ def schema_retriever(uri):
         return fp.read()
 
 
-MINCORE_REGISTRY = referencing.Registry(retrieve=schema_retriever)
+# Schemas by URI, from a bundle file, served instead of reading SCHEMA_DIR
+_schema_bundle: dict[str, referencing.Resource] = {}
+
+
+def build_schema_bundle() -> dict[str, Any]:
+    """Every packaged schema by URI, to be saved for `load_schema_bundle`."""
+    bundle = {}
+    for path in sorted(SCHEMA_DIR.glob("*-schema.json")):
+        contents = loads(path.read_bytes())
+        bundle[contents["$id"]] = contents
+    return bundle
+
+
+def load_schema_bundle(path: str | Path) -> None:
+    """Loads the schemas saved from `build_schema_bundle` in one read."""
+    with open(path, "rb") as fp:
+        bundle = loads(fp.read())
+    for uri, contents in bundle.items():
+        _schema_bundle[uri] = DRAFT202012.create_resource(contents)
+
+
+def retrieve_schema(uri: str) -> referencing.Resource:
+    resource = _schema_bundle.get(uri)
+    return resource if resource is not None else schema_retriever(uri)
+
+
+if os.environ.get("MINCORE_SCHEMA_BUNDLE"):
+    load_schema_bundle(os.environ["MINCORE_SCHEMA_BUNDLE"])
+
+MINCORE_REGISTRY = referencing.Registry(retrieve=retrieve_schema)
 
 MINCORE_ACTIVITY_TYPES = ["Follow", "Accept", "Reject"]
 
+# "jsonschema" (generic) or "compiled" (see support.compiler)
+VALIDATION_ENGINES = ["jsonschema", "compiled"]
+DEFAULT_VALIDATION_ENGINE = os.environ.get("MINCORE_VALIDATION_ENGINE", "jsonschema")
+
+# Entries in the shared validation result cache (0 disables memoization)
+VALIDATION_CACHE_SIZE = int(os.environ.get("MINCORE_VALIDATION_CACHE_SIZE", "0"))
+
+VALIDATION_SECONDS = Histogram(
+    "mincore_validation_seconds", "Time to validate an activity", ("result",)
+)
+
+_validator_tokens = itertools.count()
+_NOT_CACHED = object()
+
+# (validator token, payload digest) -> None (valid) or the ValidationError
+VALIDATION_CACHE: LRUCache[tuple[int, bytes], ValidationError | None] = LRUCache(
+    VALIDATION_CACHE_SIZE or 4096
+)
+
+
+def payload_digest(instance: Any) -> bytes:
+    """A digest of the canonical JSON encoding of an instance."""
+    return hashlib.blake2b(canonical_dumps(instance), digest_size=16).digest()
+
+
+class MemoizedValidator:
+    """Remembers validation results for payloads it has already seen."""
+
+    def __init__(
+        self,
+        validator: Validator,
+        cache: LRUCache[tuple[int, bytes], ValidationError | None] | None = None,
+    ):
+        self.validator = validator
+        self.schema = validator.schema
+        self.cache = VALIDATION_CACHE if cache is None else cache
+        # Identifies this validator's entries in a shared cache
+        self._token = next(_validator_tokens)
+
+    def _result(self, instance: Any) -> ValidationError | None:
+        try:
+            key = (self._token, payload_digest(instance))
+        except (TypeError, ValueError):
+            # Not JSON-serializable, so not cacheable
+            key = None
+        if key is not None:
+            cached = self.cache.get(key, _NOT_CACHED)
+            if cached is not _NOT_CACHED:
+                return cached
+        try:
+            self.validator.validate(instance)
+            error = None
+        except ValidationError as ex:
+            error = ex
+        if key is not None:
+            self.cache.set(key, error)
+        return error
+
+    def is_valid(self, instance: Any) -> bool:
+        return self._result(instance) is None
+
+    def iter_errors(self, instance: Any) -> Iterator[ValidationError]:
+        if self._result(instance) is not None:
+            yield from self.validator.iter_errors(instance)
+
+    def validate(self, instance: Any) -> None:
+        error = self._result(instance)
+        if error is not None:
+            raise error.with_traceback(None)
+
+
+def check_schemas(schema: Any, resolver: Resolver) -> None:
+    """Checks a schema, and those it references, against the metaschema.
+
+    Looking the references up loads the referenced schemas, so validating
+    doesn't read them on first use.
+    """
+    checked: set[int] = set()
+
+    def check(schema: Any, resolver: Resolver) -> None:
+        if id(schema) in checked:
+            return
+        checked.add(id(schema))
+        Draft202012Validator.check_schema(schema)
+        for ref in _references(schema):
+            resolved = resolver.lookup(ref)
+            check(resolved.contents, resolved.resolver)
+
+    check(schema, resolver)
+
+
+def _references(schema: Any) -> Iterator[str]:
+    if isinstance(schema, dict):
+        for keyword, value in schema.items():
+            if keyword == "$ref" and isinstance(value, str):
+                yield value
+            elif keyword not in ("const", "enum"):
+                yield from _references(value)
+    elif isinstance(schema, list):
+        for value in schema:
+            yield from _references(value)
+
+
+def create_validator(
+    root_schema: str,
+    *,
+    registry: referencing.Registry = MINCORE_REGISTRY,
+    engine: str | None = None,
+    memoize: bool | None = None,
+) -> Validator:
+    engine = engine or DEFAULT_VALIDATION_ENGINE
+    if engine not in VALIDATION_ENGINES:
+        raise ValueError(f"Unknown validation engine: {engine}")
+    schema = retrieve_schema(root_schema).contents
+    check_schemas(schema, registry.resolver())
+    validator: Any = Draft202012Validator(
+        schema,
+        registry=registry,
+        format_checker=Draft202012Validator.FORMAT_CHECKER,
+    )
+    if engine == "compiled":
+        validator = CompiledValidator(validator, registry)
+    if VALIDATION_CACHE_SIZE > 0 if memoize is None else memoize:
+        validator = MemoizedValidator(validator)
+    return validator
+
 
 def create_activity_validator(
-    *, root_schema: str = "schema:activity", types=None
+    *,
+    root_schema: str = "schema:activity",
+    types=None,
+    any_type: bool = False,
+    engine: str | None = None,
+    memoize: bool | None = None,
 ) -> Validator:
-    types = set(types or MINCORE_ACTIVITY_TYPES)
-    return Draft202012Validator(
-        schema_retriever(root_schema).contents,
+    """Validates activities of the given types, or of any type with `any_type`."""
+    known: dict[str, Any] = {"type": "string"}
+    if not any_type:
+        known = {"oneOf": [{"const": a} for a in set(types or MINCORE_ACTIVITY_TYPES)]}
+    return create_validator(
+        root_schema,
         registry=MINCORE_REGISTRY.with_resource(
             uri="schema:known-activity-types",
             resource=referencing.Resource(
                 contents={
                     "$schema": "https://json-schema.org/draft/2020-12/schema",
                     "$id": "schema:known-activities",
-                    "oneOf": [{"const": a} for a in types],
+                    **known,
                 },
                 specification=DRAFT202012,
             ),
         ),
-        format_checker=Draft202012Validator.FORMAT_CHECKER,
+        engine=engine,
+        memoize=memoize,
     )
 
 
-MINCORE_ACTIVITY_VALIDATOR = create_activity_validator()
+class LazyValidator:
+    """A validator built on its first use."""
+
+    def __init__(self, build: Callable[[], Validator]):
+        self._build = build
+        self._validator: Validator | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        return self._validator is not None
+
+    def build(self) -> Validator:
+        """Builds the validator, if it isn't built yet, and returns it."""
+        if self._validator is None:
+            with self._lock:
+                if self._validator is None:
+                    self._validator = self._build()
+        return self._validator
+
+    @property
+    def validator(self) -> Validator:
+        return self.build()
+
+    @property
+    def schema(self) -> Any:
+        return self.validator.schema
+
+    def is_valid(self, instance: Any) -> bool:
+        return self.validator.is_valid(instance)
+
+    def iter_errors(self, instance: Any) -> Iterator[ValidationError]:
+        return self.validator.iter_errors(instance)
+
+    def validate(self, instance: Any) -> None:
+        self.validator.validate(instance)
+
+
+class ValidatorRegistry:
+    """Validators shared by everything asking for the same schema and options.
+
+    Validators are built on first use, so importing the modules that declare
+    them doesn't pay for building them.
+    """
+
+    def __init__(self):
+        self._validators: dict[tuple, LazyValidator] = {}
+
+    def __len__(self) -> int:
+        return len(self._validators)
+
+    def _get(self, key: tuple, build: Callable[[], Validator]) -> LazyValidator:
+        validator = self._validators.get(key)
+        if validator is None:
+            validator = self._validators.setdefault(key, LazyValidator(build))
+        return validator
+
+    def validator(
+        self,
+        root_schema: str,
+        *,
+        engine: str | None = None,
+        memoize: bool | None = None,
+    ) -> LazyValidator:
+        return self._get(
+            (root_schema, None, engine, memoize),
+            functools.partial(
+                create_validator, root_schema, engine=engine, memoize=memoize
+            ),
+        )
+
+    def activity_validator(
+        self,
+        types=None,
+        *,
+        any_type: bool = False,
+        root_schema: str = "schema:activity",
+        engine: str | None = None,
+        memoize: bool | None = None,
+    ) -> LazyValidator:
+        types = None if any_type else frozenset(types or MINCORE_ACTIVITY_TYPES)
+        return self._get(
+            (root_schema, "*" if any_type else types, engine, memoize),
+            functools.partial(
+                create_activity_validator,
+                root_schema=root_schema,
+                types=types,
+                any_type=any_type,
+                engine=engine,
+                memoize=memoize,
+            ),
+        )
+
+    def prepare(self) -> None:
+        """Builds every validator asked for so far.
+
+        Building checks the validators' schemas and loads those they
+        reference, and compiles them with the compiled engine.
+        """
+        for validator in list(self._validators.values()):
+            validator.build()
+
+
+VALIDATORS = ValidatorRegistry()
+
+MINCORE_ACTIVITY_VALIDATOR = VALIDATORS.activity_validator()
 
 
 def validate_activity(activity: dict[str, Any], validator: Validator) -> dict[str, Any]:
     """Validates an activity and returns it, if valid."""
-    validator.validate(activity)
+    start = time.perf_counter()
+    try:
+        validator.validate(activity)
+    except ValidationError:
+        VALIDATION_SECONDS.observe(time.perf_counter() - start, result="invalid")
+        raise
+    VALIDATION_SECONDS.observe(time.perf_counter() - start, result="valid")
     return activity
+
+
+@dataclass
+class RecordError:
+    # Line of the record in its input, from 1
+    line: int
+    message: str
+    # JSON path of the invalid element within the record
+    path: str = "$"
+
+
+# This process's validator for validate_many chunks
+_chunk_validator: LazyValidator | None = None
+
+
+def _init_chunk_validator(
+    root_schema: str, types: list[str] | None, engine: str | None
+) -> None:
+    global _chunk_validator
+    if types is None:
+        _chunk_validator = VALIDATORS.validator(
+            root_schema, engine=engine, memoize=False
+        )
+    else:
+        _chunk_validator = VALIDATORS.activity_validator(
+            types, root_schema=root_schema, engine=engine, memoize=False
+        )
+
+
+def _validate_chunk(first_line: int, data: bytes) -> list[RecordError]:
+    """Validates the JSON Lines records in `data`, returning their errors."""
+    assert _chunk_validator is not None
+    validator = _chunk_validator
+    errors = []
+    for line, record in enumerate(data.splitlines(), first_line):
+        if not record.strip():
+            continue
+        try:
+            instance = loads(record)
+        except ValueError as ex:
+            errors.append(RecordError(line, f"Invalid JSON: {ex}"))
+            continue
+        if not validator.is_valid(instance):
+            error = best_match(validator.iter_errors(instance))
+            errors.append(RecordError(line, error.message, error.json_path))
+    return errors
+
+
+def _read_chunks(source: BinaryIO, chunk_size: int) -> Iterator[tuple[int, bytes]]:
+    """Splits input into chunks of whole lines, with their first line number."""
+    line = 1
+    while data := source.read(chunk_size):
+        if not data.endswith(b"\n"):
+            data += source.readline()
+        yield line, data
+        line += data.count(b"\n")
+
+
+def validate_many(
+    source: BinaryIO,
+    *,
+    root_schema: str = "schema:activity",
+    types: list[str] | None = None,
+    engine: str | None = None,
+    processes: int | None = None,
+    chunk_size: int = 1 << 20,
+    max_pending: int | None = None,
+) -> Iterator[RecordError]:
+    """Validates JSON Lines records, yielding the errors in input order.
+
+    The input is read in chunks of about `chunk_size` bytes, validated by a
+    pool of `processes` (by default, one per CPU). At most `max_pending`
+    chunks are read ahead of the errors being consumed, so memory doesn't
+    grow with the input. `types` restricts activity types, as for
+    `create_activity_validator`; it's ignored for other schemas.
+    """
+    if root_schema == "schema:activity":
+        types = list(types or MINCORE_ACTIVITY_TYPES)
+    else:
+        types = None
+    initargs = (root_schema, types, engine)
+    chunks = _read_chunks(source, chunk_size)
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        _init_chunk_validator(*initargs)
+        for first_line, data in chunks:
+            yield from _validate_chunk(first_line, data)
+        return
+
+    max_pending = max_pending or 2 * processes
+    pending: collections.deque[Future[list[RecordError]]] = collections.deque()
+    with ProcessPoolExecutor(
+        processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_chunk_validator,
+        initargs=initargs,
+    ) as pool:
+        try:
+            for first_line, data in chunks:
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+                pending.append(pool.submit(_validate_chunk, first_line, data))
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
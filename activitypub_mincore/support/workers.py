@@ -0,0 +1,124 @@
+"""Running an instance as several processes behind one listening socket."""
+
+import asyncio
+import fcntl
+import inspect
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from collections.abc import Awaitable, Callable
+from multiprocessing.connection import wait
+from pathlib import Path
+
+logger = logging.getLogger("workers")
+
+WorkerTarget = Callable[..., None]
+
+# Seconds a worker must have run for to be restarted when it exits
+MIN_WORKER_UPTIME = 5.0
+
+
+class LeaderLock:
+    """An exclusive lock on a file, held by at most one process at a time.
+
+    The lock is released by the OS when its holder exits, so another process
+    can take over the leader's work.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._fd: int | None = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+async def run_elected(
+    lock: LeaderLock, task: Awaitable, poll_interval: float = 1.0
+) -> None:
+    """Runs the task once this process holds the leader lock."""
+    try:
+        while not lock.try_acquire():
+            await asyncio.sleep(poll_interval)
+    except asyncio.CancelledError:
+        if inspect.iscoroutine(task):
+            task.close()
+        raise
+    logger.info("process %d elected leader", os.getpid())
+    try:
+        await task
+    finally:
+        lock.release()
+
+
+def run_workers(workers: int, sock: socket.socket, target: WorkerTarget) -> None:
+    """Runs `target(sockets=[sock])` in worker processes until interrupted.
+
+    The target must be picklable (a module-level function or a partial of
+    one), since workers are spawned rather than forked. A worker that exits
+    unexpectedly is replaced, unless it failed during startup.
+    """
+    context = multiprocessing.get_context("spawn")
+    stopping = False
+    started: dict[int, float] = {}
+
+    def start(n: int) -> multiprocessing.process.BaseProcess:
+        process = context.Process(
+            target=target, kwargs={"sockets": [sock]}, name=f"worker-{n}"
+        )
+        process.start()
+        started[n] = time.monotonic()
+        return process
+
+    def stop(sig: int, frame) -> None:
+        nonlocal stopping
+        if not stopping:
+            stopping = True
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+    processes = [start(n) for n in range(workers)]
+    logger.info("started %d workers: %s", workers, [p.pid for p in processes])
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while any(p.is_alive() for p in processes):
+            wait([p.sentinel for p in processes if p.is_alive()])
+            for n, process in enumerate(processes):
+                if process.is_alive() or stopping:
+                    continue
+                if time.monotonic() - started[n] < MIN_WORKER_UPTIME:
+                    logger.error("worker %s failed to start, stopping", process.pid)
+                    stop(signal.SIGTERM, None)
+                else:
+                    logger.warning(
+                        f"worker {process.pid} exited ({process.exitcode}),"
+                        " restarting"
+                    )
+                    processes[n] = start(n)
+    finally:
+        for process in processes:
+            process.join()
+        sock.close()
@@ -5,6 +5,12 @@ from activitypub_mincore import actor
 from tests.support import MockServer
 
 
+@pytest.fixture(autouse=True)
+def clear_remote_actor_cache():
+    yield
+    actor.remote_actor_cache.clear()
+
+
 @pytest.fixture
 def mock_server(test_client, monkeypatch, mock_actor):
     server = MockServer(test_client, monkeypatch)
@@ -30,10 +36,15 @@ def test_client(app):
     with TestClient(app) as client:
         # actor under test
         actor_uri = f"{client.base_url}/actor"
-        actor._actor = {
-            "id": actor_uri,
-            "type": "Service",
-            "inbox": f"{actor_uri}/inbox",
-            "outbox": f"{actor_uri}/outbox",
-        }
+        actor.clear_local_actors()
+        actor.add_local_actor(
+            {
+                "id": actor_uri,
+                "type": "Service",
+                "inbox": f"{actor_uri}/inbox",
+                "outbox": f"{actor_uri}/outbox",
+                "followers": f"{actor_uri}/followers",
+            }
+        )
         yield client
+        actor.clear_local_actors()
@@ -5,6 +5,10 @@ from typing import Any
 import httpx
 from fastapi.testclient import TestClient
 
+from activitypub_mincore.support import client
+from activitypub_mincore.support.ingest import InboxPipeline
+from activitypub_mincore.support.serialization import loads
+
 
 @dataclass
 class MockRequest:
@@ -20,6 +24,12 @@ class MockResponse:
     status_code: int = field(default=200)
 
 
+def wait_for_inbox(test_client: TestClient, pipeline: InboxPipeline):
+    """Waits for activities posted through the test client to be handled."""
+    assert test_client.portal is not None
+    test_client.portal.call(pipeline.join)
+
+
 class MockServer:
     def __init__(self, test_client: TestClient, monkeypatch):
         self.requests: list[MockRequest] = []
@@ -27,7 +37,7 @@ class MockServer:
         self._post_responses: dict[str, MockResponse] = {}
         self._test_client = test_client
         self._test_client_complete = False
-        monkeypatch.setattr(httpx.AsyncClient, "__aenter__", self)
+        monkeypatch.setattr(client, "_client", self)
 
     def _ensure_client_completion(self):
         if not self._test_client_complete:
@@ -110,8 +120,8 @@ class MockServer:
     def received_post(self, pattern: dict[str, Any]) -> MockRequest | None:
         for request in self.requests:
             if request.method == "post":
-                if "json" in request.options:
-                    payload = request.options["json"]
+                if "content" in request.options:
+                    payload = loads(request.options["content"])
                     matched = True
                     for k, v in pattern.items():
                         if k not in payload or payload[k] != v:
@@ -120,7 +130,3 @@ class MockServer:
                     if matched:
                         return request
         return None
-
-    # __aenter callback
-    async def __call__(self, *args):
-        return self
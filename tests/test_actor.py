@@ -0,0 +1,36 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from activitypub_mincore import actor
+from activitypub_mincore.publisher import app as publisher_app
+
+
+@pytest.fixture
+def app():
+    return publisher_app
+
+
+def test_actor_document_caching(test_client: TestClient):
+    actor_uri = f"{test_client.base_url}/actor"
+    response = test_client.get(actor_uri)
+    assert response.status_code == 200
+    assert response.json() == actor.get_local_actor()
+    assert response.headers["content-type"] == "application/activity+json"
+    assert response.headers["cache-control"] == "public, max-age=300"
+    etag = response.headers["etag"]
+    assert etag.startswith('"') and etag.endswith('"')
+
+    response = test_client.get(actor_uri, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    response = test_client.get(actor_uri, headers={"If-None-Match": f'"x", W/{etag}'})
+    assert response.status_code == 304
+
+    # Updating the actor changes its document and ETag
+    actor.add_local_actor({**actor.get_local_actor(), "name": "Updated"})
+    response = test_client.get(actor_uri, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["name"] == "Updated"
+    assert response.headers["etag"] != etag
+    assert actor.get_local_actor()["name"] == "Updated"
@@ -0,0 +1,35 @@
+from activitypub_mincore import actor, publisher
+from activitypub_mincore.support import client
+from activitypub_mincore.support.bench import BenchConfig, run_benchmarks
+
+
+async def test_benchmarks_run_and_restore_state():
+    store, queue = publisher.follower_store, publisher.delivery_queue
+    seen = publisher.seen_activities
+    actor.add_local_actor(actor.create_actor("http://local.test"))
+    local_actors = actor.local_actors()
+    report = await run_benchmarks(
+        BenchConfig(
+            followers=20, hosts=3, cycles=2, validations=10, concurrency=4, startups=1
+        )
+    )
+    assert set(report["scenarios"]) == {
+        "inbox_follow",
+        "inbox_undo",
+        "publish_fanout",
+        "validation_jsonschema",
+        "validation_compiled",
+        "startup_import",
+        "startup_validators_jsonschema",
+        "startup_validators_compiled",
+    }
+    fanout = report["scenarios"]["publish_fanout"]
+    assert fanout["operations"] == 40
+    assert fanout["throughput"] > 0
+    assert fanout["latency_p50"] <= fanout["latency_p99"]
+    assert publisher.follower_store is store
+    assert publisher.delivery_queue is queue
+    assert publisher.seen_activities is seen
+    assert actor.local_actors() == local_actors
+    actor.clear_local_actors()
+    assert client._client is None
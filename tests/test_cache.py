@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import httpx
+
+from activitypub_mincore.support.cache import DocumentCache, LRUCache
+
+URI = "http://server.test/actor"
+
+
+class StubOrigin:
+    def __init__(self, headers: dict[str, str] | None = None, delay: float = 0):
+        self.headers = headers or {}
+        self.delay = delay
+        self.requests: list[dict[str, str]] = []
+        self.version = 1
+
+    async def fetch(self, uri: str, headers: dict[str, str]) -> httpx.Response:
+        self.requests.append(headers)
+        await asyncio.sleep(self.delay)
+        etag = f'"v{self.version}"'
+        if headers.get("If-None-Match") == etag:
+            response = httpx.Response(304, headers=self.headers)
+        else:
+            response = httpx.Response(
+                200,
+                headers={"ETag": etag, **self.headers},
+                content=json.dumps({"id": uri, "version": self.version}),
+            )
+        response.request = httpx.Request("get", uri)
+        return response
+
+    def cache(self, **kwargs) -> DocumentCache:
+        return DocumentCache(self.fetch, lambda r: r.json(), **kwargs)
+
+
+def test_lru_eviction():
+    cache: LRUCache[str, int] = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert (cache.hits, cache.misses) == (3, 0)
+
+
+async def test_concurrent_lookups_are_coalesced():
+    origin = StubOrigin(delay=0.01)
+    cache = origin.cache()
+    documents = await asyncio.gather(*(cache.get(URI) for _ in range(10)))
+    assert len(origin.requests) == 1
+    assert all(d["id"] == URI for d in documents)
+    await cache.get(URI)
+    assert len(origin.requests) == 1
+
+
+async def test_revalidates_with_etag():
+    origin = StubOrigin({"Cache-Control": "no-cache"})
+    cache = origin.cache()
+    await cache.get(URI)
+    assert (await cache.get(URI))["version"] == 1
+    assert origin.requests[1] == {"If-None-Match": '"v1"'}
+    origin.version = 2
+    assert (await cache.get(URI))["version"] == 2
+
+
+async def test_no_store_is_not_cached():
+    origin = StubOrigin({"Cache-Control": "no-store"})
+    cache = origin.cache()
+    await cache.get(URI)
+    await cache.get(URI)
+    assert len(origin.requests) == 2
+    assert len(cache.entries) == 0
+
+
+async def test_stale_while_revalidate():
+    origin = StubOrigin({"Cache-Control": "max-age=0, stale-while-revalidate=60"})
+    cache = origin.cache()
+    await cache.get(URI)
+    origin.version = 2
+    # stale copy is served immediately, refresh happens in the background
+    assert (await cache.get(URI))["version"] == 1
+    await asyncio.sleep(0.01)
+    assert (await cache.get(URI))["version"] == 2
+
+
+async def test_cancelled_lookup_leaves_shared_fetch():
+    origin = StubOrigin(delay=0.01)
+    cache = origin.cache()
+    first = asyncio.create_task(cache.get(URI))
+    second = asyncio.create_task(cache.get(URI))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert (await second)["id"] == URI
+    assert first.cancelled()
+    assert len(origin.requests) == 1
@@ -0,0 +1,28 @@
+import asyncio
+
+import httpx
+
+from activitypub_mincore.support.client import HostLimitedTransport
+
+
+async def test_requests_are_limited_per_host():
+    in_flight: dict[str, int] = {}
+    peak: dict[str, int] = {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        in_flight[host] = in_flight.get(host, 0) + 1
+        peak[host] = max(peak.get(host, 0), in_flight[host])
+        await asyncio.sleep(0.01)
+        in_flight[host] -= 1
+        return httpx.Response(200, content=b"{}")
+
+    transport = HostLimitedTransport(httpx.MockTransport(handler), per_host=2)
+    async with httpx.AsyncClient(transport=transport) as client:
+        responses = await asyncio.gather(
+            *(client.get(f"http://{host}.test/{i}") for host in "ab" for i in range(6))
+        )
+    assert all(r.status_code == 200 for r in responses)
+    assert peak == {"a.test": 2, "b.test": 2}
+    # slots for idle hosts are released
+    assert transport._slots == {}
@@ -0,0 +1,109 @@
+import random
+from typing import Any
+
+import pytest
+from jsonschema import ValidationError
+
+from activitypub_mincore.support.compiler import CompiledValidator, json_equal
+from activitypub_mincore.support.validation import (
+    MINCORE_ACTIVITY_TYPES,
+    create_activity_validator,
+    create_validator,
+)
+from tests.test_validation import VALIDATION_TEST_CASES
+
+VALUES: list[Any] = [
+    None,
+    True,
+    False,
+    0,
+    1,
+    1.0,
+    "",
+    "Follow",
+    "Create",
+    "Service",
+    "Person",
+    "http://server.test/",
+    "@foo@bar.test",
+    "not a uri",
+    [],
+    ["Follow"],
+    {},
+    {"id": "http://server.test/"},
+    {"type": "Note"},
+]
+KEYS = ["id", "type", "actor", "object", "inbox", "outbox", "to", "extra"]
+VALID_DOCUMENTS = [
+    {
+        "id": "http://server.test/actor",
+        "type": "Service",
+        "inbox": "http://server.test/inbox",
+        "outbox": "http://server.test/outbox",
+    },
+    {
+        "id": "http://server.test/follow",
+        "type": "Follow",
+        "actor": "http://server.test/actor",
+        "object": "http://server.test/other",
+    },
+]
+
+VALIDATORS = {
+    "activity": lambda engine: create_activity_validator(engine=engine, memoize=False),
+    "ext-activity": lambda engine: create_activity_validator(
+        types=MINCORE_ACTIVITY_TYPES + ["Create"], engine=engine, memoize=False
+    ),
+    "actor": lambda engine: create_validator(
+        "schema:actor", engine=engine, memoize=False
+    ),
+}
+
+
+def generate_instances(n: int, seed: int = 1):
+    rng = random.Random(seed)
+    yield from VALUES
+    yield from (activity for activity, _ in VALIDATION_TEST_CASES)
+    for document in VALID_DOCUMENTS:
+        yield document
+        for key in KEYS:
+            yield {k: v for k, v in document.items() if k != key}
+            for value in VALUES:
+                yield {**document, key: value}
+    for _ in range(n):
+        keys = rng.sample(KEYS, rng.randint(0, len(KEYS)))
+        yield {k: rng.choice(VALUES) for k in keys}
+
+
+@pytest.mark.parametrize("name", list(VALIDATORS))
+def test_same_decisions_as_jsonschema(name: str):
+    reference = VALIDATORS[name]("jsonschema")
+    compiled = VALIDATORS[name]("compiled")
+    assert isinstance(compiled, CompiledValidator)
+    outcomes = set()
+    for instance in generate_instances(2000):
+        expected = reference.is_valid(instance)
+        # the compiled checks alone, without the confirming fallback
+        assert compiled._check(instance) == expected, instance
+        outcomes.add(expected)
+    assert outcomes == {True, False}
+
+
+def test_errors_match_jsonschema():
+    reference = create_activity_validator(engine="jsonschema")
+    compiled = create_activity_validator(engine="compiled")
+    activity = {"type": "Follow", "object": "@foo@bar.test"}
+    with pytest.raises(ValidationError) as expected:
+        reference.validate(activity)
+    with pytest.raises(ValidationError) as actual:
+        compiled.validate(activity)
+    assert actual.value.message == expected.value.message
+
+
+def test_json_equality():
+    assert json_equal(1, 1.0)
+    assert not json_equal(1, True)
+    assert not json_equal(0, False)
+    assert json_equal({"a": [1]}, {"a": [1.0]})
+    assert not json_equal({"a": [1]}, {"a": [True]})
+    assert not json_equal([], {})
@@ -0,0 +1,89 @@
+import asyncio
+
+import httpx
+
+from activitypub_mincore.support.delivery import (
+    DeliveryConfig,
+    DeliveryJob,
+    deliver_jobs,
+)
+from activitypub_mincore.support.serialization import dumps, loads
+
+
+def _jobs(inboxes: list[str], activity: dict) -> list[DeliveryJob]:
+    """Jobs delivering an activity to each inbox, keyed by inbox."""
+    body = dumps(activity)
+    return [DeliveryJob(inbox, inbox, body) for inbox in inboxes]
+
+
+class SlowClient:
+    def __init__(self, delays: dict[str, float], failing: set[str] | None = None):
+        self.delays = delays
+        self.failing = failing or set()
+        self.in_flight: dict[str, int] = {}
+        self.max_in_flight: dict[str, int] = {}
+
+    async def post(self, url: str, **kwargs):
+        host = httpx.URL(url).host
+        self.in_flight[host] = self.in_flight.get(host, 0) + 1
+        self.max_in_flight[host] = max(
+            self.max_in_flight.get(host, 0), self.in_flight[host]
+        )
+        try:
+            await asyncio.sleep(self.delays.get(host, 0))
+        finally:
+            self.in_flight[host] -= 1
+        response = httpx.Response(500 if url in self.failing else 202)
+        response.request = httpx.Request("post", url)
+        return response
+
+
+async def test_fan_out_is_concurrent_and_capped_per_host():
+    inboxes = [f"http://a.test/{i}/inbox" for i in range(8)] + [
+        f"http://b.test/{i}/inbox" for i in range(8)
+    ]
+    client = SlowClient({"a.test": 0.05, "b.test": 0.05})
+    result = await deliver_jobs(
+        client, _jobs(inboxes, {"type": "Create"}), DeliveryConfig(per_host=4)
+    )
+    assert result.stats.delivered == 16
+    assert client.max_in_flight == {"a.test": 4, "b.test": 4}
+    # two rounds per host, hosts in parallel
+    assert result.stats.elapsed < 0.05 * 8
+
+
+async def test_failures_and_deadline():
+    inboxes = ["http://fast.test/inbox", "http://bad.test/inbox"] + [
+        f"http://slow.test/{i}/inbox" for i in range(4)
+    ]
+    client = SlowClient({"slow.test": 1.0}, failing={"http://bad.test/inbox"})
+    result = await deliver_jobs(
+        client,
+        _jobs(inboxes, {"type": "Create"}),
+        DeliveryConfig(per_host=2, deadline=0.2),
+    )
+    assert list(result.failures) == ["http://bad.test/inbox"]
+    assert result.expired == {f"http://slow.test/{i}/inbox" for i in range(4)}
+    stats = result.stats.as_dict()
+    assert stats["attempted"] == 6
+    assert stats["delivered"] == 1
+    assert stats["failed"] == 1
+    assert stats["expired"] == 4
+
+
+async def test_shared_body_is_sent_as_is():
+    bodies = []
+
+    class RecordingClient:
+        async def post(self, url: str, *, content: bytes, headers: dict):
+            bodies.append(content)
+            response = httpx.Response(202)
+            response.request = httpx.Request("post", url)
+            return response
+
+    activity = {"type": "Create", "object": {"type": "Note", "content": "Hi"}}
+    inboxes = [f"http://{i}.test/inbox" for i in range(5)]
+    await deliver_jobs(RecordingClient(), _jobs(inboxes, activity))
+    assert len(bodies) == 5
+    assert all(body is bodies[0] for body in bodies)
+    assert loads(bodies[0]) == activity
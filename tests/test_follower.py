@@ -1,9 +1,15 @@
+import asyncio
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 
+from activitypub_mincore import follower
+from activitypub_mincore.follower import FollowScheduler
 from activitypub_mincore.follower import app as follower_app
-from activitypub_mincore.follower import follow
-from tests.support import MockServer
+from activitypub_mincore.support.retry import RetryPolicy
+from activitypub_mincore.support.sink import SegmentSink, replay
+from tests.support import MockServer, wait_for_inbox
 
 
 @pytest.fixture
@@ -15,7 +21,8 @@ async def test_following(
     test_client: TestClient, mock_actor: dict, mock_server: MockServer
 ):
     # trigger follow request
-    await follow(mock_actor["id"])
+    progress = await FollowScheduler().run([mock_actor["id"]])
+    assert progress.followed == 1
     assert mock_server.received_post({"type": "Follow", "object": mock_actor["id"]})
     # simulate publication (smoke test)
     response = test_client.get(f"{test_client.base_url}/actor")
@@ -33,3 +40,72 @@ async def test_following(
         },
     )
     assert response.is_success
+    # Any type of activity is accepted, as long as it's well-formed
+    for n, type_ in enumerate(["Undo", "Delete", "Announce", "Update", "Like"]):
+        activity = {
+            "id": f"http://server.test/activities/{n}",
+            "type": type_,
+            "actor": mock_actor["id"],
+            "object": "http://server.test/note",
+        }
+        assert test_client.post(inbox, json=activity).status_code == 202
+    activity = {"type": "Like", "actor": mock_actor["id"]}
+    assert test_client.post(inbox, json=activity).status_code == 400
+
+
+async def test_follow_scheduler(monkeypatch, tmp_path):
+    attempts: dict[str, int] = {}
+    in_flight = peak = 0
+
+    async def send_follow_request(uri: str):
+        nonlocal in_flight, peak
+        attempts[uri] = attempts.get(uri, 0) + 1
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        if uri.endswith("/flaky") and attempts[uri] == 1:
+            raise httpx.ConnectError("refused")
+        if uri.endswith("/gone"):
+            request = httpx.Request("get", uri)
+            raise httpx.HTTPStatusError(
+                "gone", request=request, response=httpx.Response(410, request=request)
+            )
+
+    monkeypatch.setattr(follower, "send_follow_request", send_follow_request)
+    follow_list = tmp_path / "follows.txt"
+    follow_list.write_text(
+        "# actors\n"
+        + "".join(f"http://host{i % 3}.test/{i}\n" for i in range(20))
+        + "\nhttp://host0.test/flaky\nhttp://host1.test/gone\n"
+    )
+    scheduler = follower.FollowScheduler(
+        concurrency=4,
+        per_host_rate=1000,
+        retry=RetryPolicy(base=0.001),
+    )
+    progress = await scheduler.run(follower.read_follow_list(str(follow_list)))
+    assert (progress.submitted, progress.followed, progress.failed) == (22, 21, 1)
+    assert progress.retries == 1
+    assert attempts["http://host1.test/gone"] == 1
+    assert peak <= 4
+
+
+def test_received_activities_are_kept(
+    tmp_path, monkeypatch, test_client: TestClient, mock_actor: dict
+):
+    sink = SegmentSink(tmp_path)
+    monkeypatch.setattr(follower, "sink", sink)
+    assert test_client.portal is not None
+    test_client.portal.call(sink.start)
+    activity = {
+        "id": "http://server.test/create/2",
+        "type": "Create",
+        "actor": mock_actor["id"],
+        "object": {"type": "Note", "content": "Hello"},
+    }
+    response = test_client.post(f"{test_client.base_url}/actor/inbox", json=activity)
+    assert response.status_code == 202
+    wait_for_inbox(test_client, follower.inbox_pipeline)
+    test_client.portal.call(sink.stop)
+    assert list(replay(tmp_path)) == [activity]
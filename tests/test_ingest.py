@@ -0,0 +1,70 @@
+import asyncio
+
+import fastapi
+import pytest
+
+from activitypub_mincore.support.ingest import InboxPipeline, SeenActivities
+
+
+async def test_pipeline_handles_in_order_and_applies_backpressure():
+    handled: list[dict] = []
+    release = asyncio.Event()
+
+    async def handler(activity: dict):
+        await release.wait()
+        handled.append(activity)
+
+    pipeline = InboxPipeline(handler, workers=1, maxsize=2, retry_after=7)
+    await pipeline.start()
+    try:
+        activities = [{"actor": "http://a.test", "n": n} for n in range(3)]
+        pipeline.submit(activities[0])
+        await asyncio.sleep(0)  # taken by the worker, which is now blocked
+        pipeline.submit(activities[1])
+        pipeline.submit(activities[2])
+        with pytest.raises(fastapi.HTTPException) as ex:
+            pipeline.submit({"actor": "http://a.test", "n": 3})
+        assert ex.value.status_code == 429
+        assert ex.value.headers == {"Retry-After": "7"}
+        release.set()
+        await pipeline.join()
+        assert handled == activities
+    finally:
+        await pipeline.stop()
+    assert not pipeline.running
+
+
+async def test_worker_survives_cancelled_handler():
+    handled: list[dict] = []
+
+    async def handler(activity: dict):
+        if activity["n"] == 0:
+            raise asyncio.CancelledError()
+        handled.append(activity)
+
+    pipeline = InboxPipeline(handler, workers=1)
+    await pipeline.start()
+    try:
+        pipeline.submit({"actor": "http://a.test", "n": 0})
+        pipeline.submit({"actor": "http://a.test", "n": 1})
+        await pipeline.join()
+        assert handled == [{"actor": "http://a.test", "n": 1}]
+    finally:
+        await pipeline.stop()
+    assert not pipeline.running
+
+
+def test_seen_activities_window_and_bound():
+    seen = SeenActivities(maxsize=2, window=10)
+    assert seen.add("http://a.test/1", now=0)
+    assert not seen.add("http://a.test/1", now=1)
+    # same activity, another recipient
+    assert seen.add("http://a.test/1", "http://local.test/actor", now=1)
+    # evicts the oldest id
+    assert seen.add("http://a.test/2", now=2)
+    assert len(seen) == 2
+    assert seen.add("http://a.test/1", now=3)
+    # forgotten after the window
+    assert seen.add("http://a.test/2", now=12.5)
+    seen.discard("http://a.test/2")
+    assert seen.add("http://a.test/2", now=13)
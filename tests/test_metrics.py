@@ -0,0 +1,69 @@
+import logging
+
+import pytest
+
+from activitypub_mincore.support.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    Registry,
+    SampledLogger,
+)
+
+
+def test_text_format():
+    registry = Registry()
+    requests = Counter("requests_total", "Requests", ("status",), registry=registry)
+    depth = Gauge("depth", "Queue depth", registry=registry)
+    latency = Histogram(
+        "latency_seconds", "Latency", buckets=(0.1, 1), registry=registry
+    )
+    Counter("unused_total", "Never recorded", registry=registry)
+
+    requests.inc(status="202")
+    requests.inc(2, status="400")
+    depth.set_function(lambda: 3)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{status="202"} 1',
+        'requests_total{status="400"} 2',
+        "# HELP depth Queue depth",
+        "# TYPE depth gauge",
+        "depth 3",
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 5.55",
+        "latency_seconds_count 3",
+    ]
+    with pytest.raises(ValueError):
+        requests.inc()
+    with pytest.raises(ValueError):
+        Gauge("depth", "Duplicate", registry=registry)
+
+
+def test_sampled_logger(caplog):
+    caplog.set_level(logging.INFO)
+    sampled = SampledLogger(logging.getLogger("test"), interval=60)
+    for n in range(5):
+        sampled.info("message %d", n)
+    assert [r.getMessage() for r in caplog.records] == ["message 0"]
+    assert sampled.suppressed == 4
+    sampled.interval = 0
+    sampled.info("message %d", 5)
+    assert caplog.records[-1].getMessage() == (
+        "message 5 (4 similar messages suppressed)"
+    )
+    try:
+        raise RuntimeError("down")
+    except RuntimeError as ex:
+        sampled.error("failed: %r", ex, exc_info=ex)
+    assert caplog.records[-1].levelno == logging.ERROR
+    assert caplog.records[-1].exc_info is not None
@@ -0,0 +1,114 @@
+import httpx
+
+from activitypub_mincore.support.outbound import BreakerPolicy, DeliveryQueue
+from activitypub_mincore.support.retry import RetryPolicy
+from activitypub_mincore.support.serialization import loads
+
+ACTIVITY = {"type": "Create", "object": {"type": "Note", "content": "Hi"}}
+
+
+class StubClient:
+    def __init__(self, failing: set[str]):
+        self.failing = failing
+        self.posts: list[str] = []
+
+    async def post(self, url: str, **kwargs):
+        self.posts.append(url)
+        response = httpx.Response(503 if url in self.failing else 202)
+        response.request = httpx.Request("post", url)
+        return response
+
+
+def test_backoff_grows_with_jitter():
+    policy = RetryPolicy(base=1.0, cap=60.0)
+    for attempt in range(1, 10):
+        ceiling = min(60.0, 2 ** (attempt - 1))
+        assert ceiling / 2 <= policy.delay(attempt) <= ceiling
+
+
+def test_queue_survives_reopen(tmp_path):
+    path = tmp_path / "queue.db"
+    queue = DeliveryQueue(path)
+    queue.enqueue(ACTIVITY, ["http://a.test/inbox", "http://b.test/inbox"])
+    queue.close()
+    queue = DeliveryQueue(path)
+    due = queue.due(10)
+    assert [d.inbox for d in due] == ["http://a.test/inbox", "http://b.test/inbox"]
+    assert loads(queue.payload(due[0].payload_id)) == ACTIVITY
+
+
+async def test_drain_retries_then_dead_letters():
+    queue = DeliveryQueue(
+        retry=RetryPolicy(base=0.001, max_attempts=2),
+        breaker=BreakerPolicy(threshold=100),
+    )
+    queue.enqueue(ACTIVITY, ["http://ok.test/inbox", "http://bad.test/inbox"])
+    client = StubClient({"http://bad.test/inbox"})
+
+    result = await queue.drain(client)
+    assert result.stats.delivered == 1 and result.stats.failed == 1
+    assert not result.dead
+    assert queue.pending_count() == 1
+
+    assert queue.due(1, now=0) == []
+    for d in queue.due(10, now=float("inf")):
+        assert queue.fail(d, RuntimeError("down"))
+    assert queue.pending_count() == 0
+    assert [inbox for inbox, _, _ in queue.dead_letters()] == ["http://bad.test/inbox"]
+    assert queue.purge_dead() == 1
+
+
+async def test_circuit_breaker_holds_back_deliveries():
+    queue = DeliveryQueue(
+        retry=RetryPolicy(base=0.001), breaker=BreakerPolicy(threshold=2, cooldown=60)
+    )
+    inbox = "http://bad.test/inbox"
+    for _ in range(3):
+        queue.enqueue(ACTIVITY, [inbox])
+    for d in queue.due(2):
+        queue.fail(d, RuntimeError("down"))
+    assert queue.is_open(inbox)
+    client = StubClient(set())
+    result = await queue.drain(client)
+    assert client.posts == []
+    assert result.stats.attempted == 0
+
+
+def test_enqueue_skips_open_circuits():
+    queue = DeliveryQueue(breaker=BreakerPolicy(threshold=1, cooldown=60))
+    queue.enqueue(ACTIVITY, ["http://bad.test/inbox"])
+    (delivery,) = queue.due(10)
+    queue.fail(delivery, RuntimeError("down"))
+    queue.enqueue(ACTIVITY, ["http://bad.test/inbox", "http://ok.test/inbox"])
+    assert queue.pending_count() == 2
+    assert [d.inbox for d in queue.due(10, now=float("inf"))] == [
+        "http://ok.test/inbox",
+        "http://bad.test/inbox",
+    ]
+
+
+def test_cancelled_deliveries_are_not_dead_lettered():
+    queue = DeliveryQueue(retry=RetryPolicy(max_attempts=1))
+    queue.enqueue(ACTIVITY, ["http://a.test/inbox", "http://b.test/inbox"])
+    in_flight = queue.due(10)
+    assert queue.cancel("http://a.test/inbox") == 1
+    assert not queue.fail(in_flight[0], RuntimeError("down"))
+    assert queue.pending_count() == 1
+    assert queue.cancel("http://b.test/inbox") == 1
+    assert queue._db.execute("SELECT COUNT(*) FROM payloads").fetchone() == (0,)
+
+
+async def test_drain_caps_dead_letters(caplog):
+    queue = DeliveryQueue(
+        retry=RetryPolicy(max_attempts=1),
+        breaker=BreakerPolicy(threshold=100),
+        dead_letter_limit=2,
+    )
+    inboxes = [f"http://bad{i}.test/inbox" for i in range(5)]
+    queue.enqueue(ACTIVITY, inboxes)
+    result = await queue.drain(StubClient(set(inboxes)))
+    assert result.dead == set(inboxes)
+    assert len(list(queue.dead_letters())) == 2
+    assert [r.message for r in caplog.records if r.levelname == "ERROR"] == [
+        "5 deliveries to 5 inboxes dead-lettered"
+    ]
@@ -0,0 +1,91 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from activitypub_mincore import actor, publisher
+from activitypub_mincore.publisher import app as publisher_app
+from activitypub_mincore.support.outbox import Outbox
+from activitypub_mincore.support.serialization import dumps
+
+
+@pytest.fixture
+def app():
+    return publisher_app
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    outbox = Outbox(capacity=10, page_size=4)
+    monkeypatch.setattr(publisher, "outbox", outbox)
+    yield outbox
+    outbox.close()
+
+
+def test_outbox_capacity():
+    outbox = Outbox(capacity=3)
+    # Two owners publishing in turn, each keeping its latest three
+    for n in range(5):
+        outbox.append("a", dumps({"n": n}))
+        outbox.append("b", dumps({"n": n}))
+    outbox.append("c", dumps({"n": 0}))
+    assert outbox.count("a") == 3
+    assert outbox.count("b") == 3
+    assert outbox.count("c") == 1
+    assert len(outbox) == 7
+    assert outbox.bounds("a") == (5, 9)
+    assert outbox.page_seqs("a", limit=10) == [9, 7, 5]
+    assert outbox.page_seqs("b", limit=10) == [10, 8, 6]
+    assert outbox.page_seqs("a", max_seq=9, limit=1) == [7]
+    assert outbox.page_seqs("a", min_seq=5, limit=1) == [7]
+
+
+def test_outbox_pagination(test_client: TestClient, outbox: Outbox):
+    local_actor = actor.get_local_actor()
+    outbox_uri = local_actor["outbox"]
+    for n in range(12):
+        outbox.append(local_actor["id"], dumps({"type": "Create", "n": n}))
+
+    response = test_client.get(outbox_uri)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/activity+json"
+    collection = response.json()
+    assert collection["type"] == "OrderedCollection"
+    assert collection["totalItems"] == 10
+    etag = response.headers["etag"]
+    response = test_client.get(outbox_uri, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    for query in ["?page=false", "?page=", "?page=0"]:
+        response = test_client.get(outbox_uri + query)
+        assert response.json()["type"] == "OrderedCollection"
+
+    # Newest first, following `next` to the end
+    items: list[int] = []
+    page_uri, pages = collection["first"], []
+    while page_uri:
+        page = test_client.get(page_uri).json()
+        assert page["type"] == "OrderedCollectionPage"
+        assert page["partOf"] == outbox_uri
+        items.extend(item["n"] for item in page["orderedItems"])
+        pages.append(page)
+        page_uri = page.get("next")
+    assert items == list(range(11, 1, -1))
+    assert [len(page["orderedItems"]) for page in pages] == [4, 4, 2]
+
+    # And back with `prev`, to the newest
+    page = test_client.get(pages[-1]["prev"]).json()
+    assert [item["n"] for item in page["orderedItems"]] == [7, 6, 5, 4]
+    assert page["next"] == pages[1]["next"]
+    response = test_client.get(pages[0]["prev"])
+    assert response.json()["orderedItems"] == []
+    etag = response.headers["etag"]
+    response = test_client.get(pages[0]["prev"], headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    # A new activity changes the collection and the empty newer page
+    outbox.append(local_actor["id"], dumps({"type": "Create", "n": 12}))
+    response = test_client.get(pages[0]["prev"], headers={"If-None-Match": etag})
+    assert [item["n"] for item in response.json()["orderedItems"]] == [12]
+
+
+def test_unknown_outbox(test_client: TestClient, outbox: Outbox):
+    response = test_client.get(f"{test_client.base_url}/actors/none/outbox")
+    assert response.status_code == 404
@@ -1,9 +1,17 @@
 import pytest
 from fastapi.testclient import TestClient
 
+from activitypub_mincore import actor, publisher
 from activitypub_mincore.publisher import app as publisher_app
 from activitypub_mincore.publisher import publish_once
-from tests.support import MockServer
+from activitypub_mincore.support import ingest
+from activitypub_mincore.support.admission import AdmissionConfig
+from activitypub_mincore.support.ingest import SeenActivities
+from activitypub_mincore.support.outbound import DeliveryQueue
+from activitypub_mincore.support.outbox import Outbox
+from activitypub_mincore.support.serialization import loads
+from activitypub_mincore.support.store import MemoryFollowerStore
+from tests.support import MockServer, wait_for_inbox
 
 
 @pytest.fixture
@@ -11,9 +19,24 @@ def app():
     return publisher_app
 
 
+@pytest.fixture(autouse=True)
+def reset_publisher(monkeypatch):
+    monkeypatch.setattr(publisher, "delivery_queue", DeliveryQueue())
+    monkeypatch.setattr(publisher, "follower_store", MemoryFollowerStore())
+    monkeypatch.setattr(publisher, "seen_activities", SeenActivities())
+    monkeypatch.setattr(publisher, "outbox", Outbox())
+    publisher.admission.configure(AdmissionConfig())
+    yield
+    publisher.admission.configure(AdmissionConfig())
+
+
 async def test_follow_handling(
-    test_client: TestClient, mock_actor: dict, mock_server: MockServer
+    test_client: TestClient, mock_actor: dict, mock_server: MockServer, monkeypatch
 ):
+    publish_requests = []
+    monkeypatch.setattr(
+        publisher, "request_publish", lambda: publish_requests.append(1)
+    )
     response = test_client.get(f"{test_client.base_url}/actor")
     assert response.is_success
     # post Follow request
@@ -29,8 +52,11 @@ async def test_follow_handling(
             "object": actor["id"],
         },
     )
-    assert response.is_success
+    assert response.status_code == 202
+    wait_for_inbox(test_client, publisher.inbox_pipeline)
     assert mock_server.received_post({"type": "Accept"}), "No accept"
+    # The new follower triggers a publication cycle
+    assert publish_requests == [1]
     # publish
     await publish_once()
     assert mock_server.received_post({"type": "Create"}), "No Create"
@@ -49,3 +75,188 @@ async def test_follow_handling(
     # # publish again, should not receive this one
     # await publish_once()
     # assert mock_server.received_post({"type": "Create"}) is None, "Unexpected Create"
+
+
+async def test_shared_inbox_delivery(
+    test_client: TestClient, mock_actor: dict, mock_server: MockServer
+):
+    shared_inbox = "http://server.test/inbox"
+    inbox = test_client.get(f"{test_client.base_url}/actor").json()["inbox"]
+    for name in ["alice", "bob"]:
+        follower_uri = f"http://server.test/{name}"
+        mock_server.add_response(
+            follower_uri,
+            {
+                "id": follower_uri,
+                "type": "Person",
+                "inbox": f"{follower_uri}/inbox",
+                "outbox": f"{follower_uri}/outbox",
+                "endpoints": {"sharedInbox": shared_inbox},
+            },
+        )
+        response = test_client.post(
+            inbox,
+            json={
+                "id": f"{follower_uri}/follow",
+                "type": "Follow",
+                "actor": follower_uri,
+                "object": f"{test_client.base_url}/actor",
+            },
+        )
+        assert response.is_success
+    wait_for_inbox(test_client, publisher.inbox_pipeline)
+    mock_server.requests.clear()
+    await publish_once()
+    creates = [r for r in mock_server.requests if r.method == "post"]
+    assert [r.url for r in creates] == [shared_inbox]
+
+
+def test_undo_follow_drops_queued_deliveries(test_client: TestClient):
+    local_actor = test_client.get(f"{test_client.base_url}/actor").json()
+    followers = publisher.followers_of(local_actor)
+    shared_inbox = "http://server.test/inbox"
+    followers.add("http://server.test/alice/inbox", "http://server.test/f/1")
+    followers.add(
+        "http://server.test/bob/inbox", "http://server.test/f/2", shared_inbox
+    )
+    followers.add(
+        "http://server.test/carol/inbox", "http://server.test/f/3", shared_inbox
+    )
+    publisher.delivery_queue.enqueue({"type": "Create"}, followers.delivery_targets())
+    for follow_id in ["http://server.test/f/1", "http://server.test/f/2"]:
+        undo = {"type": "Undo", "object": follow_id}
+        publisher.handle_undo_follow(local_actor, undo)
+    # carol is still reached through the shared inbox
+    assert [d.inbox for d in publisher.delivery_queue.due(10)] == [shared_inbox]
+
+
+def test_invalid_inbox_activity(test_client: TestClient):
+    inbox = test_client.get(f"{test_client.base_url}/actor").json()["inbox"]
+    response = test_client.post(inbox, json={"type": "Like", "object": "x"})
+    assert response.status_code == 400
+
+
+def test_inbox_body_limits(test_client: TestClient, monkeypatch):
+    inbox = test_client.get(f"{test_client.base_url}/actor").json()["inbox"]
+    headers = {"Content-Type": "application/activity+json"}
+    response = test_client.post(
+        inbox, content=b"<xml/>", headers={"Content-Type": "text/xml"}
+    )
+    assert response.status_code == 415
+    response = test_client.post(inbox, content=b"{not json", headers=headers)
+    assert response.status_code == 400
+    monkeypatch.setattr(ingest, "max_activity_size", 64)
+    response = test_client.post(inbox, content=b" " * 65, headers=headers)
+    assert response.status_code == 413
+
+    def chunks():
+        # no Content-Length, so the limit applies while streaming
+        yield b'{"type": "Follow", "padding": "'
+        yield b"x" * 64
+        yield b'"}'
+
+    response = test_client.post(inbox, content=chunks(), headers=headers)
+    assert response.status_code == 413
+
+
+def test_metrics_endpoint(test_client: TestClient):
+    inbox = test_client.get(f"{test_client.base_url}/actor").json()["inbox"]
+    test_client.post(inbox, json={"type": "Like", "object": "x"})
+    response = test_client.get(f"{test_client.base_url}/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'mincore_inbox_requests_total{status="400"}' in response.text
+    assert "mincore_inbox_request_seconds_count" in response.text
+    assert "mincore_followers 0" in response.text
+
+
+async def test_hosted_actors_have_their_own_followers(
+    test_client: TestClient, mock_actor: dict, mock_server: MockServer
+):
+    hosted = [
+        actor.add_local_actor(actor.create_actor(str(test_client.base_url), name))
+        for name in ["news", "weather"]
+    ]
+    document = test_client.get(hosted[0]["id"]).json()
+    assert document == hosted[0]
+    response = test_client.post(
+        hosted[1]["inbox"],
+        json={
+            "id": f"{mock_actor['id']}/follow",
+            "type": "Follow",
+            "actor": mock_actor["id"],
+            "object": hosted[1]["id"],
+        },
+    )
+    assert response.status_code == 202
+    wait_for_inbox(test_client, publisher.inbox_pipeline)
+    assert mock_server.received_post({"type": "Accept", "actor": hosted[1]["id"]})
+    assert not publisher.follower_store
+    assert len(publisher.followers_of(hosted[1])) == 1
+    # The collection the notes are addressed to
+    followers = test_client.get(hosted[1]["followers"]).json()
+    assert followers["id"] == hosted[1]["followers"]
+    assert followers["totalItems"] == 1
+    assert test_client.get(hosted[0]["followers"]).json()["totalItems"] == 0
+
+    mock_server.requests.clear()
+    await publish_once()
+    creates = [
+        loads(r.options["content"]) for r in mock_server.requests if r.method == "post"
+    ]
+    assert [c["actor"] for c in creates] == [hosted[1]["id"]]
+    assert creates[0]["object"]["to"] == hosted[1]["followers"]
+    # The Create is kept in the actor's outbox, as delivered
+    outbox = test_client.get(f"{hosted[1]['outbox']}?page=true").json()
+    assert outbox["orderedItems"] == creates
+    unknown_inbox = f"{test_client.base_url}/actors/unknown/inbox"
+    assert test_client.post(unknown_inbox, json={}).status_code == 403
+
+
+async def test_redelivered_follow_is_dropped(
+    test_client: TestClient, mock_actor: dict, mock_server: MockServer
+):
+    local_actor = test_client.get(f"{test_client.base_url}/actor").json()
+    follow = {
+        "id": "http://server.test/follow",
+        "type": "Follow",
+        "actor": mock_actor["id"],
+        "object": local_actor["id"],
+    }
+    for _ in range(3):
+        assert test_client.post(local_actor["inbox"], json=follow).status_code == 202
+        wait_for_inbox(test_client, publisher.inbox_pipeline)
+    responses = [r for r in mock_server.requests if r.method == "post"]
+    assert len(responses) == 1
+    assert mock_server.received_post({"type": "Accept"})
+
+
+def test_admission_control(test_client: TestClient, mock_actor: dict):
+    inbox = test_client.get(f"{test_client.base_url}/actor").json()["inbox"]
+
+    def follow(n: int, sender: str = mock_actor["id"]):
+        return test_client.post(
+            inbox,
+            json={
+                "id": f"{sender}/follows/{n}",
+                "type": "Follow",
+                "actor": sender,
+                "object": f"{test_client.base_url}/actor",
+            },
+        )
+
+    # Limits hardly refill during the test
+    publisher.admission.configure(
+        AdmissionConfig(actor_rate=0.001, actor_burst=2, host_rate=0.001, host_burst=4)
+    )
+    assert [follow(n).status_code for n in range(3)] == [202, 202, 429]
+    response = follow(3, sender="http://other.test/actor")
+    assert response.status_code == 202
+    # The client address is now over its limit, whoever the sender is
+    response = follow(4, sender="http://third.test/actor")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "5"
+    assert test_client.get(f"{test_client.base_url}/actor").status_code == 200
+
+    publisher.admission.configure(AdmissionConfig(max_in_flight=0))
+    assert follow(5).status_code == 503
@@ -0,0 +1,68 @@
+import asyncio
+
+from activitypub_mincore.support.schedule import PublishScheduler
+
+
+async def test_overrunning_cycles_skip_ticks_without_overlapping():
+    running = 0
+    overlapped = False
+
+    async def slow_cycle():
+        nonlocal running, overlapped
+        running += 1
+        overlapped = overlapped or running > 1
+        await asyncio.sleep(0.25)
+        running -= 1
+
+    scheduler = PublishScheduler(slow_cycle, interval=0.1)
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(0.75)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert not overlapped
+    # Each cycle overruns two ticks, so cycles start every third tick
+    # (0, 0.3, 0.6) and two have finished
+    assert scheduler.cycles == 2
+    assert scheduler.skipped == 4
+    assert scheduler.last_duration >= 0.25
+
+
+async def test_triggers_coalesce():
+    release = asyncio.Event()
+    cycles = 0
+
+    async def cycle():
+        nonlocal cycles
+        cycles += 1
+        await release.wait()
+
+    scheduler = PublishScheduler(cycle, interval=None)
+    scheduler.trigger()
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(0.01)
+    assert cycles == 1
+    for _ in range(3):
+        scheduler.trigger()
+    release.set()
+    await asyncio.sleep(0.01)
+    assert cycles == 2
+    await asyncio.sleep(0.05)
+    assert cycles == 2
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def test_failed_cycle_does_not_stop_the_schedule():
+    calls = 0
+
+    async def failing_cycle():
+        nonlocal calls
+        calls += 1
+        raise OSError("unreachable")
+
+    scheduler = PublishScheduler(failing_cycle, interval=0.01)
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert calls > 1
@@ -0,0 +1,53 @@
+import importlib
+import sys
+
+import pytest
+
+from activitypub_mincore.support import serialization as serialization_module
+
+ACTIVITY = {
+    "type": "Create",
+    "actor": "http://server.test/actor",
+    "object": {"type": "Note", "content": "Grüße, 世界", "to": ["a", "b"]},
+}
+
+
+@pytest.fixture(params=["orjson", "json"])
+def serialization(request, monkeypatch):
+    """The module as loaded with orjson, and as loaded without it."""
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setitem(sys.modules, "orjson", None)
+    yield importlib.reload(serialization_module)
+    monkeypatch.undo()
+    importlib.reload(serialization_module)
+
+
+def test_backend(serialization, request):
+    uses_orjson = serialization.orjson is not None
+    assert uses_orjson == (request.node.callspec.params["serialization"] == "orjson")
+
+
+def test_round_trip(serialization):
+    body = serialization.dumps(ACTIVITY)
+    assert isinstance(body, bytes)
+    assert body.startswith(b'{"type":"Create","actor"')
+    assert "Grüße, 世界".encode() in body
+    for data in (body, bytearray(body), memoryview(body), body.decode()):
+        assert serialization.loads(data) == ACTIVITY
+
+
+def test_canonical_dumps(serialization):
+    reordered = {"object": ACTIVITY["object"], "type": "Create", "actor": "x"}
+    assert serialization.canonical_dumps(reordered) == serialization.canonical_dumps(
+        dict(reversed(reordered.items()))
+    )
+    assert serialization.canonical_dumps({"b": 1, "a": [2, {"d": 3, "c": 4}]}) == (
+        b'{"a":[2,{"c":4,"d":3}],"b":1}'
+    )
+
+
+def test_invalid_json(serialization):
+    with pytest.raises(ValueError):
+        serialization.loads(b"{")
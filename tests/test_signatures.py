@@ -0,0 +1,253 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from activitypub_mincore import actor, publisher
+from activitypub_mincore.publisher import app as publisher_app
+from activitypub_mincore.support.ingest import SeenActivities
+from activitypub_mincore.support.outbound import DeliveryQueue
+from activitypub_mincore.support.serialization import ACTIVITY_HEADERS, dumps
+from activitypub_mincore.support.signatures import (
+    FanoutSigner,
+    PublicKey,
+    PublicKeyCache,
+    SignatureError,
+    SignatureVerifier,
+    Signer,
+    body_digest,
+    generate_private_key,
+    http_date,
+    load_or_create_private_key,
+    parse_signature,
+    public_key_pem,
+)
+from activitypub_mincore.support.store import MemoryFollowerStore
+from tests.support import MockServer, wait_for_inbox
+
+pytest.importorskip("cryptography")
+
+INBOX = "http://server.test/users/a/inbox"
+
+
+@pytest.fixture(scope="module")
+def private_key():
+    return generate_private_key()
+
+
+@pytest.fixture
+def app():
+    return publisher_app
+
+
+@pytest.fixture
+def signing(monkeypatch):
+    monkeypatch.setattr(publisher, "follower_store", MemoryFollowerStore())
+    monkeypatch.setattr(publisher, "seen_activities", SeenActivities())
+    actor.configure_signing()
+    publisher.signature_verifier.required = True
+    yield
+    publisher.signature_verifier.required = False
+    actor.configure_signing(False)
+    actor.public_keys.clear()
+
+
+def _remote_actor(mock_actor: dict, private_key) -> dict:
+    return {
+        **mock_actor,
+        "publicKey": {
+            "id": f"{mock_actor['id']}#main-key",
+            "owner": mock_actor["id"],
+            "publicKeyPem": public_key_pem(private_key),
+        },
+    }
+
+
+async def test_sign_and_verify(private_key):
+    signer = Signer("http://server.test/actor#main-key", private_key)
+    keys = PublicKeyCache()
+    keys.add_actor(
+        _remote_actor({"id": "http://server.test/actor"}, private_key),
+        "http://server.test/actor",
+    )
+
+    async def get_key(key_id: str, refresh: bool) -> PublicKey:
+        return keys.get(key_id)
+
+    verifier = SignatureVerifier(get_key)
+    body = b'{"type":"Follow"}'
+    headers = await signer.headers("POST", INBOX, body)
+    assert parse_signature(headers["Signature"])["headers"] == (
+        "(request-target) host date digest"
+    )
+    headers = {name.lower(): value for name, value in headers.items()}
+    owner = await verifier.verify("POST", "/users/a/inbox", headers)
+    assert owner == "http://server.test/actor"
+
+    with pytest.raises(SignatureError, match="Invalid signature"):
+        await verifier.verify("POST", "/users/b/inbox", headers)
+    with pytest.raises(SignatureError, match="Invalid signature"):
+        await verifier.verify("POST", "/users/a/inbox", {**headers, "digest": "x"})
+    stale = await signer.headers(
+        "POST", INBOX, body, date=http_date(time.time() - 7200)
+    )
+    stale = {name.lower(): value for name, value in stale.items()}
+    with pytest.raises(SignatureError, match="Date"):
+        await verifier.verify("POST", "/users/a/inbox", stale)
+    # A GET has no digest
+    headers = await signer.headers("GET", "http://server.test/users/a")
+    assert "Digest" not in headers
+
+
+async def test_fanout_signer(private_key):
+    signers = {"http://local.test/actor": Signer("key", private_key)}
+    sign = FanoutSigner(signers.get)
+    body = dumps({"type": "Create", "actor": "http://local.test/actor"})
+    first = await sign(INBOX, body)
+    second = await sign("http://other.test/inbox", body)
+    assert first["Date"] == second["Date"] and first["Digest"] == second["Digest"]
+    assert first["Host"] == "server.test" and second["Host"] == "other.test"
+    assert first["Signature"] != second["Signature"]
+    assert await sign(INBOX, dumps({"actor": "http://unknown.test/actor"})) == {}
+
+
+def test_persisted_keys(tmp_path):
+    key = load_or_create_private_key(tmp_path / "keys" / "a.pem")
+    again = load_or_create_private_key(tmp_path / "keys" / "a.pem")
+    assert public_key_pem(key) == public_key_pem(again)
+    assert (tmp_path / "keys" / "a.pem").stat().st_mode & 0o777 == 0o600
+    assert len(list((tmp_path / "keys").iterdir())) == 1
+
+
+async def test_signed_inbox(
+    signing,
+    test_client: TestClient,
+    mock_actor: dict,
+    mock_server: MockServer,
+    private_key,
+    monkeypatch,
+):
+    mock_server.add_response(mock_actor["id"], _remote_actor(mock_actor, private_key))
+    local_actor = actor.get_local_actor()
+    # The key is generated when first needed
+    assert local_actor["id"] not in actor._private_keys
+    public_key = test_client.get(local_actor["id"]).json()["publicKey"]
+    assert public_key["owner"] == local_actor["id"]
+    signer = Signer(f"{mock_actor['id']}#main-key", private_key)
+    inbox = local_actor["inbox"]
+
+    async def post(activity: dict, sign_as: Signer | None = signer, body=None):
+        body = body or dumps(activity)
+        headers = dict(ACTIVITY_HEADERS)
+        if sign_as is not None:
+            headers.update(await sign_as.headers("POST", inbox, dumps(activity)))
+        return test_client.post(inbox, content=body, headers=headers)
+
+    follow = {
+        "id": "http://server.test/follows/signed",
+        "type": "Follow",
+        "actor": mock_actor["id"],
+        "object": local_actor["id"],
+    }
+    assert (await post(follow, sign_as=None)).status_code == 401
+    # Only inbox POSTs are verified, so other paths can't have keys fetched
+    stranger = Signer("http://stranger.test/actor#main-key", private_key)
+    other_path = f"{test_client.base_url}/elsewhere"
+    headers = dict(ACTIVITY_HEADERS)
+    headers.update(await stranger.headers("POST", other_path, dumps(follow)))
+    response = test_client.post(other_path, content=dumps(follow), headers=headers)
+    assert response.status_code == 403
+    assert not [r for r in mock_server.requests if "stranger.test" in r.url]
+    tampered = dumps({**follow, "object": "http://server.test/other"})
+    assert (await post(follow, body=tampered)).status_code == 401
+    impostor = {**follow, "actor": "http://server.test/other"}
+    assert (await post(impostor)).status_code == 401
+    other_key = Signer(f"{mock_actor['id']}#main-key", generate_private_key())
+    assert (await post(follow, sign_as=other_key)).status_code == 401
+
+    assert (await post(follow)).status_code == 202
+    wait_for_inbox(test_client, publisher.inbox_pipeline)
+    # The Accept is signed by the local actor
+    accept = mock_server.received_post({"type": "Accept"})
+    assert accept is not None
+    signature = parse_signature(accept.options["headers"]["Signature"])
+    assert signature["keyId"] == public_key["id"]
+    assert len(publisher.follower_store) == 1
+
+    # And so are deliveries
+    monkeypatch.setattr(publisher, "delivery_queue", DeliveryQueue())
+    await publisher.publish_once()
+    create = mock_server.received_post({"type": "Create"})
+    assert create is not None
+    headers = create.options["headers"]
+    assert headers["Digest"] == body_digest(create.options["content"])
+    signature = parse_signature(headers["Signature"])
+    assert signature["keyId"] == public_key["id"]
+
+
+async def test_spoofed_key(
+    signing,
+    test_client: TestClient,
+    mock_actor: dict,
+    mock_server: MockServer,
+    private_key,
+):
+    victim_key_id = f"{mock_actor['id']}#main-key"
+    evil = _remote_actor({**mock_actor, "id": "http://evil.test/actor"}, private_key)
+    evil["publicKey"] = {
+        **evil["publicKey"],
+        "id": victim_key_id,
+        "owner": mock_actor["id"],
+    }
+    keys = PublicKeyCache()
+    keys.add_actor(evil, evil["id"])
+    assert keys.get(victim_key_id) is None
+    # Nor is an actor's own key taken from a document served elsewhere
+    keys.add_actor(_remote_actor(mock_actor, private_key), evil["id"])
+    assert keys.get(victim_key_id) is None
+
+    mock_server.add_response(evil["id"], evil)
+    await actor.get_remote_actor(evil["id"])
+    assert actor.public_keys.get(victim_key_id) is None
+    with pytest.raises(SignatureError):
+        await actor.get_public_key(victim_key_id)
+
+    # The victim's document has no key, so the impostor's request is refused
+    local_actor = actor.get_local_actor()
+    follow = {
+        "id": "http://server.test/follows/spoofed",
+        "type": "Follow",
+        "actor": mock_actor["id"],
+        "object": local_actor["id"],
+    }
+    body = dumps(follow)
+    headers = dict(ACTIVITY_HEADERS)
+    signer = Signer(victim_key_id, private_key)
+    headers.update(await signer.headers("POST", local_actor["inbox"], body))
+    response = test_client.post(local_actor["inbox"], content=body, headers=headers)
+    assert response.status_code == 401
+
+
+async def test_key_documents(
+    signing, test_client: TestClient, mock_actor: dict, mock_server: MockServer
+):
+    private_key = generate_private_key()
+    key_id = f"{mock_actor['id']}/key"
+    remote_actor = _remote_actor(mock_actor, private_key)
+    remote_actor["publicKey"] = {**remote_actor["publicKey"], "id": key_id}
+    mock_server.add_response(mock_actor["id"], remote_actor)
+    mock_server.add_response(key_id, remote_actor["publicKey"])
+    # A path-style key id is resolved through the owner named by its document
+    public_key = await actor.get_public_key(key_id)
+    assert public_key.owner == mock_actor["id"]
+    # and isn't fetched again until it's been cached for a while
+    mock_server.requests.clear()
+    assert await actor.get_public_key(key_id, refresh=True) is public_key
+    assert not mock_server.requests
+
+    # Unknown keys are remembered, and not looked for on every request
+    unknown_key_id = f"{mock_actor['id']}#other-key"
+    for _ in range(3):
+        with pytest.raises(SignatureError):
+            await actor.get_public_key(unknown_key_id)
+    assert [r.url for r in mock_server.requests] == [mock_actor["id"]]
@@ -0,0 +1,59 @@
+import asyncio
+from pathlib import Path
+
+from activitypub_mincore.support.sink import (
+    SegmentSink,
+    read_segment,
+    replay,
+    segment_paths,
+)
+
+
+async def test_segment_sink(tmp_path: Path):
+    sink = SegmentSink(tmp_path, segment_size=1000, flush_bytes=400)
+    await sink.start()
+    activities = [
+        {"id": f"http://server.test/{n}", "type": "Create"} for n in range(50)
+    ]
+    for activity in activities[:5]:
+        await sink.write(activity)
+    # Batched until flush_bytes are buffered
+    await asyncio.sleep(0.05)
+    assert not segment_paths(tmp_path)
+    for activity in activities[5:]:
+        await sink.write(activity)
+    await sink.stop()
+    segments = segment_paths(tmp_path)
+    assert len(segments) > 1
+    assert all(path.stat().st_size <= 1000 for path in segments)
+    assert list(replay(tmp_path)) == activities
+
+    # Written after a while even when below flush_bytes
+    sink = SegmentSink(tmp_path / "slow", flush_interval=0.05)
+    await sink.start()
+    await sink.write(activities[0])
+    await asyncio.sleep(0.2)
+    assert list(replay(tmp_path / "slow")) == activities[:1]
+    await sink.stop()
+
+
+async def test_segment_sink_backpressure(tmp_path: Path):
+    sink = SegmentSink(tmp_path, flush_interval=10, max_buffer=100)
+    await sink.start()
+    activity = {"type": "Create", "content": "x" * 60}
+    await sink.write(activity)
+    await sink.write(activity)
+    # Waits for the buffered activities to be written
+    write = asyncio.create_task(sink.write(activity))
+    await asyncio.sleep(0.05)
+    assert write.done()
+    await sink.stop()
+    assert len(list(replay(tmp_path))) == 3
+
+
+def test_read_segment_skips_partial_line(tmp_path: Path):
+    path = tmp_path / "segment.jsonl"
+    path.write_bytes(b'{"n":1}\n{"n":2}\n{"n":')
+    assert list(read_segment(path)) == [b'{"n":1}', b'{"n":2}']
+    (tmp_path / "empty.jsonl").write_bytes(b"")
+    assert list(read_segment(tmp_path / "empty.jsonl")) == []
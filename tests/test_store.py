@@ -0,0 +1,84 @@
+import pytest
+
+from activitypub_mincore.support.store import (
+    FollowerStore,
+    MemoryFollowerStore,
+    SqliteFollowerStore,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path) -> FollowerStore:
+    if request.param == "memory":
+        return MemoryFollowerStore()
+    return SqliteFollowerStore(tmp_path / "followers.db")
+
+
+def test_follower_store(store: FollowerStore):
+    assert not store
+    store.add("http://a.test/alice/inbox", "http://a.test/f/1", "http://a.test/inbox")
+    store.add("http://a.test/bob/inbox", "http://a.test/f/2", "http://a.test/inbox")
+    store.add("http://b.test/carol/inbox", "http://b.test/f/3")
+    assert store and len(store) == 3
+    assert "http://b.test/carol/inbox" in store
+    assert sorted(store.delivery_targets()) == [
+        "http://a.test/inbox",
+        "http://b.test/carol/inbox",
+    ]
+    assert sorted(store.covered_inboxes("http://a.test/inbox")) == [
+        "http://a.test/alice/inbox",
+        "http://a.test/bob/inbox",
+    ]
+    assert store.remove_by_follow("http://a.test/f/2") == "http://a.test/bob/inbox"
+    assert store.remove_by_follow("http://a.test/f/2") is None
+    assert store.remove("http://b.test/carol/inbox") == "http://b.test/carol/inbox"
+    assert store.remove("http://b.test/carol/inbox") is None
+    assert list(store.inboxes()) == ["http://a.test/alice/inbox"]
+
+
+def test_refollow_replaces_follow_id(store: FollowerStore):
+    store.add("http://a.test/alice/inbox", "http://a.test/f/1")
+    store.add("http://a.test/alice/inbox", "http://a.test/f/2")
+    assert len(store) == 1
+    assert store.remove_by_follow("http://a.test/f/1") is None
+    assert store.pop_by_follow("http://a.test/f/2") == (
+        "http://a.test/alice/inbox",
+        "http://a.test/alice/inbox",
+    )
+
+
+def test_follows_without_ids(store: FollowerStore):
+    store.add("http://a.test/alice/inbox", None)
+    store.add("http://b.test/bob/inbox", None)
+    store.add("http://c.test/carol/inbox", "http://c.test/f/1")
+    assert sorted(store.inboxes()) == [
+        "http://a.test/alice/inbox",
+        "http://b.test/bob/inbox",
+        "http://c.test/carol/inbox",
+    ]
+    # A Follow id claimed by another follower leaves the first one in place
+    store.add("http://a.test/alice/inbox", "http://c.test/f/1")
+    assert len(store) == 3
+    assert store.remove_by_follow("http://c.test/f/1") == "http://a.test/alice/inbox"
+    assert len(store) == 2
+
+
+def test_sqlite_store_is_persistent(tmp_path):
+    path = tmp_path / "followers.db"
+    store = SqliteFollowerStore(path)
+    store.add("http://a.test/alice/inbox", "http://a.test/f/1")
+    store.close()
+    assert "http://a.test/alice/inbox" in SqliteFollowerStore(path)
+
+
+def test_owners_have_separate_followers(store: FollowerStore):
+    other = store.for_owner("http://local.test/actors/other")
+    assert store.for_owner("http://local.test/actors/other") is other
+    store.add("http://a.test/alice/inbox", "http://a.test/f/1")
+    other.add("http://a.test/alice/inbox", "http://a.test/f/1")
+    other.add("http://b.test/bob/inbox", "http://b.test/f/2")
+    assert len(store) == 1 and len(other) == 2
+    assert other.remove_by_follow("http://a.test/f/1") == "http://a.test/alice/inbox"
+    assert "http://a.test/alice/inbox" in store
+    other.clear()
+    assert not other and store
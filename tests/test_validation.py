@@ -1,9 +1,26 @@
+import io
 from pathlib import Path
 
 import pytest
+import referencing
 from jsonschema import ValidationError
+from jsonschema.exceptions import SchemaError
 
-from activitypub_mincore.support.validation import MINCORE_ACTIVITY_VALIDATOR
+from activitypub_mincore.support.cache import LRUCache
+from activitypub_mincore.support.serialization import dumps
+from activitypub_mincore.support.validation import (
+    MINCORE_ACTIVITY_VALIDATOR,
+    VALIDATORS,
+    MemoizedValidator,
+    ValidatorRegistry,
+    build_schema_bundle,
+    check_schemas,
+    create_activity_validator,
+    load_schema_bundle,
+    retrieve_schema,
+    schema_retriever,
+    validate_many,
+)
 
 SCHEMA_DIR = Path(__file__).parent.parent / "activitypub_mincore" / "schemas"
 
@@ -42,3 +59,88 @@ def test_activity_validation(activity: dict, outcome: str):
         assert outcome == "pass", lambda: f"Unexpected pass: {activity}"
     except ValidationError as ex:
         assert outcome == "fail", ex.message
+
+
+def test_memoized_validation():
+    cache: LRUCache = LRUCache(8)
+    validator = MemoizedValidator(create_activity_validator(), cache)
+    valid = {"type": "Follow", "object": "https://server.test/"}
+    invalid = {"type": "Follow", "object": "@foo@bar.test"}
+    for _ in range(3):
+        validator.validate(dict(reversed(valid.items())))
+        with pytest.raises(ValidationError):
+            validator.validate(invalid)
+    assert (cache.hits, cache.misses) == (4, 2)
+    # entries are per validator
+    assert not MemoizedValidator(create_activity_validator(), cache).is_valid(invalid)
+    assert cache.misses == 3
+
+
+def test_validator_registry():
+    registry = ValidatorRegistry()
+    validator = registry.activity_validator(["Follow", "Undo"])
+    assert registry.activity_validator(["Undo", "Follow"]) is validator
+    assert registry.activity_validator(["Follow"]) is not validator
+    assert registry.validator("schema:actor") is registry.validator("schema:actor")
+    assert len(registry) == 3
+    assert not validator.built
+    assert validator.is_valid({"type": "Undo", "object": "https://server.test/"})
+    assert validator.built
+    assert not validator.is_valid({"type": "Accept", "object": "https://server.test/"})
+    registry.prepare()
+    assert registry.validator("schema:actor").built
+    # The modules' validators are shared
+    assert VALIDATORS.activity_validator() is MINCORE_ACTIVITY_VALIDATOR
+
+
+def test_check_schemas():
+    check_schemas(
+        retrieve_schema("schema:actor").contents,
+        referencing.Registry(retrieve=retrieve_schema).resolver(),
+    )
+    # Referenced schemas are checked too
+    broken = referencing.Resource.from_contents(
+        {"$schema": "https://json-schema.org/draft/2020-12/schema", "type": 12}
+    )
+    registry = referencing.Registry().with_resource("schema:broken", broken)
+    with pytest.raises(SchemaError):
+        check_schemas({"$ref": "schema:broken"}, registry.resolver())
+
+
+def test_schema_bundle(tmp_path: Path, monkeypatch):
+    bundle = build_schema_bundle()
+    assert set(bundle) == {"schema:activity", "schema:actor", "schema:object"}
+    path = tmp_path / "schemas.json"
+    path.write_bytes(dumps(bundle))
+    monkeypatch.setattr("activitypub_mincore.support.validation._schema_bundle", {})
+    load_schema_bundle(path)
+    resource = retrieve_schema("schema:activity")
+    assert resource.contents == bundle["schema:activity"]
+    assert resource is not schema_retriever("schema:activity")
+    validator = create_activity_validator(memoize=False)
+    assert validator.is_valid({"type": "Follow", "object": "https://server.test/"})
+
+
+def _records() -> bytes:
+    lines = []
+    for n in range(200):
+        activity = {"type": "Follow", "object": f"https://server.test/{n}"}
+        if n % 50 == 7:
+            activity["object"] = "@foo@bar.test"
+        lines.append(dumps(activity))
+    lines[100] = b"{not json"
+    lines[120] = b""
+    return b"\n".join(lines)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_validate_many(processes: int):
+    errors = list(
+        validate_many(io.BytesIO(_records()), processes=processes, chunk_size=256)
+    )
+    assert [error.line for error in errors] == [8, 58, 101, 108, 158]
+    assert errors[0].path == "$.object"
+    assert errors[2].message.startswith("Invalid JSON")
+    # Only the given types are valid
+    undo_errors = validate_many(io.BytesIO(_records()), types=["Undo"], processes=1)
+    assert len(list(undo_errors)) == 199
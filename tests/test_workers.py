@@ -0,0 +1,52 @@
+import asyncio
+
+from activitypub_mincore.support.workers import LeaderLock, run_elected
+
+
+def test_leader_lock_is_exclusive(tmp_path):
+    first = LeaderLock(tmp_path / "leader.lock")
+    second = LeaderLock(tmp_path / "leader.lock")
+    assert first.try_acquire()
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    first.release()
+    assert second.try_acquire()
+    assert second.held and not first.held
+    second.release()
+
+
+async def test_only_the_leader_runs(tmp_path):
+    ran: list[str] = []
+    stop = asyncio.Event()
+
+    async def work(name: str):
+        ran.append(name)
+        await stop.wait()
+
+    path = tmp_path / "leader.lock"
+    first = asyncio.create_task(run_elected(LeaderLock(path), work("a"), 0.01))
+    second = asyncio.create_task(run_elected(LeaderLock(path), work("b"), 0.01))
+    await asyncio.sleep(0.05)
+    assert ran == ["a"]
+    # the leader finishing hands over to the other candidate
+    stop.set()
+    await first
+    await second
+    assert ran == ["a", "b"]
+
+
+async def test_cancelled_candidate_does_not_run(tmp_path):
+    path = tmp_path / "leader.lock"
+    leader = LeaderLock(path)
+    leader.try_acquire()
+    ran = []
+
+    async def work():
+        ran.append(True)
+
+    candidate = asyncio.create_task(run_elected(LeaderLock(path), work(), 0.01))
+    await asyncio.sleep(0.03)
+    candidate.cancel()
+    await asyncio.gather(candidate, return_exceptions=True)
+    assert not ran
+    leader.release()